@@ -1,72 +1,310 @@
+import time
+# Time points of the start up, written out by --profile-startup. The CPU time used so far
+# is the interpreter starting and compiling this file, which happens before any line runs
+STARTUP_TIMES = [("script", time.perf_counter())]
+STARTUP_CPU_TIME = time.process_time()
 import sys
 import os
-import json
-import subprocess
+import re
+import argparse
+import codecs
+import locale
+import threading
+import stat
+import shutil
+import queue
+import mmap
+import bisect
+import itertools
+import operator
+import heapq
+import tokenize
+import io
+import math
+import contextlib
+from array import array
+from collections import deque, OrderedDict
+# Imported where they are used, most sessions start without needing any of them
+LAZY_MODULES = ("json", "hashlib", "ast", "tempfile", "multiprocessing", "concurrent.futures",
+                "asyncio", "ssl", "subprocess", "shlex", "PyQt5.QtPrintSupport")
+STARTUP_TIMES.append(("import standard library", time.perf_counter()))
 from PyQt5.QtCore import QRegExp
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QTextEdit, QMenuBar, QMenu, QAction, QFileDialog, QMessageBox,
+                             QTextEdit, QPlainTextEdit, QMenuBar, QMenu, QAction, QFileDialog, QMessageBox,
                              QLabel, QLineEdit, QPushButton, QTabWidget, QSplitter, QFrame,
                              QListWidget, QListWidgetItem, QToolBar, QStatusBar, QDialog,
-                             QFormLayout, QGroupBox, QComboBox, QCheckBox, QSpinBox)
-from PyQt5.QtCore import Qt, QSize, QSettings
-from PyQt5.QtGui import QFont, QIcon, QColor, QTextCharFormat, QSyntaxHighlighter, QTextDocument
-from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
+                             QFormLayout, QGroupBox, QComboBox, QCheckBox, QSpinBox, QDoubleSpinBox,
+                             QPlainTextDocumentLayout,
+                             QAbstractScrollArea, QAbstractSlider, QStackedWidget, QInputDialog,
+                             QProgressBar, QTreeView, QStyle, QDockWidget, QTreeWidget, QTreeWidgetItem,
+                             QCompleter, QToolTip)
+from PyQt5.QtCore import (Qt, QSize, QPoint, QSettings, QThread, QTimer, QObject, QStandardPaths, QLockFile,
+                          QAbstractItemModel, QModelIndex, QFileSystemWatcher, QEvent, QEventLoop, QStringListModel,
+                          QProcess, pyqtSignal, QT_VERSION_STR)
+from PyQt5.QtGui import (QFont, QIcon, QColor, QTextCharFormat, QSyntaxHighlighter, QTextDocument,
+                         QTextCursor, QPainter)
+STARTUP_TIMES.append(("import PyQt5", time.perf_counter()))
+
+# Records a start up phase as done, for --profile-startup
+def mark_startup(phase):
+    STARTUP_TIMES.append((phase, time.perf_counter()))
+
+# When set, settings, caches and journals live here instead of with the user's, see benchmark_suite
+ISOLATED_DIRECTORY = None
+
+# The settings store shared by the settings dialog and the editor
+def open_settings():
+    if ISOLATED_DIRECTORY is not None:
+        return QSettings(os.path.join(ISOLATED_DIRECTORY, "settings.ini"), QSettings.IniFormat)
+    return QSettings("Codepad", "Settings")
+
+# QStandardPaths.writableLocation, or a folder of ISOLATED_DIRECTORY
+def writable_location(location):
+    if ISOLATED_DIRECTORY is not None:
+        return os.path.join(ISOLATED_DIRECTORY, "data" if location == QStandardPaths.GenericDataLocation else "cache")
+    return QStandardPaths.writableLocation(location)
+
+# Durations in nanoseconds counted in log-linear buckets, four per power of two,
+# so any percentile is off by at most an eighth whatever the range
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * 256
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    
+    def add(self, duration):
+        bits = duration.bit_length()
+        self.counts[bits * 4 + ((duration >> (bits - 3)) & 3) if bits > 2 else duration] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+    
+    @staticmethod
+    def bucket_value(index):
+        # Middle of the bucket's range
+        if index < 12:
+            return index
+        shift = index // 4 - 3
+        return ((4 + index % 4) << shift) + (1 << shift) // 2
+    
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+    
+    def summary(self):
+        return {"count": self.count, "mean_ms": self.total / max(1, self.count) / 1e6,
+                "p50_ms": self.percentile(0.5) / 1e6, "p95_ms": self.percentile(0.95) / 1e6,
+                "p99_ms": self.percentile(0.99) / 1e6, "max_ms": self.max / 1e6}
+
+def format_duration(nanoseconds):
+    if nanoseconds < 1000000:
+        return f"{nanoseconds / 1000:.0f} \u00b5s"
+    if nanoseconds < 1000000000:
+        return f"{nanoseconds / 1000000:.1f} ms"
+    return f"{nanoseconds / 1000000000:.2f} s"
+
+# Opt-in timings of the hot paths: a histogram per operation plus the latest spans for a
+# Chrome trace. Switched off, instrumented code only pays for checking enabled
+class Instrumentation:
+    # Spans kept for the trace, about 10 MB at most
+    TRACE_EVENTS = 100000
+    # Spans are counted into the histograms in batches, which keeps record() cheap
+    FOLD_SIZE = 4096
+    
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.pending = []
+        self.events = deque(maxlen=self.TRACE_EVENTS)
+    
+    def record(self, name, start, end=None, trace=True):
+        # start and end are time.perf_counter_ns() values, recorded on the GUI thread
+        if not self.enabled:
+            return
+        span = (name, start, end or time.perf_counter_ns())
+        self.pending.append(span)
+        if trace:
+            self.events.append(span)
+        if len(self.pending) >= self.FOLD_SIZE:
+            self.fold()
+    
+    def fold(self):
+        pending, self.pending = self.pending, []
+        histograms = self.histograms
+        for name, start, end in pending:
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.add(end - start)
+    
+    def reset(self):
+        self.histograms = {}
+        self.pending = []
+        self.events.clear()
+    
+    def trace(self):
+        # Trace event format, loads in chrome://tracing and Perfetto
+        self.fold()
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": 1, "args": {"name": "GUI"}}]
+        events.extend({"name": name, "cat": "codepad", "ph": "X", "pid": pid, "tid": 1,
+                       "ts": start / 1000, "dur": (end - start) / 1000}
+                      for name, start, end in self.events)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {name: histogram.summary() for name, histogram in self.histograms.items()}}
+
+INSTRUMENTATION = Instrumentation()
+
+# Single-pass tokenizer shared by every highlighter instance
+class PythonTokenizer:
+    KEYWORDS = [
+        'and', 'as', 'assert', 'break', 'class', 'continue', 'def', 'del',
+        'elif', 'else', 'except', 'False', 'finally', 'for', 'from', 'global',
+        'if', 'import', 'in', 'is', 'lambda', 'None', 'nonlocal', 'not', 'or',
+        'pass', 'raise', 'return', 'True', 'try', 'while', 'with', 'yield'
+    ]
+    
+    # Block states carried from one line to the next
+    STATE_NORMAL = 0
+    STATE_TRIPLE_DOUBLE = 1
+    STATE_TRIPLE_SINGLE = 2
+    
+    TRIPLE_STATES = {'"""': STATE_TRIPLE_DOUBLE, "'''": STATE_TRIPLE_SINGLE}
+    
+    # Alternatives are tried left to right at each position, so the order
+    # here is the precedence: comments and strings swallow everything inside them
+    RULES = [
+        ('comment', r'#.*'),
+        ('triple', r'"""|' + "'''"),
+        ('string', r'"[^"\\]*(?:\\.[^"\\]*)*"' + '|' + r"'[^'\\]*(?:\\.[^'\\]*)*'"),
+        ('function', r'\b[A-Za-z0-9_]+(?=\()'),
+        ('keyword', r'\b(?:' + '|'.join(KEYWORDS) + r')\b'),
+        ('number', r'\b[0-9]+\b'),
+    ]
+    
+    def __init__(self):
+        self.pattern = re.compile('|'.join(f'(?P<{name}>{rule})' for name, rule in self.RULES))
+        # Closing delimiter of a triple-quoted string, skipping escaped characters
+        self.closers = {
+            self.STATE_TRIPLE_DOUBLE: re.compile(r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""'),
+            self.STATE_TRIPLE_SINGLE: re.compile(r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''"),
+        }
+    
+    def tokenize(self, text, state=STATE_NORMAL):
+        # Returns (start, length, kind) spans in document order and the state
+        # the line ends in, which is the start state of the next line
+        spans = []
+        position = 0
+        
+        if state in self.closers:
+            closing = self.closers[state].match(text)
+            if closing is None:
+                return [(0, len(text), 'string')] if text else [], state
+            spans.append((0, closing.end(), 'string'))
+            position = closing.end()
+        
+        search = self.pattern.search
+        while True:
+            match = search(text, position)
+            if match is None:
+                return spans, self.STATE_NORMAL
+            kind = match.lastgroup
+            start = match.start()
+            if kind == 'triple':
+                inner_state = self.TRIPLE_STATES[match.group()]
+                closing = self.closers[inner_state].match(text, match.end())
+                if closing is None:
+                    spans.append((start, len(text) - start, 'string'))
+                    return spans, inner_state
+                spans.append((start, closing.end() - start, 'string'))
+                position = closing.end()
+            else:
+                spans.append((start, match.end() - start, kind))
+                # Guard against zero-width matches so the scan always advances
+                position = max(match.end(), start + 1)
 
 # Syntax highlighter for Python code
 class PythonHighlighter(QSyntaxHighlighter):
+    # Compiled once and shared, documents only hold a reference
+    tokenizer = None
+    formats = None
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         
-        self.highlighting_rules = []
+        # Number of highlightBlock calls, used to verify incremental updates
+        self.highlighted_blocks = 0
         
+        if PythonHighlighter.tokenizer is None:
+            PythonHighlighter.tokenizer = PythonTokenizer()
+            PythonHighlighter.formats = self.create_formats()
+    
+    @staticmethod
+    def create_formats():
         # Keyword format
         keyword_format = QTextCharFormat()
         keyword_format.setForeground(QColor("#FFD700"))  # Yellow
         keyword_format.setFontWeight(QFont.Bold)
         
-        keywords = [
-            'and', 'as', 'assert', 'break', 'class', 'continue', 'def', 'del',
-            'elif', 'else', 'except', 'False', 'finally', 'for', 'from', 'global',
-            'if', 'import', 'in', 'is', 'lambda', 'None', 'nonlocal', 'not', 'or',
-            'pass', 'raise', 'return', 'True', 'try', 'while', 'with', 'yield'
-        ]
-        
-        for word in keywords:
-            pattern = r'\b' + word + r'\b'
-            self.highlighting_rules.append((pattern, keyword_format))
-        
         # String format
         string_format = QTextCharFormat()
         string_format.setForeground(QColor("#FF6B6B"))  # Light red
-        self.highlighting_rules.append((r'"[^"\\]*(\\.[^"\\]*)*"', string_format))
-        self.highlighting_rules.append((r"'[^'\\]*(\\.[^'\\]*)*'", string_format))
         
         # Comment format
         comment_format = QTextCharFormat()
         comment_format.setForeground(QColor("#AAAAAA"))  # Gray
-        self.highlighting_rules.append((r'#.*', comment_format))
         
         # Function format
         function_format = QTextCharFormat()
         function_format.setForeground(QColor("#FFA500"))  # Orange
         function_format.setFontWeight(QFont.Bold)
-        self.highlighting_rules.append((r'\b[A-Za-z0-9_]+(?=\()', function_format))
         
         # Number format
         number_format = QTextCharFormat()
         number_format.setForeground(QColor("#FFD700"))  # Yellow
-        self.highlighting_rules.append((r'\b[0-9]+\b', number_format))
+        
+        return {
+            'keyword': keyword_format,
+            'string': string_format,
+            'comment': comment_format,
+            'function': function_format,
+            'number': number_format,
+        }
     
     def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            expression = QRegExp(pattern)
-            index = expression.indexIn(text)
-            while index >= 0:
-                length = expression.matchedLength()
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
+        if INSTRUMENTATION.enabled:
+            start = time.perf_counter_ns()
+            self.highlight_block(text)
+            INSTRUMENTATION.record("highlightBlock", start)
+        else:
+            self.highlight_block(text)
+    
+    def highlight_block(self, text):
+        # QSyntaxHighlighter only moves on to the next block while the end
+        # state differs from the one stored last time, so an edit touches the
+        # edited lines plus whatever a newly opened or closed string spills into
+        self.highlighted_blocks += 1
+        start_state = max(self.previousBlockState(), PythonTokenizer.STATE_NORMAL)
         
-        self.setCurrentBlockState(0)
+        formats = self.formats
+        spans, end_state = self.tokenizer.tokenize(text, start_state)
+        for start, length, kind in spans:
+            self.setFormat(start, length, formats[kind])
+        self.setCurrentBlockState(end_state)
+
+# Linters run on save unless changed in the settings
+DEFAULT_LINT_COMMANDS = "{python} -m pyflakes {file}"
+# Not a dependency: the default commands are skipped quietly when it is not installed
+DEFAULT_LINTER_MODULE = "pyflakes"
 
 # Settings dialog
 class SettingsDialog(QDialog):
@@ -76,7 +314,7 @@ class SettingsDialog(QDialog):
         self.setModal(True)
         self.resize(500, 400)
         
-        self.settings = QSettings("Codepad", "Settings")
+        self.settings = open_settings()
         
         layout = QVBoxLayout()
         
@@ -93,8 +331,24 @@ class SettingsDialog(QDialog):
         api_layout.addRow("API Key:", self.api_key_edit)
         
         self.api_url_edit = QLineEdit()
+        self.api_url_edit.setPlaceholderText(AiClient.DEFAULT_URL)
         api_layout.addRow("API URL:", self.api_url_edit)
         
+        self.api_model_combo = QComboBox()
+        self.api_model_combo.setEditable(True)
+        self.api_model_combo.addItems(AiClient.MODELS)
+        api_layout.addRow("Model:", self.api_model_combo)
+        
+        self.api_temperature_spin = QDoubleSpinBox()
+        self.api_temperature_spin.setRange(0.0, 2.0)
+        self.api_temperature_spin.setSingleStep(0.1)
+        api_layout.addRow("Temperature:", self.api_temperature_spin)
+        
+        self.ai_cache_spin = QSpinBox()
+        self.ai_cache_spin.setRange(1, 4096)
+        self.ai_cache_spin.setSuffix(" MB")
+        api_layout.addRow("Keep Responses Up To:", self.ai_cache_spin)
+        
         api_group.setLayout(api_layout)
         layout.addWidget(api_group)
         
@@ -109,6 +363,10 @@ class SettingsDialog(QDialog):
         self.telegram_chat_id_edit = QLineEdit()
         telegram_layout.addRow("Chat ID:", self.telegram_chat_id_edit)
         
+        self.telegram_url_edit = QLineEdit()
+        self.telegram_url_edit.setPlaceholderText(TelegramQueue.DEFAULT_URL)
+        telegram_layout.addRow("Bot API URL:", self.telegram_url_edit)
+        
         telegram_group.setLayout(telegram_layout)
         layout.addWidget(telegram_group)
         
@@ -130,9 +388,46 @@ class SettingsDialog(QDialog):
         self.line_numbers_check.setChecked(True)
         editor_layout.addRow("", self.line_numbers_check)
         
+        self.large_file_spin = QSpinBox()
+        self.large_file_spin.setRange(1, 4096)
+        self.large_file_spin.setValue(64)
+        self.large_file_spin.setSuffix(" MB")
+        editor_layout.addRow("Large File Mode Above:", self.large_file_spin)
+        
+        self.document_cache_spin = QSpinBox()
+        self.document_cache_spin.setRange(16, 8192)
+        self.document_cache_spin.setValue(256)
+        self.document_cache_spin.setSuffix(" MB")
+        editor_layout.addRow("Keep Open Documents Up To:", self.document_cache_spin)
+        
+        self.fsync_combo = QComboBox()
+        self.fsync_combo.addItems(FileSaver.FSYNC_POLICIES)
+        editor_layout.addRow("Flush to Disk on Save:", self.fsync_combo)
+        
+        self.instrumentation_check = QCheckBox("Record Performance Timings")
+        editor_layout.addRow("", self.instrumentation_check)
+        
         editor_group.setLayout(editor_layout)
         layout.addWidget(editor_group)
         
+        # Linting
+        lint_group = QGroupBox("Linting")
+        lint_layout = QFormLayout()
+        
+        self.lint_check = QCheckBox("Lint Python Files on Save")
+        self.lint_check.setToolTip(f"The default linter needs {DEFAULT_LINTER_MODULE}: "
+                                   f"pip install {DEFAULT_LINTER_MODULE}")
+        lint_layout.addRow("", self.lint_check)
+        
+        self.lint_commands_edit = QPlainTextEdit()
+        self.lint_commands_edit.setMaximumHeight(60)
+        self.lint_commands_edit.setToolTip("One command per line, {file} is the saved file and {python} "
+                                           "this Python. Output lines like path:line:column: message are shown.")
+        lint_layout.addRow("Linters:", self.lint_commands_edit)
+        
+        lint_group.setLayout(lint_layout)
+        layout.addWidget(lint_group)
+        
         # Buttons
         button_layout = QHBoxLayout()
         self.save_button = QPushButton("Save")
@@ -154,198 +449,4060 @@ class SettingsDialog(QDialog):
         self.api_combo.setCurrentText(self.settings.value("api_provider", "OpenAI"))
         self.api_key_edit.setText(self.settings.value("api_key", ""))
         self.api_url_edit.setText(self.settings.value("api_url", ""))
+        self.api_model_combo.setCurrentText(self.settings.value("api_model", AiClient.MODELS[0]))
+        self.api_temperature_spin.setValue(self.settings.value("api_temperature", 0.2, type=float))
+        self.ai_cache_spin.setValue(int(self.settings.value("ai_cache_mb", 64)))
         self.telegram_token_edit.setText(self.settings.value("telegram_token", ""))
         self.telegram_chat_id_edit.setText(self.settings.value("telegram_chat_id", ""))
+        self.telegram_url_edit.setText(self.settings.value("telegram_api_url", ""))
         self.font_size_spin.setValue(int(self.settings.value("font_size", 12)))
         self.tab_width_spin.setValue(int(self.settings.value("tab_width", 4)))
         self.line_numbers_check.setChecked(self.settings.value("line_numbers", True, type=bool))
+        self.large_file_spin.setValue(int(self.settings.value("large_file_threshold_mb", 64)))
+        self.fsync_combo.setCurrentText(self.settings.value("fsync_policy", FileSaver.FSYNC_ALWAYS))
+        self.document_cache_spin.setValue(int(self.settings.value("document_cache_mb", 256)))
+        self.instrumentation_check.setChecked(self.settings.value("instrumentation", False, type=bool))
+        self.lint_check.setChecked(self.settings.value("lint_on_save", True, type=bool))
+        self.lint_commands_edit.setPlainText(self.settings.value("lint_commands", DEFAULT_LINT_COMMANDS))
     
     def save_settings(self):
         self.settings.setValue("api_provider", self.api_combo.currentText())
         self.settings.setValue("api_key", self.api_key_edit.text())
         self.settings.setValue("api_url", self.api_url_edit.text())
+        self.settings.setValue("api_model", self.api_model_combo.currentText())
+        self.settings.setValue("api_temperature", self.api_temperature_spin.value())
+        self.settings.setValue("ai_cache_mb", self.ai_cache_spin.value())
         self.settings.setValue("telegram_token", self.telegram_token_edit.text())
         self.settings.setValue("telegram_chat_id", self.telegram_chat_id_edit.text())
+        self.settings.setValue("telegram_api_url", self.telegram_url_edit.text())
         self.settings.setValue("font_size", self.font_size_spin.value())
         self.settings.setValue("tab_width", self.tab_width_spin.value())
         self.settings.setValue("line_numbers", self.line_numbers_check.isChecked())
+        self.settings.setValue("large_file_threshold_mb", self.large_file_spin.value())
+        self.settings.setValue("fsync_policy", self.fsync_combo.currentText())
+        self.settings.setValue("document_cache_mb", self.document_cache_spin.value())
+        self.settings.setValue("instrumentation", self.instrumentation_check.isChecked())
+        self.settings.setValue("lint_on_save", self.lint_check.isChecked())
+        self.settings.setValue("lint_commands", self.lint_commands_edit.toPlainText().strip())
         
         self.accept()
 
-# Main application window
-class CodeNotepad(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Accurate Code Pad")
-        self.setGeometry(100, 100, 1200, 800)
-        
-        # Apply red and yellow theme
-        self.apply_theme()
-        
-        # Initialize variables
-        self.current_file = None
-        self.file_list = []
+# What the first few KB of a file say about it: encoding, byte order mark, line
+# ending and whether it is text at all, known before anything is decoded
+class FileProbe:
+    SAMPLE_SIZE = 8 * 1024
+    # Longest first, the UTF-32 LE mark starts with the UTF-16 LE one
+    BOMS = ((codecs.BOM_UTF32_LE, 'utf-32-le'), (codecs.BOM_UTF32_BE, 'utf-32-be'), (codecs.BOM_UTF8, 'utf-8'),
+            (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be'))
+    # Bytes seen in text; a sample with more than MAX_CONTROL_RATIO of anything else is binary
+    TEXT_BYTES = bytes([7, 8, 9, 10, 12, 13, 27]) + bytes(range(0x20, 0x7F)) + bytes(range(0x80, 0x100))
+    MAX_CONTROL_RATIO = 0.1
+    # Tried in order when the sample is not UTF-8, latin-1 decodes anything
+    FALLBACK_ENCODINGS = ('cp1252', 'latin-1')
+    
+    def __init__(self, path):
+        self.path = path
+        self.encoding = 'utf-8'
+        self.bom = b''
+        self.newline = None
+        self.binary = False
+        with open(path, 'rb') as file:
+            sample = file.read(self.SAMPLE_SIZE)
+            self.size = os.fstat(file.fileno()).st_size
+        whole = len(sample) == self.size
         
-        # Setup UI
-        self.setup_ui()
+        for bom, encoding in self.BOMS:
+            if sample.startswith(bom):
+                self.encoding = encoding
+                self.bom = bom
+                break
+        else:
+            if b'\0' in sample:
+                self.encoding = self.utf16_without_bom(sample)
+                self.binary = self.encoding is None
+            elif len(sample.translate(None, self.TEXT_BYTES)) > self.MAX_CONTROL_RATIO * len(sample):
+                self.binary = True
+            else:
+                self.encoding = self.text_encoding(sample, whole)
+        if self.binary:
+            self.encoding = None
+            return
         
-        # Load settings
-        self.settings = QSettings("CodeNotepad", "Settings")
+        text = codecs.getincrementaldecoder(self.encoding)('replace').decode(sample[len(self.bom):], whole)
+        self.newline = FileLoader.detect_newline(text)
+    
+    @staticmethod
+    def utf16_without_bom(sample):
+        # Mostly ASCII UTF-16 has a zero in every other byte and none in between
+        half = len(sample) // 2
+        even = sample[0:half * 2:2].count(0)
+        odd = sample[1:half * 2:2].count(0)
+        if odd >= half * 0.9 and not even:
+            return 'utf-16-le'
+        if even >= half * 0.9 and not odd:
+            return 'utf-16-be'
+        return None
+    
+    @classmethod
+    def text_encoding(cls, sample, whole):
+        preferred = locale.getpreferredencoding(False)
+        for encoding in ('utf-8', preferred) + cls.FALLBACK_ENCODINGS:
+            try:
+                # A character cut off at the end of the sample is fine
+                codecs.getincrementaldecoder(encoding)().decode(sample, whole)
+            except (UnicodeDecodeError, LookupError):
+                continue
+            return codecs.lookup(encoding).name
+        return 'latin-1'
+    
+    @property
+    def errors(self):
+        # Bytes that do not decode come back unchanged on save, except in UTF-16 and UTF-32
+        # where there is no way to carry them
+        return 'replace' if self.encoding.startswith(('utf-16', 'utf-32')) else 'surrogateescape'
+    
+    @property
+    def stream_encoding(self):
+        # Codec that skips the byte order mark itself, for reading the file with open()
+        if not self.bom:
+            return self.encoding
+        return 'utf-8-sig' if self.encoding == 'utf-8' else self.encoding[:6]
+    
+    def description(self):
+        newline = {'\r\n': "CRLF", '\n': "LF", '\r': "CR"}.get(self.newline, "no line breaks")
+        return f"{self.encoding.upper()}{' with BOM' if self.bom else ''}, {newline}"
+
+# Reads and decodes a file on a worker thread, handing it over in chunks
+class FileLoader(QThread):
+    # The first chunk is small so the first screen shows up right away
+    FIRST_CHUNK_SIZE = 32 * 1024
+    CHUNK_SIZE = 64 * 1024
+    # Chunks decoded ahead of the GUI thread, bounds the memory held in flight
+    MAX_PENDING_CHUNKS = 16
+    
+    chunk_loaded = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # bytes read, total bytes
+    finished_loading = pyqtSignal()
+    failed = pyqtSignal(str)
+    
+    def __init__(self, path, probe=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.probe = probe or FileProbe(path)
+        self.encoding = self.probe.encoding
+        self.bom = self.probe.bom
+        self.pending = threading.Semaphore(self.MAX_PENDING_CHUNKS)
+        # Line ending found in the file, None until one has been seen
+        self.newline = self.probe.newline
+    
+    def cancel(self):
+        self.requestInterruption()
+        # Wake the worker up if it is waiting for the GUI to catch up
+        self.pending.release()
+    
+    def chunk_consumed(self):
+        self.pending.release()
+    
+    @staticmethod
+    def detect_newline(text):
+        index = text.find('\n')
+        if index > 0 and text[index - 1] == '\r':
+            return '\r\n'
+        if index >= 0:
+            return '\n'
+        return '\r' if '\r' in text else None
+    
+    def run(self):
+        try:
+            total = os.path.getsize(self.path)
+            decoder = codecs.getincrementaldecoder(self.encoding)(self.probe.errors)
+            carry = ''
+            read = len(self.bom)
+            size = self.FIRST_CHUNK_SIZE
+            with open(self.path, 'rb') as file:
+                file.seek(len(self.bom))
+                while not self.isInterruptionRequested():
+                    data = file.read(size)
+                    size = self.CHUNK_SIZE
+                    read += len(data)
+                    text = carry + decoder.decode(data, final=not data)
+                    # A CRLF pair may straddle two chunks
+                    carry = ''
+                    if data and text.endswith('\r'):
+                        text, carry = text[:-1], '\r'
+                    if self.newline is None:
+                        self.newline = self.detect_newline(text)
+                    text = text.replace('\r\n', '\n').replace('\r', '\n')
+                    
+                    if text:
+                        self.pending.acquire()
+                        if self.isInterruptionRequested():
+                            return
+                        self.chunk_loaded.emit(text)
+                    self.progress.emit(read, total)
+                    if not data:
+                        self.finished_loading.emit()
+                        return
+        except Exception as e:
+            self.failed.emit(str(e))
+
+# Writes a snapshot of the document to a temp file and renames it over the target
+class FileSaver(QThread):
+    # Settings values for the "fsync_policy" key
+    FSYNC_ALWAYS = "Always"      # file data and the directory entry
+    FSYNC_FILE = "File Only"     # file data, the rename may be lost on power failure
+    FSYNC_NEVER = "Never"        # leave it to the OS
+    FSYNC_POLICIES = [FSYNC_ALWAYS, FSYNC_FILE, FSYNC_NEVER]
+    
+    WRITE_SIZE = 1024 * 1024
+    
+    saved = pyqtSignal(str, int, float)  # path, bytes written, seconds
+    failed = pyqtSignal(str)
+    # The text has a character the file's encoding cannot hold: encoding, character, line
+    unencodable = pyqtSignal(str, str, int)
+    
+    def __init__(self, path, text, document=None, encoding='utf-8', newline='\n', fsync_policy=FSYNC_ALWAYS,
+                 bom=b'', parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.text = text
+        self.document = document
+        self.revision = document.revision() if document is not None else None
+        self.encoding = encoding
+        self.bom = bom
+        self.newline = newline
+        self.fsync_policy = fsync_policy
+    
+    def run(self):
+        start = time.perf_counter()
+        # Replace the file a symlink points at, not the link itself
+        target = os.path.realpath(self.path)
+        directory = os.path.dirname(target)
+        temp_path = None
+        try:
+            try:
+                original = os.stat(target)
+            except FileNotFoundError:
+                original = None
+            
+            text = self.text if self.newline == '\n' else self.text.replace('\n', self.newline)
+            # Undecodable bytes were loaded as lone surrogates, they are written back as they were
+            try:
+                data = self.bom + text.encode(self.encoding, 'surrogateescape')
+            except UnicodeEncodeError as e:
+                line = text.count(self.newline, 0, e.start) + 1
+                self.unencodable.emit(self.encoding, text[e.start], line)
+                return
+            
+            import tempfile
+            fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, 'wb') as file:
+                view = memoryview(data)
+                for offset in range(0, len(view), self.WRITE_SIZE):
+                    file.write(view[offset:offset + self.WRITE_SIZE])
+                file.flush()
+                if self.fsync_policy != self.FSYNC_NEVER:
+                    os.fsync(file.fileno())
+            
+            # mkstemp creates the file as 0600, give it the original's mode and owner back
+            if original is not None:
+                os.chmod(temp_path, stat.S_IMODE(original.st_mode))
+                if hasattr(os, 'chown'):
+                    try:
+                        os.chown(temp_path, original.st_uid, original.st_gid)
+                    except PermissionError:
+                        pass
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(temp_path, 0o666 & ~umask)
+            
+            os.replace(temp_path, target)
+            temp_path = None
+            
+            if self.fsync_policy == self.FSYNC_ALWAYS and hasattr(os, 'O_DIRECTORY'):
+                directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(directory_fd)
+                finally:
+                    os.close(directory_fd)
+            
+            self.saved.emit(self.path, len(data), time.perf_counter() - start)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+# Append-only log of document edits, replayed after a crash
+class EditJournal(QObject):
+    # Unwritten edits are flushed this long after the last change
+    FLUSH_DELAY_MS = 1000
+    # The log is rewritten as a snapshot once it outgrows the document by this much
+    COMPACT_MIN_BYTES = 1024 * 1024
+    COMPACT_RATIO = 2
+    
+    def __init__(self, directory, document, path=None, newline='\n', encoding='utf-8', bom=b'', parent=None):
+        super().__init__(parent)
+        self.journal_path = os.path.join(directory, f"{os.urandom(16).hex()}.journal")
+        self.document = document
+        self.path = path
+        self.newline = newline
+        self.encoding = encoding
+        self.bom = bom
+        self.pending = []
+        self.journal_size = 0
         
-        # Create syntax highlighter
-        self.highlighter = PythonHighlighter(self.editor.document())
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_DELAY_MS)
+        self.flush_timer.timeout.connect(self.flush)
         
-        # Update editor settings
-        self.update_editor_settings()
+        self.reset()
+        document.contentsChange.connect(self.on_contents_change)
     
-    def apply_theme(self):
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #2B2B2B;
-            }
-            QMenuBar {
-                background-color: #8B0000;
-                color: #FFD700;
-            }
-            QMenuBar::item:selected {
-                background-color: #FF0000;
-            }
-            QMenu {
-                background-color: #8B0000;
-                color: #FFD700;
-                border: 1px solid #FF0000;
-            }
-            QMenu::item:selected {
-                background-color: #FF0000;
-            }
-            QToolBar {
-                background-color: #8B0000;
-                border: none;
-            }
-            QToolButton {
-                background-color: #8B0000;
-                color: #FFD700;
-                border: none;
-                padding: 5px;
-            }
-            QToolButton:hover {
-                background-color: #FF0000;
-            }
-            QStatusBar {
-                background-color: #8B0000;
-                color: #FFD700;
-            }
-            QTextEdit {
-                background-color: #1E1E1E;
-                color: #FFFFFF;
-                selection-background-color: #FF6B6B;
-            }
-            QListWidget {
-                background-color: #1E1E1E;
-                color: #FFFFFF;
-                border: none;
-            }
-            QListWidget::item:selected {
-                background-color: #FF6B6B;
-                color: #000000;
-            }
-            QSplitter::handle {
-                background-color: #8B0000;
-            }
-            QDialog {
-                background-color: #2B2B2B;
-            }
-            QGroupBox {
-                color: #FFD700;
-                font-weight: bold;
-                border: 1px solid #FF6B6B;
-                border-radius: 5px;
-                margin-top: 1ex;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                subcontrol-position: top center;
-                padding: 0 5px;
-            }
-            QLabel {
-                color: #FFD700;
-            }
-            QLineEdit {
-                background-color: #1E1E1E;
-                color: #FFFFFF;
-                border: 1px solid #FF6B6B;
-                padding: 5px;
-            }
-            QPushButton {
-                background-color: #8B0000;
-                color: #FFD700;
-                border: none;
-                padding: 5px 10px;
-            }
-            QPushButton:hover {
-                background-color: #FF0000;
-            }
-            QComboBox {
-                background-color: #1E1E1E;
-                color: #FFFFFF;
-                border: 1px solid #FF6B6B;
-                padding: 5px;
-            }
-            QSpinBox {
-                background-color: #1E1E1E;
-                color: #FFFFFF;
-                border: 1px solid #FF6B6B;
-                padding: 5px;
-            }
-            QCheckBox {
-                color: #FFD700;
-            }
-            QTabWidget::pane {
-                border: 1px solid #FF6B6B;
-                background-color: #2B2B2B;
-            }
-            QTabBar::tab {
-                background-color: #8B0000;
-                color: #FFD700;
-                padding: 8px;
-                border-top-left-radius: 4px;
-                border-top-right-radius: 4px;
-            }
-            QTabBar::tab:selected {
-                background-color: #FF0000;
-            }
-        """)
+    @staticmethod
+    def journal_directory():
+        return os.path.join(writable_location(QStandardPaths.GenericDataLocation),
+                            "Codepad", "journal")
     
-    def setup_ui(self):
-        # Central widget
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
+    def on_contents_change(self, position, removed, added):
+        inserted = ''
+        if added:
+            # Qt counts the final paragraph separator in some edits, clamp to the real text
+            end = min(position + added, self.document.characterCount() - 1)
+            cursor = QTextCursor(self.document)
+            cursor.setPosition(position)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            inserted = cursor.selectedText().replace('\u2029', '\n')
         
-        # Main layout
-        main_layout = QHBoxLayout(central_widget)
+        last = self.pending[-1] if self.pending else None
+        if last is not None and not removed and not last['removed'] and \
+                last['pos'] + len(last['text']) == position:
+            # Consecutive typing becomes one record
+            last['text'] += inserted
+        else:
+            self.pending.append({'type': 'edit', 'pos': position, 'removed': removed, 'text': inserted})
+        self.pending[-1]['length'] = self.document.characterCount() - 1
+        self.flush_timer.start()
+    
+    def flush(self):
+        self.flush_timer.stop()
+        if not self.pending:
+            return
+        if not self.journal_size:
+            # No header yet, the snapshot already holds the pending edits
+            self.compact()
+            return
         
-        # Splitter for sidebar and editor
-        splitter = QSplitter(Qt.Horizontal)
+        import json
+        data = ''.join(json.dumps(entry) + '\n' for entry in self.pending).encode('utf-8')
+        self.pending.clear()
+        with open(self.journal_path, 'ab') as journal:
+            journal.write(data)
+        self.journal_size += len(data)
         
-        # Sidebar for file list
-        self.sidebar = QListWidget()
-        self.sidebar.setMaximumWidth(250)
-        self.sidebar.itemDoubleClicked.connect(self.open_file_from_list)
-        splitter.addWidget(self.sidebar)
+        if self.journal_size > max(self.COMPACT_MIN_BYTES, self.COMPACT_RATIO * self.document.characterCount()):
+            self.compact()
+    
+    def write_header(self, header):
+        # The header replaces the whole log, write it next to it and swap
+        import json
+        data = (json.dumps(header) + '\n').encode('utf-8')
+        with replacing_file(self.journal_path) as journal:
+            journal.write(data)
+        self.pending.clear()
+        self.journal_size = len(data)
+    
+    def reset(self, path=None, newline=None, encoding=None, bom=None):
+        # The document matches the file on disk again, start from that file
+        self.path = path or self.path
+        self.newline = newline or self.newline
+        self.encoding = encoding or self.encoding
+        self.bom = self.bom if bom is None else bom
+        if self.path is None:
+            # An empty untitled buffer has nothing to recover, its log is started by the first flush
+            if self.journal_size or not self.document.isEmpty():
+                self.compact()
+            return
         
-        # Editor area
-        editor_widget = QWidget()
-        editor_layout = QVBoxLayout(editor_widget)
+        file_stat = os.stat(self.path)
+        self.write_header({'type': 'base', 'path': self.path, 'newline': self.newline,
+                           'encoding': self.encoding, 'bom': self.bom.hex(),
+                           'mtime_ns': file_stat.st_mtime_ns, 'size': file_stat.st_size})
+    
+    def compact(self):
+        self.write_header({'type': 'snapshot', 'path': self.path, 'newline': self.newline,
+                           'encoding': self.encoding, 'bom': self.bom.hex(),
+                           'text': self.document.toPlainText()})
+    
+    def close(self, discard=True):
+        self.flush_timer.stop()
+        self.document.contentsChange.disconnect(self.on_contents_change)
+        if discard:
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+        else:
+            self.flush()
+    
+    @staticmethod
+    def replay(journal_path):
+        # Returns (path, text, newline, encoding, bom) of the buffer recorded in a journal
+        import json
+        document = QTextDocument()
+        cursor = QTextCursor(document)
+        with open(journal_path, 'r', encoding='utf-8') as journal:
+            header = json.loads(journal.readline())
+            path = header.get('path')
+            # Journals written before the encoding was recorded were read with the locale's
+            encoding = header.get('encoding') or locale.getpreferredencoding(False)
+            bom = bytes.fromhex(header.get('bom', ''))
+            if header['type'] == 'snapshot':
+                document.setPlainText(header['text'])
+            else:
+                file_stat = os.stat(path)
+                if (file_stat.st_mtime_ns, file_stat.st_size) != (header['mtime_ns'], header['size']):
+                    raise ValueError(f"{path} changed on disk since the journal was started")
+                # The same text the loader made of the file
+                with open(path, 'rb') as file:
+                    file.seek(len(bom))
+                    errors = 'replace' if encoding.startswith(('utf-16', 'utf-32')) else 'surrogateescape'
+                    text = file.read().decode(encoding, errors)
+                document.setPlainText(text.replace('\r\n', '\n').replace('\r', '\n'))
+            
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A record cut short by the crash, everything before it is intact
+                    break
+                length = document.characterCount() - 1
+                cursor.setPosition(min(entry['pos'], length))
+                cursor.setPosition(min(entry['pos'] + entry['removed'], length), QTextCursor.KeepAnchor)
+                cursor.insertText(entry['text'])
+                if document.characterCount() - 1 != entry['length']:
+                    raise ValueError(f"journal {journal_path} does not match its base text")
         
-        # Text editor
-        self.editor = QTextEdit()
-        editor_layout.addWidget(self.editor)
+        return path, document.toPlainText(), header.get('newline') or os.linesep, encoding, bom
+
+# Journals of one running instance, locked so other instances leave them alone
+class JournalSession:
+    def __init__(self):
+        root = EditJournal.journal_directory()
+        self.directory = os.path.join(root, os.urandom(16).hex())
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = QLockFile(os.path.join(self.directory, "session.lock"))
+        self.lock.tryLock(0)
+    
+    def create(self, document, path=None, newline='\n', encoding='utf-8', bom=b'', parent=None):
+        return EditJournal(self.directory, document, path, newline, encoding, bom, parent)
+    
+    def orphaned_sessions(self):
+        # Session directories whose owner is gone, i.e. crashed or killed
+        root = EditJournal.journal_directory()
+        for entry in os.scandir(root):
+            if not entry.is_dir() or entry.path == self.directory:
+                continue
+            lock = QLockFile(os.path.join(entry.path, "session.lock"))
+            if lock.tryLock(0):
+                yield entry.path, lock
+    
+    def recover(self):
+        # Replays every orphaned journal, newest first; returns (recovered, errors)
+        recovered = []
+        errors = []
+        for directory, lock in self.orphaned_sessions():
+            journals = [entry.path for entry in os.scandir(directory) if entry.name.endswith('.journal')]
+            journals.sort(key=os.path.getmtime, reverse=True)
+            for journal_path in journals:
+                try:
+                    recovered.append(EditJournal.replay(journal_path))
+                except Exception as e:
+                    errors.append(f"{os.path.basename(journal_path)}: {e}")
+            lock.unlock()
+            shutil.rmtree(directory, ignore_errors=True)
+        return recovered, errors
+    
+    def close(self):
+        self.lock.unlock()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+# Sparse line index over a memory-mapped file, built on a background thread
+class LineIndexer(QThread):
+    # Only every CHECKPOINT-th line start is stored, which keeps the index of
+    # a multi-GB file down to a few MB; the lines in between are found with find()
+    CHECKPOINT = 64
+    CHUNK_SIZE = 16 * 1024 * 1024
+    
+    progress = pyqtSignal(int)
+    
+    def __init__(self, mapped, parent=None):
+        super().__init__(parent)
+        self.mapped = mapped
+        self.checkpoints = array('q', [0])
+        self.line_count = 1
+        self.indexed_bytes = 0
+        self.complete = False
+    
+    def run(self):
+        mapped = self.mapped
+        size = len(mapped)
+        position = 0
         
-        splitter.addWidget(editor_widget)
+        while position < size and not self.isInterruptionRequested():
+            chunk = mapped[position:position + self.CHUNK_SIZE]
+            if position + len(chunk) < size:
+                # Keep whole lines in the chunk so no line start is split
+                cut = chunk.rfind(b'\n') + 1
+                if cut:
+                    chunk = chunk[:cut]
+            
+            parts = chunk.split(b'\n')
+            # Chunk-relative start of the line following each newline
+            starts = map(operator.add, itertools.accumulate(map(len, parts[:-1])), itertools.count(1))
+            first = (-self.line_count) % self.CHECKPOINT
+            self.checkpoints.extend(start + position
+                                    for start in itertools.islice(starts, first, None, self.CHECKPOINT))
+            
+            position += len(chunk)
+            self.line_count += len(parts) - 1
+            self.indexed_bytes = position
+            self.progress.emit(self.line_count)
+        
+        self.complete = position >= size
+        self.progress.emit(self.line_count)
+
+# Search a memory-mapped file without touching the GUI thread
+class LargeFileSearch(QThread):
+    found = pyqtSignal(int, int)  # byte offset, line number
+    not_found = pyqtSignal(str)
+    
+    def __init__(self, view, needle, start, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.needle = needle
+        self.start_offset = start
+    
+    def run(self):
+        mapped = self.view.mapped
+        offset = mapped.find(self.needle, self.start_offset)
+        if offset < 0 and self.start_offset > 0:
+            # Wrap around to the top of the file
+            offset = mapped.find(self.needle, 0, self.start_offset + len(self.needle))
+        if offset < 0:
+            self.not_found.emit(self.needle.decode('utf-8', 'replace'))
+            return
+        self.found.emit(offset, self.view.line_for_offset(offset))
+
+# Gutter beside the editor, painted by the editor
+class LineNumberArea(QWidget):
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+    
+    def sizeHint(self):
+        return QSize(self.editor.line_number_width(), 0)
+    
+    def paintEvent(self, event):
+        self.editor.paint_line_numbers(event)
+
+# Plain text editor with a line number gutter; block layout only lays out what is shown
+class CodeEditor(QPlainTextEdit):
+    GUTTER_BACKGROUND = QColor("#2B2B2B")
+    GUTTER_FOREGROUND = QColor("#AAAAAA")
+    GUTTER_CURRENT = QColor("#FFD700")
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.line_numbers_visible = True
+        # [(cursor over the marked text, message)] of the document shown, for tooltips
+        self.diagnostics = []
+        self.line_number_area = LineNumberArea(self)
+        self.gutter_digits = 0
+        
+        self.blockCountChanged.connect(self.update_line_number_width)
+        self.updateRequest.connect(self.update_line_number_area)
+        self.update_line_number_width()
+    
+    def set_line_numbers_visible(self, visible):
+        self.line_numbers_visible = visible
+        self.line_number_area.setVisible(visible)
+        self.update_line_number_width()
+    
+    def line_number_width(self):
+        if not self.line_numbers_visible:
+            return 0
+        return 12 + self.fontMetrics().horizontalAdvance('9') * max(3, len(str(self.blockCount())))
+    
+    def update_line_number_width(self, *args):
+        # The margin only changes when the number of digits does
+        digits = len(str(self.blockCount())) if self.line_numbers_visible else 0
+        if digits != self.gutter_digits:
+            self.gutter_digits = digits
+            self.setViewportMargins(self.line_number_width(), 0, 0, 0)
+            # The gutter follows the margin now, not at the next resize
+            self.update_line_number_geometry()
+    
+    def update_line_number_geometry(self):
+        rect = self.contentsRect()
+        self.line_number_area.setGeometry(rect.left(), rect.top(), self.line_number_width(), rect.height())
+    
+    def update_line_number_area(self, rect, dy):
+        if dy:
+            self.line_number_area.scroll(0, dy)
+        else:
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+    
+    def setDocument(self, document):
+        super().setDocument(document)
+        self.update_line_number_width()
+    
+    def viewportEvent(self, event):
+        if event.type() == QEvent.ToolTip and self.diagnostics:
+            position = self.cursorForPosition(event.pos()).position()
+            messages = [message for cursor, message in self.diagnostics
+                        if cursor.selectionStart() <= position <= cursor.selectionEnd()]
+            if messages:
+                QToolTip.showText(event.globalPos(), "\n".join(messages), self.viewport())
+            else:
+                QToolTip.hideText()
+            return True
+        return super().viewportEvent(event)
+    
+    def paintEvent(self, event):
+        # Lays out whatever blocks come into view, so this is layout time too
+        if INSTRUMENTATION.enabled:
+            start = time.perf_counter_ns()
+            super().paintEvent(event)
+            INSTRUMENTATION.record("paint", start)
+        else:
+            super().paintEvent(event)
+    
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            # Same digit count, wider digits
+            self.gutter_digits = 0
+            self.update_line_number_width()
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_line_number_geometry()
+    
+    def paint_line_numbers(self, event):
+        painter = QPainter(self.line_number_area)
+        rect = event.rect()
+        painter.fillRect(rect, self.GUTTER_BACKGROUND)
+        painter.setPen(self.GUTTER_FOREGROUND)
+        metrics = self.fontMetrics()
+        ascent = metrics.ascent()
+        right = self.line_number_area.width() - 6
+        current = self.textCursor().blockNumber()
+        
+        # Only the blocks inside the repainted rectangle, never the whole document
+        block = self.firstVisibleBlock()
+        number = block.blockNumber()
+        top = round(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
+        while block.isValid() and top <= rect.bottom():
+            bottom = top + round(self.blockBoundingRect(block).height())
+            if bottom >= rect.top() and block.isVisible():
+                label = str(number + 1)
+                if number == current:
+                    painter.setPen(self.GUTTER_CURRENT)
+                painter.drawText(right - metrics.horizontalAdvance(label), top + ascent, label)
+                if number == current:
+                    painter.setPen(self.GUTTER_FOREGROUND)
+            block = block.next()
+            number += 1
+            top = bottom
+
+# Export: a source generator yields (piece, line break follows) with lines longer than
+# EXPORT_PIECE_SIZE in several pieces, a format generator turns that into output text
+EXPORT_PIECE_SIZE = 64 * 1024
+
+def document_pieces(document):
+    block = document.begin()
+    while block.isValid():
+        text = block.text()
+        following = block.next()
+        for offset in range(0, len(text), EXPORT_PIECE_SIZE):
+            yield text[offset:offset + EXPORT_PIECE_SIZE], False
+        yield '', following.isValid()
+        block = following
+
+def file_pieces(file):
+    # file is a text file opened with universal newlines
+    line_break = False
+    while piece := file.readline(EXPORT_PIECE_SIZE):
+        line_break = piece.endswith('\n')
+        yield (piece[:-1] if line_break else piece), line_break
+    if line_break:
+        # Same lines as the editor shows: text ending in a newline has an empty last line
+        yield '', False
+
+def export_text(pieces, title, newline):
+    for piece, line_break in pieces:
+        yield piece + newline if line_break else piece
+
+def export_json(pieces, title, newline):
+    import json
+    yield '{"title": ' + json.dumps(title) + ', "lines": [\n"'
+    for piece, line_break in pieces:
+        # The quotes around each line are written separately, a line can come in several pieces
+        yield json.dumps(piece)[1:-1] + ('",\n"' if line_break else '')
+    yield '"\n]}\n'
+
+def export_csv(pieces, title, newline):
+    # RFC 4180 with every text field quoted
+    number = 1
+    yield 'line,text\r\n1,"'
+    for piece, line_break in pieces:
+        piece = piece.replace('"', '""')
+        if line_break:
+            number += 1
+            piece += f'"\r\n{number},"'
+        yield piece
+    yield '"\r\n'
+
+def export_html(pieces, title, newline):
+    # Same tokenizer and colors as the editor's highlighter, one span per token
+    from html import escape
+    if PythonHighlighter.tokenizer is None:
+        PythonHighlighter.tokenizer = PythonTokenizer()
+        PythonHighlighter.formats = PythonHighlighter.create_formats()
+    tokenizer = PythonHighlighter.tokenizer
+    styles = []
+    for kind, text_format in PythonHighlighter.formats.items():
+        weight = "font-weight: bold; " if text_format.fontWeight() >= QFont.Bold else ""
+        styles.append(f".{kind} {{ color: {text_format.foreground().color().name()}; {weight}}}")
+    yield (f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{escape(title)}</title>\n'
+           f'<style>\nbody {{ background-color: #1E1E1E; color: #FFFFFF; }}\npre {{ font-family: monospace; tab-size: 4; }}\n'
+           + '\n'.join(styles) + '\n</style>\n</head>\n<body>\n<pre>')
+    
+    state = PythonTokenizer.STATE_NORMAL
+    for piece, line_break in pieces:
+        spans, end_state = tokenizer.tokenize(piece, state)
+        parts = []
+        position = 0
+        for start, length, kind in spans:
+            parts.append(escape(piece[position:start], False))
+            parts.append(f'<span class="{kind}">{escape(piece[start:start + length], False)}</span>')
+            position = start + length
+        parts.append(escape(piece[position:], False))
+        if line_break:
+            parts.append('\n')
+        # A long line's next piece goes on in the state this one ended in
+        state = end_state
+        yield ''.join(parts)
+    yield '</pre>\n</body>\n</html>\n'
+
+# Format name: (file dialog filter, extension, format generator)
+EXPORT_FORMATS = {
+    "Text": ("Text Files (*.txt)", ".txt", export_text),
+    "JSON": ("JSON Files (*.json)", ".json", export_json),
+    "CSV": ("CSV Files (*.csv)", ".csv", export_csv),
+    "HTML": ("HTML Files (*.html)", ".html", export_html),
+}
+
+# A uniquely named temp file next to an export target, never one that already exists,
+# so two exports to the same target cannot write into each other. Returns (file, temp path)
+def open_export_temp(path):
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    # mkstemp creates the file as 0600, an export gets the mode of any new file
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp_path, 0o666 & ~umask)
+    # Bytes the document kept undecoded have no place in UTF-8 output
+    return os.fdopen(fd, 'w', encoding='utf-8', errors='replace', newline=''), temp_path
+
+def discard_export_temp(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+# Writes a file through a uniquely named temp file next to it, renamed over it when the block
+# ends: a reader never sees half a file, and two writers never share a temp file. After an
+# error the temp file is removed and the file is left as it was
+@contextlib.contextmanager
+def replacing_file(path, mode='wb', encoding=None):
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as file:
+            yield file
+        os.replace(temp_path, path)
+    except BaseException:
+        discard_export_temp(temp_path)
+        raise
+
+# Exports a document in the editor, a bounded slice per event loop pass: documents are not
+# safe to read from another thread. Writes to a temp file renamed over the target at the end
+class DocumentExport(QObject):
+    TIME_BUDGET = 0.03
+    
+    progress = pyqtSignal(int)  # percent
+    export_finished = pyqtSignal(str)  # error, empty on success
+    
+    def __init__(self, document, path, format_name, title, newline, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.path = path
+        self.temp_path = None
+        self.revision = document.revision()
+        self.block_count = document.blockCount()
+        self.blocks_done = 0
+        self.output = None
+        self.stopped = False
+        self.chunks = EXPORT_FORMATS[format_name][2](self.counted(document_pieces(document)), title, newline)
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.write_some)
+    
+    def counted(self, pieces):
+        for piece, line_break in pieces:
+            yield piece, line_break
+            if line_break:
+                self.blocks_done += 1
+    
+    def start(self):
+        try:
+            self.output, self.temp_path = open_export_temp(self.path)
+        except OSError as e:
+            self.export_finished.emit(str(e))
+            return
+        self.timer.start()
+    
+    def stop(self):
+        self.stopped = True
+        self.finish("stopped")
+    
+    def write_some(self):
+        deadline = time.perf_counter() + self.TIME_BUDGET
+        try:
+            if self.document.revision() != self.revision:
+                raise ValueError("the document changed during the export")
+            for chunk in self.chunks:
+                self.output.write(chunk)
+                if time.perf_counter() >= deadline:
+                    self.progress.emit(self.blocks_done * 100 // self.block_count)
+                    return
+        except RuntimeError:
+            # The document was closed
+            self.finish("the document was closed during the export")
+            return
+        except (OSError, ValueError) as e:
+            self.finish(str(e))
+            return
+        self.finish("")
+    
+    def finish(self, error):
+        self.timer.stop()
+        if self.output is None:
+            return
+        try:
+            self.output.close()
+            if not error:
+                os.replace(self.temp_path, self.path)
+        except OSError as e:
+            error = error or str(e)
+        if error:
+            discard_export_temp(self.temp_path)
+        self.output = None
+        self.export_finished.emit(error)
+
+# Exports a file straight from disk on a worker thread, for files in large file mode
+class FileExport(QThread):
+    PROGRESS_BYTES = 4 * 1024 * 1024
+    
+    progress = pyqtSignal(int)  # percent
+    export_finished = pyqtSignal(str)  # error, empty on success
+    
+    def __init__(self, source, encoding, path, format_name, title, newline, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.encoding = encoding
+        self.path = path
+        self.format_name = format_name
+        self.title = title
+        self.newline = newline
+        self.stopped = False
+    
+    def stop(self):
+        self.stopped = True
+        self.requestInterruption()
+    
+    def run(self):
+        temp_path = None
+        error = ""
+        try:
+            size = max(1, os.path.getsize(self.source))
+            with open(self.source, 'r', encoding=self.encoding, errors='replace') as source:
+                output, temp_path = open_export_temp(self.path)
+                with output:
+                    chunks = EXPORT_FORMATS[self.format_name][2](file_pieces(source), self.title, self.newline)
+                    reported = 0
+                    for chunk in chunks:
+                        output.write(chunk)
+                        position = source.buffer.tell()
+                        if position - reported >= self.PROGRESS_BYTES:
+                            if self.isInterruptionRequested():
+                                error = "stopped"
+                                break
+                            reported = position
+                            self.progress.emit(position * 100 // size)
+            if not error:
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            error = str(e)
+        if error and temp_path is not None:
+            discard_export_temp(temp_path)
+        self.export_finished.emit(error)
+
+# Headless batch mode: runs in the worker processes, so it must stay a plain module level function
+def batch_process_files(files, action, format_name, newline):
+    # [(source, output)] -> [(source, output, lines, bytes, seconds, error)]
+    if PythonHighlighter.tokenizer is None:
+        PythonHighlighter.tokenizer = PythonTokenizer()
+        PythonHighlighter.formats = PythonHighlighter.create_formats()
+    tokenizer = PythonHighlighter.tokenizer
+    results = []
+    for source, output in files:
+        start = time.perf_counter()
+        lines = 1
+        size = 0
+        error = ""
+        try:
+            size = os.path.getsize(source)
+            probe = FileProbe(source)
+            if probe.binary:
+                raise ValueError("binary file")
+            with open(source, 'r', encoding=probe.stream_encoding, errors='replace') as file:
+                if action == "highlight":
+                    state = PythonTokenizer.STATE_NORMAL
+                    for piece, line_break in file_pieces(file):
+                        _, state = tokenizer.tokenize(piece, state)
+                        lines += line_break
+                else:
+                    def counted(pieces):
+                        nonlocal lines
+                        for piece, line_break in pieces:
+                            lines += line_break
+                            yield piece, line_break
+                    directory = os.path.dirname(output)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    target, temp_path = open_export_temp(output)
+                    try:
+                        with target:
+                            for chunk in EXPORT_FORMATS[format_name][2](counted(file_pieces(file)),
+                                                                        os.path.basename(source), newline):
+                                target.write(chunk)
+                        os.replace(temp_path, output)
+                    except (OSError, ValueError):
+                        discard_export_temp(temp_path)
+                        raise
+        except (OSError, ValueError) as e:
+            error = str(e)
+        results.append((source, output, lines, size, time.perf_counter() - start, error))
+    return results
+
+# Read-only view that only decodes the lines currently on screen
+class LargeFileView(QAbstractScrollArea):
+    # Lines longer than this are cut off for display, the file itself is untouched
+    MAX_LINE_BYTES = 16 * 1024
+    # Bytes per row in hex view, rows are found by arithmetic and need no index
+    HEX_ROW_BYTES = 16
+    
+    line_count_changed = pyqtSignal(int)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.file = None
+        self.mapped = None
+        self.indexer = None
+        self.search = None
+        self.path = None
+        self.highlighted_line = -1
+        self.encoding = 'utf-8'
+        self.bom = b''
+        self.hex_view = False
+        
+        self.viewport().setStyleSheet("background-color: #1E1E1E;")
+        self.setFocusPolicy(Qt.StrongFocus)
+    
+    def open(self, path, encoding='utf-8', bom=b'', hex_view=False):
+        self.close_file()
+        self.file = open(path, 'rb')
+        self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.highlighted_line = -1
+        # Searches in hex view match the bytes as typed
+        self.encoding = 'latin-1' if hex_view else encoding
+        self.bom = bom
+        self.hex_view = hex_view
+        
+        if not hex_view:
+            self.indexer = LineIndexer(self.mapped, self)
+            self.indexer.progress.connect(self.on_index_progress)
+            self.indexer.start()
+        
+        self.verticalScrollBar().setValue(0)
+        self.horizontalScrollBar().setValue(0)
+        self.update_scrollbars()
+        self.viewport().update()
+    
+    def close_file(self):
+        for thread in (self.search, self.indexer):
+            if thread is not None:
+                thread.requestInterruption()
+                thread.wait()
+        self.search = None
+        self.indexer = None
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.path = None
+    
+    def line_count(self):
+        if self.hex_view and self.mapped is not None:
+            return -(-len(self.mapped) // self.HEX_ROW_BYTES)
+        return self.indexer.line_count if self.indexer else 0
+    
+    def is_indexed(self):
+        return self.hex_view or self.indexer is not None and self.indexer.complete
+    
+    def line_offset(self, line):
+        # Byte offset of a 0-based line, or -1 if it has not been indexed yet
+        if self.hex_view:
+            return line * self.HEX_ROW_BYTES if 0 <= line < self.line_count() else -1
+        if self.indexer is None or line >= self.indexer.line_count:
+            return -1
+        checkpoint, remainder = divmod(line, LineIndexer.CHECKPOINT)
+        offset = self.indexer.checkpoints[checkpoint]
+        for _ in range(remainder):
+            offset = self.mapped.find(b'\n', offset) + 1
+        return offset
+    
+    def line_for_offset(self, offset):
+        if self.hex_view:
+            return offset // self.HEX_ROW_BYTES
+        checkpoints = self.indexer.checkpoints
+        checkpoint = bisect.bisect_right(checkpoints, offset) - 1
+        line = checkpoint * LineIndexer.CHECKPOINT
+        position = checkpoints[checkpoint]
+        # Only more than CHECKPOINT lines away while indexing is still running
+        while position < offset:
+            end = min(offset, position + LineIndexer.CHUNK_SIZE)
+            line += self.mapped[position:end].count(b'\n')
+            position = end
+        return line
+    
+    def line_text(self, line):
+        start = self.line_offset(line)
+        if start < 0:
+            return None
+        if self.hex_view:
+            data = self.mapped[start:start + self.HEX_ROW_BYTES]
+            printable = ''.join(chr(byte) if 0x20 <= byte < 0x7F else '.' for byte in data)
+            return f"{start:08X}  {data.hex(' '):<{self.HEX_ROW_BYTES * 3}} |{printable}|"
+        if start == 0:
+            start = len(self.bom)
+        end = self.mapped.find(b'\n', start, start + self.MAX_LINE_BYTES)
+        if end < 0:
+            end = min(len(self.mapped), start + self.MAX_LINE_BYTES)
+        data = self.mapped[start:end]
+        if data.endswith(b'\r'):
+            data = data[:-1]
+        return data.decode(self.encoding, 'replace').expandtabs(4)
+    
+    def visible_rows(self):
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing())
+    
+    def gutter_width(self):
+        if self.hex_view:
+            # Rows start with their own offset
+            return 0
+        return self.fontMetrics().horizontalAdvance('9' * (len(str(self.line_count())) + 1))
+    
+    def update_scrollbars(self):
+        rows = self.visible_rows()
+        self.verticalScrollBar().setPageStep(rows)
+        self.verticalScrollBar().setRange(0, max(0, self.line_count() - rows))
+        self.horizontalScrollBar().setPageStep(self.viewport().width())
+        self.horizontalScrollBar().setRange(0, self.fontMetrics().horizontalAdvance('x') * 512)
+    
+    def on_index_progress(self, line_count):
+        self.update_scrollbars()
+        self.viewport().update()
+        self.line_count_changed.emit(line_count)
+    
+    def go_to_line(self, line):
+        # 0-based; returns False while the line is beyond the indexed part
+        if self.line_offset(line) < 0:
+            return False
+        self.highlighted_line = line
+        self.verticalScrollBar().setValue(max(0, line - self.visible_rows() // 2))
+        self.viewport().update()
+        return True
+    
+    def find(self, text):
+        if self.mapped is None or not text:
+            return None
+        if self.search is not None and self.search.isRunning():
+            return self.search
+        start = 0
+        if self.highlighted_line >= 0:
+            start = self.line_offset(self.highlighted_line + 1)
+            start = max(start, 0)
+        self.search = LargeFileSearch(self, text.encode(self.encoding, 'replace'), start, self)
+        self.search.found.connect(lambda offset, line: self.go_to_line(line))
+        self.search.start()
+        return self.search
+    
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        line_height = metrics.lineSpacing()
+        gutter = self.gutter_width()
+        first = self.verticalScrollBar().value()
+        x_offset = self.horizontalScrollBar().value()
+        
+        painter.fillRect(self.viewport().rect(), QColor("#1E1E1E"))
+        if self.mapped is None:
+            return
+        
+        for row in range(self.visible_rows() + 1):
+            line = first + row
+            text = self.line_text(line)
+            if text is None:
+                break
+            top = row * line_height
+            if line == self.highlighted_line:
+                painter.fillRect(0, top, self.viewport().width(), line_height, QColor("#5A1E1E"))
+            painter.setPen(QColor("#FFFFFF"))
+            painter.drawText(gutter + 8 - x_offset, top + metrics.ascent(), text)
+            if not gutter:
+                continue
+            painter.fillRect(0, top, gutter, line_height, QColor("#2B2B2B"))
+            painter.setPen(QColor("#AAAAAA"))
+            painter.drawText(0, top, gutter - 4, line_height, Qt.AlignRight, str(line + 1))
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scrollbars()
+    
+    def keyPressEvent(self, event):
+        actions = {
+            Qt.Key_Up: QAbstractSlider.SliderSingleStepSub,
+            Qt.Key_Down: QAbstractSlider.SliderSingleStepAdd,
+            Qt.Key_PageUp: QAbstractSlider.SliderPageStepSub,
+            Qt.Key_PageDown: QAbstractSlider.SliderPageStepAdd,
+            Qt.Key_Home: QAbstractSlider.SliderToMinimum,
+            Qt.Key_End: QAbstractSlider.SliderToMaximum,
+        }
+        if event.key() in actions:
+            self.verticalScrollBar().triggerAction(actions[event.key()])
+        else:
+            super().keyPressEvent(event)
+
+# .gitignore-style ignore rules for one directory, inherited by its subdirectories
+class IgnoreRules:
+    # Applied at the workspace root before any .gitignore
+    DEFAULT_PATTERNS = ['.git/', '__pycache__/', '*.py[cod]']
+    
+    def __init__(self, parent=None, base='', patterns=()):
+        # Rules are (regex, negated, directory_only, anchored, base) and the last match wins
+        self.rules = list(parent.rules) if parent is not None else []
+        for pattern in patterns:
+            rule = self.compile(pattern, base)
+            if rule is not None:
+                self.rules.append(rule)
+    
+    @classmethod
+    def from_directory(cls, parent, base, directory):
+        try:
+            with open(os.path.join(directory, '.gitignore'), 'r', encoding='utf-8', errors='replace') as file:
+                patterns = file.read().splitlines()
+        except OSError:
+            return parent
+        return cls(parent, base, patterns)
+    
+    @staticmethod
+    def compile(pattern, base):
+        pattern = pattern.rstrip()
+        if not pattern or pattern.startswith('#'):
+            return None
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        directory_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        # A slash anywhere but the end ties the pattern to the .gitignore's directory
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        if not pattern:
+            return None
+        
+        regex = []
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            if pattern.startswith('**/', index):
+                regex.append('(?:.*/)?')
+                index += 3
+                continue
+            if pattern.startswith('**', index):
+                regex.append('.*')
+                index += 2
+                continue
+            if char == '*':
+                regex.append('[^/]*')
+            elif char == '?':
+                regex.append('[^/]')
+            elif char == '[':
+                end = pattern.find(']', index + 1)
+                if end < 0:
+                    regex.append(re.escape(char))
+                else:
+                    regex.append('[' + pattern[index + 1:end].replace('!', '^', 1) + ']')
+                    index = end
+            else:
+                regex.append(re.escape(char))
+            index += 1
+        return re.compile(''.join(regex)), negated, directory_only, anchored, base
+    
+    def is_ignored(self, relative_path, name, is_dir):
+        ignored = False
+        for regex, negated, directory_only, anchored, base in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if anchored:
+                if base:
+                    if not relative_path.startswith(base + '/'):
+                        continue
+                    subject = relative_path[len(base) + 1:]
+                else:
+                    subject = relative_path
+            else:
+                subject = name
+            if regex.fullmatch(subject):
+                ignored = not negated
+        return ignored
+
+# Enumerates a workspace with os.scandir on a worker thread
+class WorkspaceScanner(QThread):
+    # Listings are handed over in batches to keep the number of signals down
+    BATCH_INTERVAL = 0.05
+    
+    # [(relative directory, [subdirectory names], [file names]) or (relative directory, None, None) if gone]
+    scanned = pyqtSignal(list)
+    scan_finished = pyqtSignal(int, float)  # files found, seconds
+    
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.tasks = queue.Queue()
+        self.rules = {}
+        # relative directory -> names of its subdirectories at the last listing
+        self.subdirectories = {}
+        self.tasks.put(('', True))
+    
+    def rescan(self, relative_directory):
+        # Re-list one directory, descending only into subdirectories not seen before
+        self.tasks.put((relative_directory, False))
+    
+    def stop(self):
+        self.requestInterruption()
+        self.tasks.put(None)
+    
+    def absolute(self, relative_path):
+        return os.path.join(self.root, *relative_path.split('/')) if relative_path else self.root
+    
+    def rules_for(self, relative_directory):
+        if relative_directory not in self.rules:
+            parent = relative_directory.rpartition('/')[0]
+            if relative_directory:
+                parent_rules = self.rules_for(parent)
+            else:
+                parent_rules = IgnoreRules(patterns=IgnoreRules.DEFAULT_PATTERNS)
+            self.rules[relative_directory] = IgnoreRules.from_directory(
+                parent_rules, relative_directory, self.absolute(relative_directory))
+        return self.rules[relative_directory]
+    
+    def list_directory(self, relative_directory):
+        rules = self.rules_for(relative_directory)
+        prefix = relative_directory + '/' if relative_directory else ''
+        directories = []
+        files = []
+        with os.scandir(self.absolute(relative_directory)) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if rules.is_ignored(prefix + entry.name, entry.name, is_dir):
+                    continue
+                (directories if is_dir else files).append(entry.name)
+        directories.sort(key=str.lower)
+        files.sort(key=str.lower)
+        return directories, files
+    
+    def run(self):
+        batch = []
+        last_emit = time.perf_counter()
+        file_count = 0
+        start = time.perf_counter()
+        
+        while not self.isInterruptionRequested():
+            try:
+                task = self.tasks.get(timeout=self.BATCH_INTERVAL if batch else None)
+            except queue.Empty:
+                task = False
+            if task is None:
+                break
+            
+            if task:
+                # Depth-first with an explicit stack, deep trees never hit the recursion limit
+                stack = [task]
+                while stack and not self.isInterruptionRequested():
+                    relative_directory, recursive = stack.pop()
+                    if not recursive:
+                        # Pick up an edited .gitignore
+                        self.rules.pop(relative_directory, None)
+                    try:
+                        directories, files = self.list_directory(relative_directory)
+                    except OSError:
+                        self.rules.pop(relative_directory, None)
+                        self.subdirectories.pop(relative_directory, None)
+                        batch.append((relative_directory, None, None))
+                        continue
+                    
+                    prefix = relative_directory + '/' if relative_directory else ''
+                    for gone in self.subdirectories.get(relative_directory, set()).difference(directories):
+                        self.subdirectories.pop(prefix + gone, None)
+                    self.subdirectories[relative_directory] = set(directories)
+                    for name in reversed(directories):
+                        child = prefix + name
+                        if recursive or child not in self.subdirectories:
+                            stack.append((child, True))
+                    file_count += len(files)
+                    batch.append((relative_directory, directories, files))
+                    
+                    if time.perf_counter() - last_emit >= self.BATCH_INTERVAL:
+                        self.scanned.emit(batch)
+                        batch = []
+                        last_emit = time.perf_counter()
+                
+                if task == ('', True):
+                    if batch:
+                        self.scanned.emit(batch)
+                        batch = []
+                    self.scan_finished.emit(file_count, time.perf_counter() - start)
+            
+            if batch:
+                self.scanned.emit(batch)
+                batch = []
+                last_emit = time.perf_counter()
+
+# Tree node of the workspace model, created only once its parent is expanded
+class WorkspaceNode:
+    __slots__ = ('name', 'parent', 'is_dir', 'children', 'path')
+    
+    def __init__(self, name, parent, is_dir):
+        self.name = name
+        self.parent = parent
+        self.is_dir = is_dir
+        # None until the view asks for the children
+        self.children = None
+        if parent is None or not parent.path:
+            self.path = name
+        else:
+            self.path = parent.path + '/' + name
+    
+    def sort_key(self):
+        return (not self.is_dir, self.name.lower())
+
+# Lazy tree model over the listings produced by WorkspaceScanner
+class WorkspaceModel(QAbstractItemModel):
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root_path = root
+        self.root = WorkspaceNode('', None, True)
+        # relative directory -> (subdirectory names, file names)
+        self.listings = {}
+        style = QApplication.style()
+        self.folder_icon = style.standardIcon(QStyle.SP_DirIcon)
+        self.file_icon = style.standardIcon(QStyle.SP_FileIcon)
+    
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+    
+    def index_for(self, node):
+        if node is self.root or node.parent is None:
+            return QModelIndex()
+        return self.createIndex(node.parent.children.index(node), 0, node)
+    
+    def find_node(self, relative_directory):
+        # The node of an already expanded directory, or None
+        node = self.root
+        if not relative_directory:
+            return node
+        for name in relative_directory.split('/'):
+            if node.children is None:
+                return None
+            node = next((child for child in node.children if child.name == name and child.is_dir), None)
+            if node is None:
+                return None
+        return node
+    
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.children is None or not 0 <= row < len(node.children) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+    
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_for(index.internalPointer().parent)
+    
+    def rowCount(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return len(node.children) if node.children is not None else 0
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+    
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.children is not None:
+            return bool(node.children)
+        return node.is_dir
+    
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return node.is_dir and node.children is None and node.path in self.listings
+    
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        directories, files = self.listings[node.path]
+        children = [WorkspaceNode(name, node, True) for name in directories]
+        children.extend(WorkspaceNode(name, node, False) for name in files)
+        if not children:
+            node.children = []
+            return
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        node.children = children
+        self.endInsertRows()
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return node.name
+        if role == Qt.DecorationRole:
+            return self.folder_icon if node.is_dir else self.file_icon
+        if role == Qt.ToolTipRole:
+            return node.path
+        return None
+    
+    def absolute_path(self, index):
+        node = self.node(index)
+        return os.path.join(self.root_path, *node.path.split('/')) if node.path else self.root_path
+    
+    def apply_listings(self, listings):
+        for relative_directory, directories, files in listings:
+            if directories is None:
+                self.remove_listing(relative_directory)
+                continue
+            self.listings[relative_directory] = (directories, files)
+            node = self.find_node(relative_directory)
+            if node is not None and node.children is not None:
+                self.update_children(node, directories, files)
+            elif node is self.root:
+                self.fetchMore(QModelIndex())
+    
+    def remove_listing(self, relative_directory):
+        prefix = relative_directory + '/'
+        for path in [path for path in self.listings if path == relative_directory or path.startswith(prefix)]:
+            del self.listings[path]
+    
+    def update_children(self, node, directories, files):
+        # Insert and remove single rows so expanded branches and selections survive
+        parent_index = self.index_for(node)
+        wanted = {(True, name) for name in directories} | {(False, name) for name in files}
+        
+        for row in range(len(node.children) - 1, -1, -1):
+            child = node.children[row]
+            if (child.is_dir, child.name) not in wanted:
+                self.beginRemoveRows(parent_index, row, row)
+                del node.children[row]
+                self.endRemoveRows()
+                if child.is_dir:
+                    self.remove_listing(child.path)
+        
+        existing = {(child.is_dir, child.name) for child in node.children}
+        for is_dir, name in sorted(wanted - existing, key=lambda item: (not item[0], item[1].lower())):
+            child = WorkspaceNode(name, node, is_dir)
+            keys = [sibling.sort_key() for sibling in node.children]
+            row = bisect.bisect_left(keys, child.sort_key())
+            self.beginInsertRows(parent_index, row, row)
+            node.children.insert(row, child)
+            self.endInsertRows()
+    
+    def file_paths(self):
+        # Every listed file relative to the workspace root
+        for relative_directory, (_, files) in self.listings.items():
+            prefix = relative_directory + '/' if relative_directory else ''
+            for name in files:
+                yield prefix + name
+
+# Fuzzy file-name index over the workspace paths
+class PathIndex:
+    # A fuzzy tier checks every line the character masks leave when there are at most this many,
+    # otherwise it scans this much of the ranked text, the shortest paths, to bound a keystroke
+    FUZZY_CANDIDATES = 5000
+    FUZZY_SCAN_CHARS = 128 * 1024
+    FORMAT_VERSION = 1
+    
+    def __init__(self, root, paths=(), masks=None):
+        self.root = root
+        self.paths = sorted(paths)
+        self.lowered = [path.lower() for path in self.paths]
+        self.names = [path.rpartition('/')[2] for path in self.lowered]
+        if masks is None:
+            masks = (self.build_masks(self.lowered), self.build_masks(self.names))
+        self.path_masks, self.name_masks = masks
+        
+        # Lines in rank order, shortest path first, with their names and paths joined into one
+        # text each. A scan of a text meets matches in the order they rank, so every tier is
+        # searched across the whole index and still stops as soon as it has enough
+        self.ranked = sorted(range(len(self.paths)), key=lambda line: (len(self.paths[line]), self.paths[line]))
+        self.rank_of = array('q', bytes(8 * len(self.paths)))
+        for position, line in enumerate(self.ranked):
+            self.rank_of[line] = position
+        self.name_text, self.name_starts = self.join_ranked(self.names)
+        self.path_text, self.path_starts = self.join_ranked(self.lowered)
+    
+    def join_ranked(self, lines):
+        # '\n' before and after every line, and the offset each line starts at
+        ranked = [lines[line] for line in self.ranked]
+        starts = array('q', itertools.accumulate((len(line) + 1 for line in ranked), initial=1))
+        return '\n' + '\n'.join(ranked) + '\n', starts
+    
+    @staticmethod
+    def build_masks(lines):
+        # character -> one byte per line, 1 where the line contains it; kept as ints so a
+        # query narrows 200k lines with a handful of C-level ANDs instead of a scan
+        alphabet = set('\n'.join(lines))
+        alphabet.discard('\n')
+        return {char: int.from_bytes(bytes(map(operator.contains, lines, itertools.repeat(char))), 'little')
+                for char in alphabet}
+    
+    @staticmethod
+    def candidate_mask(masks, chars):
+        # One byte per line, 1 where the line has every character of the query: a few C-level ANDs
+        mask = -1
+        for char in chars:
+            if char not in masks:
+                return 0
+            mask &= masks[char]
+        return mask
+    
+    @staticmethod
+    def subsequence_pattern(query):
+        # a[^b\n]*b[^c\n]*c: each gap stops at the next wanted character, so there is no
+        # backtracking, and at the end of the line, so a match never spans two lines
+        parts = [re.escape(query[0])]
+        for char in query[1:]:
+            parts.append(f"[^{re.escape(char)}\\n]*{re.escape(char)}")
+        return re.compile(''.join(parts))
+    
+    @staticmethod
+    def scan(pattern, text, starts, end=None):
+        # Rank positions of the lines a pattern matches in a ranked text, best first, lazily
+        for match in pattern.finditer(text, 0, len(text) if end is None else end):
+            yield bisect.bisect_right(starts, match.end() - 1) - 1
+    
+    @staticmethod
+    def find_all(literal, text, starts):
+        # As scan, for a literal: str.find is a good deal faster than a regex over a long text
+        offset = text.find(literal)
+        while offset >= 0:
+            yield bisect.bisect_right(starts, offset + len(literal) - 1) - 1
+            offset = text.find(literal, offset + 1)
+    
+    def fuzzy_matches(self, pattern, lines, text, starts, mask):
+        # Rank positions of the lines the pattern matches, best first
+        data = mask.to_bytes(len(self.paths), 'little')
+        if data.count(1) <= self.FUZZY_CANDIDATES:
+            return sorted(self.rank_of[match.start()] for match in re.finditer(b'\x01', data)
+                          if pattern.search(lines[match.start()]))
+        return self.scan(pattern, text, starts, self.FUZZY_SCAN_CHARS)
+    
+    def search(self, query, limit=50):
+        query = ''.join(query.lower().split()).replace('\\', '/')
+        if not query or not self.paths:
+            return []
+        chars = set(query)
+        path_mask = self.candidate_mask(self.path_masks, chars)
+        if not path_mask:
+            return []
+        name_mask = self.candidate_mask(self.name_masks, chars) if '/' not in query else 0
+        
+        # Tiers in rank order: the name starts with the query, the name contains it, the name
+        # matches fuzzily, the path does. Within a tier, shorter paths first
+        found = []
+        seen = set()
+        
+        def fill(positions):
+            for position in positions:
+                if position not in seen:
+                    seen.add(position)
+                    found.append(position)
+                    if len(found) >= limit:
+                        return True
+            return False
+        
+        # The literal tiers always cover the whole index: a scan of the ranked text stops
+        # only once it has enough
+        if name_mask:
+            containing = []
+            for position in self.find_all(query, self.name_text, self.name_starts):
+                # A name holding the query twice shows up twice in a row
+                if position not in containing[-1:]:
+                    containing.append(position)
+                    if len(containing) > limit:
+                        break
+            if len(containing) > limit:
+                starting = self.find_all('\n' + query, self.name_text, self.name_starts)
+            else:
+                # The scan went through every name, so it met each one starting with the query too
+                starting = [position for position in containing
+                            if self.names[self.ranked[position]].startswith(query)]
+            if fill(starting) or fill(containing):
+                return [self.paths[self.ranked[position]] for position in found]
+        
+        pattern = self.subsequence_pattern(query)
+        fuzzy_tiers = [(self.lowered, self.path_text, self.path_starts, path_mask)]
+        if name_mask:
+            fuzzy_tiers.insert(0, (self.names, self.name_text, self.name_starts, name_mask))
+        for lines, text, starts, mask in fuzzy_tiers:
+            if fill(self.fuzzy_matches(pattern, lines, text, starts, mask)):
+                break
+        return [self.paths[self.ranked[position]] for position in found]
+    
+    @staticmethod
+    def cache_path(root):
+        import hashlib
+        digest = hashlib.sha1(root.encode('utf-8')).hexdigest()
+        return os.path.join(writable_location(QStandardPaths.GenericCacheLocation),
+                            "Codepad", "quickopen", f"{digest}.index")
+    
+    @classmethod
+    def load(cls, root):
+        # The index saved by an earlier session, or None if there is no usable one
+        import json
+        try:
+            with open(cls.cache_path(root), 'rb') as file:
+                header = json.loads(file.readline())
+                if header.get("version") != cls.FORMAT_VERSION or header.get("root") != root:
+                    return None
+                text = file.read(header["text_bytes"]).decode('utf-8')
+                count = header["count"]
+                masks = []
+                for chars in (header["path_chars"], header["name_chars"]):
+                    masks.append({char: int.from_bytes(file.read(count), 'little') for char in chars})
+        except (OSError, ValueError, KeyError):
+            return None
+        paths = text.split('\n') if count else []
+        if len(paths) != count:
+            return None
+        return cls(root, paths, tuple(masks))
+    
+    def save(self):
+        path = self.cache_path(self.root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = len(self.paths)
+        text = '\n'.join(self.paths).encode('utf-8')
+        header = {
+            "version": self.FORMAT_VERSION,
+            "root": self.root,
+            "count": count,
+            "text_bytes": len(text),
+            "path_chars": list(self.path_masks),
+            "name_chars": list(self.name_masks),
+        }
+        import json
+        with replacing_file(path) as file:
+            file.write(json.dumps(header).encode('utf-8') + b'\n')
+            file.write(text)
+            for masks in (self.path_masks, self.name_masks):
+                for mask in masks.values():
+                    file.write(mask.to_bytes(count, 'little'))
+
+# Builds or loads a PathIndex off the GUI thread
+class PathIndexBuilder(QThread):
+    built = pyqtSignal(object)
+    
+    def __init__(self, root, paths=None, parent=None):
+        super().__init__(parent)
+        self.root = root
+        # None loads the index saved by an earlier session instead
+        self.paths = paths
+    
+    def run(self):
+        if self.paths is None:
+            index = PathIndex.load(self.root)
+        else:
+            index = PathIndex(self.root, self.paths)
+            try:
+                index.save()
+            except OSError:
+                # Only costs a rebuild at the next start
+                pass
+        if index is not None:
+            self.built.emit(index)
+
+# Quick open palette, matches as the user types
+class QuickOpenDialog(QDialog):
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Quick Open")
+        self.resize(600, 400)
+        self.index = index
+        self.selected_path = None
+        
+        layout = QVBoxLayout()
+        
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Type part of a file name")
+        self.query_edit.installEventFilter(self)
+        layout.addWidget(self.query_edit)
+        
+        self.results_list = QListWidget()
+        layout.addWidget(self.results_list)
+        
+        self.timing_label = QLabel()
+        layout.addWidget(self.timing_label)
+        
+        self.setLayout(layout)
+        
+        # Connect signals
+        self.query_edit.textChanged.connect(self.update_results)
+        self.query_edit.returnPressed.connect(self.accept_selection)
+        self.results_list.itemActivated.connect(self.accept_selection)
+    
+    def update_results(self, text):
+        start = time.perf_counter()
+        results = self.index.search(text)
+        elapsed = time.perf_counter() - start
+        
+        self.results_list.clear()
+        self.results_list.addItems(results)
+        if results:
+            self.results_list.setCurrentRow(0)
+        self.timing_label.setText(f"{len(results)} match(es) in {elapsed * 1000:.1f} ms "
+                                  f"across {len(self.index.paths):,} files")
+    
+    def eventFilter(self, obj, event):
+        # Arrow keys move through the results while typing continues in the query
+        if obj is self.query_edit and event.type() == QEvent.KeyPress and \
+                event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown):
+            QApplication.sendEvent(self.results_list, event)
+            return True
+        return super().eventFilter(obj, event)
+    
+    def accept_selection(self, *args):
+        item = self.results_list.currentItem()
+        if item is not None:
+            self.selected_path = item.text()
+            self.accept()
+
+# Finds every match of a pattern in a document a window at a time, so even 100k
+# matches in a huge file never hold up the event loop
+class DocumentSearch(QObject):
+    # Seconds of matching per event loop pass
+    TIME_BUDGET = 0.02
+    # Characters per search window, windows end on a line break. Only patterns that stay within
+    # a line are searched this way, a window end would cut the others short
+    WINDOW_SIZE = 256 * 1024
+    RESTART_DELAY_MS = 250
+    # Characters outside the BMP take two positions in a QTextDocument
+    ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+    
+    matches_changed = pyqtSignal()
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.document = None
+        self.pattern = None
+        self.line_bound = True
+        self.text = None
+        self.matches = None
+        self.window_end = 0
+        self.astral = array('q')
+        # Document positions of the matches found so far, in order
+        self.starts = array('q')
+        self.ends = array('q')
+        self.complete = True
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.search_some)
+        # Edits restart the search once typing pauses
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.setInterval(self.RESTART_DELAY_MS)
+        self.restart_timer.timeout.connect(self.restart)
+    
+    def set_pattern(self, document, pattern, line_bound=True):
+        # line_bound: no match of the pattern runs into the next line
+        if self.document is not document:
+            if self.document is not None:
+                self.document.contentsChange.disconnect(self.on_contents_change)
+            if document is not None:
+                document.contentsChange.connect(self.on_contents_change)
+            self.document = document
+        self.pattern = pattern
+        self.line_bound = line_bound
+        self.restart()
+    
+    def clear(self):
+        self.set_pattern(None, None)
+    
+    def on_contents_change(self, position, removed, added):
+        self.restart_timer.start()
+    
+    def restart(self):
+        self.timer.stop()
+        self.restart_timer.stop()
+        self.starts = array('q')
+        self.ends = array('q')
+        self.matches = None
+        self.text = None
+        self.complete = self.pattern is None or self.document is None
+        if not self.complete:
+            self.text = self.document.toPlainText()
+            self.astral = self.astral_positions(self.document, self.text)
+            self.window_end = 0
+            self.timer.start()
+        self.matches_changed.emit()
+    
+    def search_until(self, position):
+        # Finish searching synchronously up to a document position, for next/previous
+        while not self.complete and (not self.starts or self.starts[-1] < position):
+            self.search_some()
+    
+    @classmethod
+    def astral_positions(cls, document, text):
+        # The document counts UTF-16 units, so any surplus over the text length means astral characters
+        if document.characterCount() - 1 == len(text):
+            return array('q')
+        return array('q', (match.start() for match in cls.ASTRAL.finditer(text)))
+    
+    def document_position(self, index):
+        return index + bisect.bisect_left(self.astral, index)
+    
+    def search_some(self):
+        deadline = time.perf_counter() + self.TIME_BUDGET
+        while time.perf_counter() < deadline:
+            if self.matches is None:
+                if self.window_end >= len(self.text):
+                    self.complete = True
+                    self.timer.stop()
+                    self.text = None
+                    break
+                start = self.window_end
+                end = self.text.find('\n', start + self.WINDOW_SIZE) if self.line_bound else -1
+                self.window_end = len(self.text) if end == -1 else end + 1
+                self.matches = self.pattern.finditer(self.text, start, self.window_end)
+            
+            count = 0
+            for match in itertools.islice(self.matches, 1024):
+                count += 1
+                # Empty matches (^, \b, ...) have nothing to show
+                if match.end() > match.start():
+                    self.starts.append(self.document_position(match.start()))
+                    self.ends.append(self.document_position(match.end()))
+            if count < 1024:
+                self.matches = None
+        self.matches_changed.emit()
+
+# Replace all off the GUI thread: matches the whole text and builds the replacement for the
+# stretch from the first match to the last, which the window swaps in as one edit
+class DocumentReplace(QThread):
+    replaced = pyqtSignal(int, int, str, int)  # document positions of the stretch, its replacement, count
+    failed = pyqtSignal(str)
+    
+    def __init__(self, document, text, pattern, replacement, expand, parent=None):
+        super().__init__(parent)
+        # The edit only applies to the document as it was
+        self.document = document
+        self.revision = document.revision()
+        self.text = text
+        self.pattern = pattern
+        self.replacement = replacement
+        self.expand = expand
+        self.astral = document.characterCount() - 1 != len(text)
+    
+    def run(self):
+        spans = []
+        
+        def replace(match):
+            spans.append((match.start(), match.end()))
+            return match.expand(self.replacement) if self.expand else self.replacement
+        
+        try:
+            result, count = self.pattern.subn(replace, self.text)
+        except (re.error, IndexError) as e:
+            self.failed.emit(str(e))
+            return
+        if not count:
+            self.replaced.emit(0, 0, "", 0)
+            return
+        first = spans[0][0]
+        last = spans[-1][1]
+        replaced = result[first:len(result) - (len(self.text) - last)]
+        astral = array('q', (match.start() for match in DocumentSearch.ASTRAL.finditer(self.text))) \
+            if self.astral else array('q')
+        self.replaced.emit(first + bisect.bisect_left(astral, first), last + bisect.bisect_left(astral, last),
+                           replaced, count)
+
+# Inline find and replace bar shown under the editor
+class FindBar(QWidget):
+    closed = pyqtSignal()
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.find_edit = QLineEdit()
+        self.find_edit.setPlaceholderText("Find")
+        layout.addWidget(self.find_edit)
+        
+        self.replace_edit = QLineEdit()
+        self.replace_edit.setPlaceholderText("Replace")
+        layout.addWidget(self.replace_edit)
+        
+        self.regex_check = QCheckBox("Regex")
+        layout.addWidget(self.regex_check)
+        
+        self.case_check = QCheckBox("Match case")
+        layout.addWidget(self.case_check)
+        
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        
+        self.previous_button = QPushButton("Previous")
+        layout.addWidget(self.previous_button)
+        
+        self.next_button = QPushButton("Next")
+        layout.addWidget(self.next_button)
+        
+        self.replace_button = QPushButton("Replace")
+        layout.addWidget(self.replace_button)
+        
+        self.replace_all_button = QPushButton("Replace All")
+        layout.addWidget(self.replace_all_button)
+        
+        self.close_button = QPushButton("Close")
+        layout.addWidget(self.close_button)
+        
+        self.close_button.clicked.connect(self.hide)
+    
+    def pattern(self):
+        # Raises re.error for an invalid regex
+        text = self.find_edit.text()
+        if not text:
+            return None
+        if not self.regex_check.isChecked():
+            text = re.escape(text)
+        flags = re.MULTILINE
+        if not self.case_check.isChecked():
+            flags |= re.IGNORECASE
+        return re.compile(text, flags)
+    
+    def replacement(self, match):
+        # Regex replacements may refer to groups (\1, \g<name>), plain ones are used as typed
+        if self.regex_check.isChecked():
+            return match.expand(self.replace_edit.text())
+        return self.replace_edit.text()
+    
+    def line_bound(self):
+        # Plain text without a line break never matches across lines; a regex may match \n,
+        # or look past it
+        return not self.regex_check.isChecked() and '\n' not in self.find_edit.text()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        # Not when the whole window is minimized
+        if self.isHidden():
+            self.closed.emit()
+    
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.hide()
+        else:
+            super().keyPressEvent(event)
+
+# Find in files: runs in the worker processes, so it must stay a plain module level function
+def search_file_batch(paths, pattern, flags, max_matches=1000, max_line_length=300):
+    # -> ([(path, [(line number, column, line text)])], bytes searched, binary files skipped)
+    regex = re.compile(pattern, flags)
+    results = []
+    searched = 0
+    binaries = 0
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size == 0:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    # Same test as grep: a NUL byte near the start means binary
+                    if data.find(b'\0', 0, 8192) != -1:
+                        binaries += 1
+                        continue
+                    searched += size
+                    
+                    matches = []
+                    line_number = 0
+                    counted = 0
+                    position = 0
+                    # One hit per line, like grep
+                    while position <= size and len(matches) < max_matches:
+                        match = regex.search(data, position)
+                        if match is None:
+                            break
+                        start = match.start()
+                        line_start = data.rfind(b'\n', 0, start) + 1
+                        line_end = data.find(b'\n', start)
+                        if line_end == -1:
+                            line_end = size
+                        line_number += data[counted:line_start].count(b'\n')
+                        counted = line_start
+                        column = len(data[line_start:start].decode('utf-8', 'replace'))
+                        text = data[line_start:min(line_end, line_start + max_line_length)]
+                        matches.append((line_number, column, text.decode('utf-8', 'replace').rstrip('\r')))
+                        position = line_end + 1
+                    if matches:
+                        results.append((path, matches))
+        except (OSError, ValueError):
+            # Unreadable or vanished since the scan
+            continue
+    return results, searched, binaries
+
+# Fans a find in files out over a process pool and streams the matches back
+class FindInFilesSearch(QThread):
+    # Files per task, enough to amortize the round trip to a worker
+    BATCH_FILES = 64
+    # Stop once this many lines matched, nobody reads further
+    MAX_RESULTS = 20000
+    
+    results_found = pyqtSignal(list)  # [(path, [(line number, column, line text)])]
+    progress = pyqtSignal(int, int)  # files done, files total
+    search_finished = pyqtSignal(int, int, int, float)  # matches, bytes searched, binaries skipped, seconds
+    
+    def __init__(self, executor, paths, pattern, flags=0, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.paths = paths
+        self.pattern = pattern
+        self.flags = flags
+        self.stopped = False
+        self.truncated = False
+    
+    def stop(self):
+        self.stopped = True
+        self.requestInterruption()
+    
+    def run(self):
+        import concurrent.futures
+        start = time.perf_counter()
+        pending = set()
+        sizes = {}
+        for offset in range(0, len(self.paths), self.BATCH_FILES):
+            batch = self.paths[offset:offset + self.BATCH_FILES]
+            future = self.executor.submit(search_file_batch, batch, self.pattern, self.flags)
+            sizes[future] = len(batch)
+            pending.add(future)
+        
+        done_files = 0
+        match_count = 0
+        searched = 0
+        binaries = 0
+        try:
+            while pending:
+                if self.isInterruptionRequested():
+                    break
+                done, pending = concurrent.futures.wait(pending, timeout=0.1,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    done_files += sizes.pop(future)
+                    try:
+                        results, batch_bytes, batch_binaries = future.result()
+                    except Exception:
+                        # A worker died, its files count as searched without matches
+                        continue
+                    searched += batch_bytes
+                    binaries += batch_binaries
+                    if results:
+                        match_count += sum(len(matches) for _, matches in results)
+                        self.results_found.emit(results)
+                if done:
+                    self.progress.emit(done_files, len(self.paths))
+                if match_count >= self.MAX_RESULTS:
+                    self.truncated = True
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+        self.search_finished.emit(match_count, searched, binaries, time.perf_counter() - start)
+
+# Bottom panel with the find in files query and its streamed results
+class FindInFilesPanel(QWidget):
+    # Qt.UserRole data of a result line: (path, line number)
+    LOCATION_ROLE = Qt.UserRole
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        
+        query_layout = QHBoxLayout()
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Find in workspace")
+        query_layout.addWidget(self.query_edit)
+        
+        self.regex_check = QCheckBox("Regex")
+        query_layout.addWidget(self.regex_check)
+        
+        self.case_check = QCheckBox("Match case")
+        query_layout.addWidget(self.case_check)
+        
+        self.search_button = QPushButton("Search")
+        query_layout.addWidget(self.search_button)
+        layout.addLayout(query_layout)
+        
+        self.results_tree = QTreeWidget()
+        self.results_tree.setHeaderHidden(True)
+        self.results_tree.setUniformRowHeights(True)
+        layout.addWidget(self.results_tree)
+        
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        
+        self.query_edit.returnPressed.connect(self.search_button.click)
+    
+    def set_searching(self, searching):
+        self.search_button.setText("Stop" if searching else "Search")
+    
+    def add_results(self, root, results):
+        for path, matches in results:
+            file_item = QTreeWidgetItem([f"{os.path.relpath(path, root)} ({len(matches)})"])
+            for line_number, column, text in matches:
+                line_item = QTreeWidgetItem([f"{line_number + 1}: {text.strip()}"])
+                line_item.setData(0, self.LOCATION_ROLE, (path, line_number))
+                file_item.addChild(line_item)
+            self.results_tree.addTopLevelItem(file_item)
+            # Expanding is cheap while the file has few hits, big ones stay folded
+            if len(matches) <= 20:
+                file_item.setExpanded(True)
+
+# Symbols of a Python source: [(name, kind, line, column, container)], lines counted from 0
+def extract_symbols(source):
+    import ast
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        # Half-typed code, fall back to the tokens
+        return scan_symbols(source)
+    
+    symbols = []
+    stack = [(tree, '', False)]
+    while stack:
+        node, container, in_class = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                symbols.append((child.name, "class", child.lineno - 1, child.col_offset, container))
+                stack.append((child, f"{container}.{child.name}" if container else child.name, True))
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                symbols.append((child.name, "method" if in_class else "function",
+                                child.lineno - 1, child.col_offset, container))
+                stack.append((child, f"{container}.{child.name}" if container else child.name, False))
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                for alias in child.names:
+                    name = alias.asname or alias.name.partition('.')[0]
+                    if name != '*':
+                        symbols.append((name, "import", child.lineno - 1, child.col_offset, container))
+            elif isinstance(child, (ast.stmt, ast.excepthandler)):
+                # Definitions nested in if/try/with/for blocks belong to the enclosing scope
+                stack.append((child, container, in_class))
+    symbols.sort(key=operator.itemgetter(2, 3))
+    return symbols
+
+def scan_symbols(source):
+    # def/class statements found token by token, nesting taken from their indentation
+    symbols = []
+    containers = []  # (indentation, name, is class)
+    previous = None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.NAME and previous is not None and \
+                    previous.type == tokenize.NAME and previous.string in ('def', 'class'):
+                indentation = previous.start[1]
+                while containers and containers[-1][0] >= indentation:
+                    containers.pop()
+                in_class = bool(containers) and containers[-1][2]
+                kind = "class" if previous.string == 'class' else ("method" if in_class else "function")
+                symbols.append((token.string, kind, token.start[0] - 1, indentation,
+                                '.'.join(name for _, name, _ in containers)))
+                containers.append((indentation, token.string, previous.string == 'class'))
+            if token.type not in (tokenize.COMMENT, tokenize.NL):
+                previous = token
+    except (tokenize.TokenError, SyntaxError):
+        # Unterminated string or bracket at the end, keep what was found before it
+        pass
+    return symbols
+
+def index_python_files(tasks):
+    # Runs in the worker processes: [(path, known digest)] ->
+    # [(path, mtime_ns, size, digest, symbols or None when the digest is unchanged)]
+    results = []
+    for path, known_digest in tasks:
+        try:
+            with open(path, 'rb') as file:
+                status = os.fstat(file.fileno())
+                data = file.read()
+        except OSError:
+            continue
+        import hashlib
+        digest = hashlib.sha1(data).hexdigest()
+        symbols = None
+        if digest != known_digest:
+            symbols = extract_symbols(data.decode('utf-8', 'replace'))
+        results.append((path, status.st_mtime_ns, status.st_size, digest, symbols))
+    return results
+
+# Indexes the workspace's Python files, parsing only what changed since the last run
+class SymbolIndexer(QThread):
+    BATCH_FILES = 32
+    # Unchanged files are handed over in slices so the GUI thread takes them in small steps
+    EMIT_FILES = 250
+    FORMAT_VERSION = 1
+    
+    # relative path -> [mtime_ns, size, digest, symbols]
+    indexed = pyqtSignal(dict)
+    index_finished = pyqtSignal(int, int, float)  # files parsed, files indexed, seconds
+    
+    def __init__(self, executor, root, paths, cache=None, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.root = root
+        self.paths = paths
+        # None loads the cache saved by an earlier session
+        self.cache = cache
+    
+    @staticmethod
+    def cache_path(root):
+        import hashlib
+        digest = hashlib.sha1(root.encode('utf-8')).hexdigest()
+        return os.path.join(writable_location(QStandardPaths.GenericCacheLocation),
+                            "Codepad", "symbols", f"{digest}.jsonl")
+    
+    def load_cache(self):
+        # One JSON line per file: decoding it all in one call would hold the GIL, and stall the GUI, for too long
+        import json
+        cache = {}
+        try:
+            with open(self.cache_path(self.root), 'r', encoding='utf-8') as file:
+                header = json.loads(file.readline())
+                if header.get("version") != self.FORMAT_VERSION or header.get("root") != self.root:
+                    return {}
+                for line in file:
+                    relative_path, (mtime_ns, size, digest, symbols) = json.loads(line)
+                    # Tuples of plain values drop out of the garbage collector's sweeps, lists would not
+                    cache[relative_path] = [mtime_ns, size, digest, list(map(tuple, symbols))]
+        except (OSError, ValueError):
+            return {}
+        return cache
+    
+    def save_cache(self, entries):
+        import json
+        path = self.cache_path(self.root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with replacing_file(path, 'w', 'utf-8') as file:
+            file.write(json.dumps({"version": self.FORMAT_VERSION, "root": self.root}) + '\n')
+            for item in entries.items():
+                file.write(json.dumps(item) + '\n')
+    
+    def run(self):
+        import concurrent.futures
+        start = time.perf_counter()
+        cache = self.load_cache() if self.cache is None else self.cache
+        entries = {}
+        tasks = []
+        relative_paths = {}
+        for relative_path in self.paths:
+            path = os.path.join(self.root, *relative_path.split('/'))
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            cached = cache.get(relative_path)
+            # Same size and modification time: trust the cached symbols without reading the file
+            if cached is not None and cached[0] == status.st_mtime_ns and cached[1] == status.st_size:
+                entries[relative_path] = cached
+            else:
+                tasks.append((path, cached[2] if cached is not None else None))
+                relative_paths[path] = relative_path
+        unchanged = list(entries.items())
+        for offset in range(0, len(unchanged), self.EMIT_FILES):
+            self.indexed.emit(dict(unchanged[offset:offset + self.EMIT_FILES]))
+        
+        pending = {self.executor.submit(index_python_files, tasks[offset:offset + self.BATCH_FILES])
+                   for offset in range(0, len(tasks), self.BATCH_FILES)}
+        parsed = 0
+        try:
+            while pending and not self.isInterruptionRequested():
+                done, pending = concurrent.futures.wait(pending, timeout=0.1,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                batch = {}
+                for future in done:
+                    try:
+                        results = future.result()
+                    except Exception:
+                        continue
+                    for path, mtime_ns, size, digest, symbols in results:
+                        relative_path = relative_paths[path]
+                        if symbols is None:
+                            # Touched but not changed
+                            symbols = cache[relative_path][3]
+                        else:
+                            parsed += 1
+                        batch[relative_path] = [mtime_ns, size, digest, symbols]
+                if batch:
+                    entries.update(batch)
+                    self.indexed.emit(batch)
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        # Nothing new to remember when every file matched the cache
+        if not self.isInterruptionRequested() and (tasks or len(entries) != len(cache)):
+            try:
+                self.save_cache(entries)
+            except OSError:
+                # Only costs a full parse at the next start
+                pass
+        self.index_finished.emit(parsed, len(entries), time.perf_counter() - start)
+
+# Workspace symbols by file and by name, for go to definition
+class SymbolTable:
+    # Definitions sort before imports of the same name
+    KIND_ORDER = {"class": 0, "function": 1, "method": 2, "import": 3}
+    
+    def __init__(self):
+        # relative path -> [mtime_ns, size, digest, symbols]
+        self.files = {}
+        # name -> [(relative path, line, kind)]
+        self.definitions = {}
+    
+    def update(self, entries):
+        for relative_path, entry in entries.items():
+            self.remove(relative_path)
+            self.files[relative_path] = entry
+            for name, kind, line, _, _ in entry[3]:
+                self.definitions.setdefault(name, []).append((relative_path, line, kind))
+    
+    def remove(self, relative_path):
+        entry = self.files.pop(relative_path, None)
+        if entry is None:
+            return
+        for name in {symbol[0] for symbol in entry[3]}:
+            locations = [location for location in self.definitions[name] if location[0] != relative_path]
+            if locations:
+                self.definitions[name] = locations
+            else:
+                del self.definitions[name]
+    
+    def retain(self, relative_paths):
+        # Forget files that are no longer in the workspace
+        for relative_path in set(self.files).difference(relative_paths):
+            self.remove(relative_path)
+    
+    def lookup(self, name):
+        return sorted(self.definitions.get(name, ()), key=lambda location: (self.KIND_ORDER[location[2]], location[0]))
+
+# Parses one document's text for the outline
+class SymbolParser(QThread):
+    parsed = pyqtSignal(str, list)  # content digest, symbols
+    
+    def __init__(self, text, digest, parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.digest = digest
+    
+    def run(self):
+        self.parsed.emit(self.digest, extract_symbols(self.text))
+
+# A run of the configured linters over one saved file
+class LintJob:
+    def __init__(self, path, commands):
+        self.path = path
+        self.commands = commands
+        self.process = None
+        self.cancelled = False
+        # Set by the window: the buffer, its revision when saved and the content digest
+        self.buffer = None
+        self.revision = None
+        self.digest = None
+    
+    def cancel(self):
+        self.cancelled = True
+        process = self.process
+        if process is not None:
+            process.kill()
+
+# Runs linters on saved files in a few worker threads, each one waiting on its linter
+# process. Output lines in the usual path:line[:column]: message form become diagnostics
+class LintRunner(QObject):
+    MAX_WORKERS = 2
+    TIMEOUT = 60
+    MAX_DIAGNOSTICS = 500
+    DIAGNOSTIC = re.compile(r'^(?P<path>.+?):(?P<line>\d+):(?:(?P<column>\d+):?)?\s*(?P<message>.+)$')
+    
+    linted = pyqtSignal(object, list, str)  # job, [(line, column, message)], error
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        import concurrent.futures
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS,
+                                                              thread_name_prefix="lint")
+    
+    def run(self, path, commands):
+        job = LintJob(path, commands)
+        job.future = self.executor.submit(self.lint, job)
+        return job
+    
+    def lint(self, job):
+        import shlex
+        import subprocess
+        diagnostics = []
+        error = ""
+        target = os.path.normcase(os.path.abspath(job.path))
+        for command in job.commands:
+            if job.cancelled:
+                return
+            arguments = [argument.replace("{file}", job.path).replace("{python}", sys.executable)
+                         for argument in shlex.split(command)]
+            try:
+                job.process = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                               stdin=subprocess.DEVNULL, cwd=os.path.dirname(job.path) or None,
+                                               text=True, errors='replace')
+                if job.cancelled:
+                    job.process.kill()
+                output, errors = job.process.communicate(timeout=self.TIMEOUT)
+            except subprocess.TimeoutExpired:
+                job.process.kill()
+                job.process.communicate()
+                error = f"{arguments[0]} took longer than {self.TIMEOUT} s"
+                continue
+            except (OSError, ValueError) as e:
+                error = str(e)
+                continue
+            if job.cancelled:
+                return
+            
+            found = 0
+            for line in (output + errors).splitlines():
+                match = self.DIAGNOSTIC.match(line)
+                if match is None:
+                    continue
+                path = os.path.join(os.path.dirname(job.path), match.group('path'))
+                if os.path.normcase(os.path.abspath(path)) != target:
+                    continue
+                found += 1
+                if len(diagnostics) < self.MAX_DIAGNOSTICS:
+                    column = int(match.group('column') or 0)
+                    diagnostics.append((int(match.group('line')), column, match.group('message').strip()))
+            if not found and job.process.returncode != 0:
+                # Not a diagnostic: the linter itself failed (not installed, bad arguments...)
+                lines = [line for line in (errors or output).splitlines() if line.strip()]
+                error = lines[-1] if lines else f"{arguments[0]} exited with status {job.process.returncode}"
+        job.process = None
+        self.linted.emit(job, sorted(diagnostics), error)
+    
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Identifiers sorted case-insensitively with their counts, a prefix is one bisect range
+class WordIndex:
+    # Above this many words in a prefix range, candidates come from the most frequent words instead
+    RANK_LIMIT = 300
+    # How far down the most frequent words a big range is looked for
+    SCAN_LIMIT = 20000
+    
+    def __init__(self, counts=None):
+        # word -> count
+        self.counts = dict(counts or {})
+        # "lowercase\0word", unique even when words differ only in case
+        self.keys = sorted(map(self.key, self.counts))
+        self.by_frequency = None
+    
+    @staticmethod
+    def key(word):
+        return word.lower() + '\0' + word
+    
+    def freeze(self):
+        # For indexes that no longer change: most frequent first, used for short prefixes
+        self.by_frequency = sorted(self.keys, key=lambda key: -self.counts[key.partition('\0')[2]])
+    
+    def add(self, words):
+        new_words = []
+        for word in words:
+            count = self.counts.get(word, 0)
+            if not count:
+                new_words.append(word)
+            self.counts[word] = count + 1
+        if len(new_words) > 64:
+            # A load or paste: one merge instead of thousands of inserts
+            self.keys.extend(map(self.key, new_words))
+            self.keys.sort()
+        else:
+            for word in new_words:
+                bisect.insort(self.keys, self.key(word))
+    
+    def remove(self, words):
+        gone = []
+        for word in words:
+            count = self.counts[word] - 1
+            if count:
+                self.counts[word] = count
+            else:
+                del self.counts[word]
+                gone.append(word)
+        if len(gone) > 64:
+            gone = set(map(self.key, gone))
+            self.keys = [key for key in self.keys if key not in gone]
+        else:
+            for word in gone:
+                del self.keys[bisect.bisect_left(self.keys, self.key(word))]
+    
+    def matches(self, prefix):
+        # [(word, count)] of at most RANK_LIMIT words starting with the lowercase prefix
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + '\U0010ffff')
+        if high - low <= self.RANK_LIMIT:
+            keys = self.keys[low:high]
+        elif self.by_frequency is not None:
+            frequent = itertools.islice(self.by_frequency, self.SCAN_LIMIT)
+            keys = list(itertools.islice(filter(operator.methodcaller('startswith', prefix), frequent),
+                                         self.RANK_LIMIT))
+            if len(keys) < self.RANK_LIMIT:
+                # Whatever was not among the frequent words is rare anyway, fill up in order
+                keys = list(dict.fromkeys(keys + self.keys[low:low + self.RANK_LIMIT - len(keys)]))
+        else:
+            keys = self.keys[low:low + self.RANK_LIMIT]
+        counts = self.counts
+        return [(word, counts[word]) for word in (key.partition('\0')[2] for key in keys)]
+
+# Identifiers of one document, kept up to date from its change notifications
+class IdentifierIndex:
+    IDENTIFIER = re.compile(r'\b(?!\d)\w{3,}')
+    
+    def __init__(self, document):
+        self.document = document
+        self.words = WordIndex()
+        # Identifiers of each block, to know what an edit took away
+        self.blocks = []
+        self.revision = None
+        self.rescan()
+        document.contentsChange.connect(self.on_contents_change)
+    
+    def rescan(self):
+        self.words = WordIndex()
+        self.blocks = []
+        block = self.document.begin()
+        findall = self.IDENTIFIER.findall
+        while block.isValid():
+            self.blocks.append(tuple(findall(block.text())))
+            block = block.next()
+        self.words.add(itertools.chain.from_iterable(self.blocks))
+        self.revision = self.document.revision()
+    
+    def sync(self):
+        # Edits made while the document had no layout were never reported
+        if self.revision != self.document.revision() or len(self.blocks) != self.document.blockCount():
+            self.rescan()
+    
+    def on_contents_change(self, position, removed, added):
+        document = self.document
+        first_block = document.findBlock(position)
+        last_block = document.findBlock(min(position + added, document.characterCount() - 1))
+        first = first_block.blockNumber()
+        new_count = last_block.blockNumber() - first + 1
+        old_count = new_count - (document.blockCount() - len(self.blocks))
+        if first < 0 or new_count < 1 or old_count < 1 or first + old_count > len(self.blocks):
+            self.rescan()
+            return
+        
+        # Only the blocks the edit touched are rescanned
+        findall = self.IDENTIFIER.findall
+        new_blocks = []
+        block = first_block
+        for _ in range(new_count):
+            new_blocks.append(tuple(findall(block.text())))
+            block = block.next()
+        self.words.remove(itertools.chain.from_iterable(self.blocks[first:first + old_count]))
+        self.words.add(itertools.chain.from_iterable(new_blocks))
+        self.blocks[first:first + old_count] = new_blocks
+        self.revision = document.revision()
+    
+    def close(self):
+        self.document.contentsChange.disconnect(self.on_contents_change)
+
+# Completion popup for the editor, ranked by frequency and recent use
+class Autocompleter(QObject):
+    MIN_PREFIX = 2
+    MAX_RESULTS = 50
+    # A word in the open document counts this many times a workspace definition
+    DOCUMENT_WEIGHT = 2
+    RECENCY_WEIGHT = 3.0
+    RECENT_SIZE = 256
+    WORD_BEFORE_CURSOR = re.compile(r'(?!\d)\w+$')
+    
+    def __init__(self, editor, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.identifiers = None
+        self.workspace_words = WordIndex()
+        # Words recently completed or typed, most recent last
+        self.recent = OrderedDict()
+        self.prefix = ''
+        self.last_latency = 0.0
+        
+        self.model = QStringListModel(self)
+        self.completer = QCompleter(self.model, self)
+        self.completer.setWidget(editor)
+        # Ranking is done here, the completer shows the list as given
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.activated[str].connect(self.insert_completion)
+        
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(0)
+        self.update_timer.timeout.connect(self.update_popup)
+        editor.installEventFilter(self)
+        # While the popup is open it gets the keys and the completer hands the rest straight to
+        # the editor; installed after the completer's own filter, this one sees them first
+        self.completer.popup().installEventFilter(self)
+    
+    def set_identifiers(self, identifiers):
+        self.identifiers = identifiers
+        identifiers.sync()
+        self.completer.popup().hide()
+    
+    def set_workspace_words(self, counts):
+        self.workspace_words = WordIndex(counts)
+        self.workspace_words.freeze()
+    
+    def eventFilter(self, obj, event):
+        if event.type() != QEvent.KeyPress:
+            return super().eventFilter(obj, event)
+        
+        popup = self.completer.popup()
+        if obj is popup:
+            if event.key() in (Qt.Key_Return, Qt.Key_Enter, Qt.Key_Tab):
+                index = popup.currentIndex()
+                popup.hide()
+                if index.isValid():
+                    self.insert_completion(index.data())
+                return True
+            if event.key() == Qt.Key_Escape:
+                popup.hide()
+                return True
+        if obj is popup or obj is self.editor:
+            if event.key() == Qt.Key_Space and event.modifiers() & Qt.ControlModifier:
+                self.update_popup(forced=True)
+                return True
+            if event.text() and not (event.text()[-1].isalnum() or event.text()[-1] == '_'):
+                self.remember(self.word_before_cursor())
+            if event.text() or event.key() == Qt.Key_Backspace:
+                # Look again once the editor has applied the key
+                self.update_timer.start()
+        return super().eventFilter(obj, event)
+    
+    def word_before_cursor(self):
+        cursor = self.editor.textCursor()
+        text = cursor.block().text()[:cursor.positionInBlock()]
+        match = self.WORD_BEFORE_CURSOR.search(text)
+        return match.group(0) if match else ''
+    
+    def remember(self, word):
+        if len(word) < 3:
+            return
+        self.recent.pop(word, None)
+        self.recent[word] = None
+        if len(self.recent) > self.RECENT_SIZE:
+            self.recent.popitem(last=False)
+    
+    def complete(self, prefix):
+        lower = prefix.lower()
+        scores = {}
+        if self.identifiers is not None:
+            for word, count in self.identifiers.words.matches(lower):
+                scores[word] = count * self.DOCUMENT_WEIGHT
+        for word, count in self.workspace_words.matches(lower):
+            scores[word] = scores.get(word, 0) + count
+        # The word being typed is counted in the document already, it is no suggestion
+        scores.pop(prefix, None)
+        if not scores:
+            return []
+        
+        scores = dict(zip(scores, map(math.log1p, scores.values())))
+        # Newer words get more of the recency bonus
+        for rank, word in enumerate(self.recent, 1):
+            if word in scores:
+                scores[word] += self.RECENCY_WEIGHT * rank / len(self.recent)
+        return heapq.nlargest(self.MAX_RESULTS, scores, key=scores.get)
+    
+    def update_popup(self, forced=False):
+        popup = self.completer.popup()
+        prefix = self.word_before_cursor()
+        if len(prefix) < (1 if forced else self.MIN_PREFIX) or self.editor.isReadOnly():
+            popup.hide()
+            return
+        
+        start = time.perf_counter()
+        results = self.complete(prefix)
+        self.last_latency = time.perf_counter() - start
+        if not results:
+            popup.hide()
+            return
+        
+        self.prefix = prefix
+        self.model.setStringList(results)
+        rect = self.editor.cursorRect()
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
+        popup.setCurrentIndex(self.model.index(0, 0))
+    
+    def insert_completion(self, word):
+        cursor = self.editor.textCursor()
+        cursor.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, len(self.prefix))
+        cursor.insertText(word)
+        self.editor.setTextCursor(cursor)
+        self.remember(word)
+
+# HTTP/1.1 connections kept open per host and reused, used on the AI client's event loop only
+class HttpConnectionPool:
+    MAX_IDLE_PER_HOST = 4
+    # Servers drop idle connections after a while, older ones are not worth trying
+    IDLE_TIMEOUT = 60
+    CONNECT_TIMEOUT = 15
+    # Longest wait for the next piece of a response, a model can think for a while
+    READ_TIMEOUT = 120
+    READ_SIZE = 64 * 1024
+    
+    def __init__(self):
+        self.idle = {}  # (scheme, host, port) -> [(reader, writer, idle since)]
+        self.ssl_context = None
+        self.opened = 0
+    
+    async def connect(self, origin):
+        import asyncio
+        now = time.monotonic()
+        connections = self.idle.get(origin, [])
+        while connections:
+            reader, writer, since = connections.pop()
+            if now - since < self.IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        
+        scheme, host, port = origin
+        ssl_context = None
+        if scheme == 'https':
+            if self.ssl_context is None:
+                import ssl
+                self.ssl_context = ssl.create_default_context()
+            ssl_context = self.ssl_context
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl_context),
+                                                self.CONNECT_TIMEOUT)
+        self.opened += 1
+        return reader, writer, False
+    
+    def release(self, origin, reader, writer):
+        connections = self.idle.setdefault(origin, [])
+        if len(connections) < self.MAX_IDLE_PER_HOST:
+            connections.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+    
+    def discard(self, origin):
+        for reader, writer, since in self.idle.pop(origin, []):
+            writer.close()
+    
+    def close(self):
+        for origin in list(self.idle):
+            self.discard(origin)
+    
+    async def post(self, url, headers, body):
+        # Returns (status, headers, chunks), chunks an async iterator over the body. The
+        # connection goes back to the pool once the body has been read to the end
+        import asyncio
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"unsupported URL {url}")
+        origin = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        lines = [f"POST {target} HTTP/1.1", f"Host: {parts.netloc}", f"Content-Length: {len(body)}",
+                 "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        
+        def read(awaitable):
+            return asyncio.wait_for(awaitable, self.READ_TIMEOUT)
+        
+        while True:
+            reader, writer, reused = await self.connect(origin)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await read(reader.readline())
+                if not status_line:
+                    raise ConnectionResetError("the server closed the connection")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # The server had already dropped its kept-alive connections, start a new one
+                self.discard(origin)
+            except BaseException:
+                writer.close()
+                raise
+        
+        try:
+            version, status = status_line.decode('latin-1').split(None, 2)[:2]
+            status = int(status)
+            response_headers = {}
+            while True:
+                line = await read(reader.readline())
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        keep_alive = version == 'HTTP/1.1' and response_headers.get('connection', '').lower() != 'close'
+        
+        async def chunks():
+            reusable = False
+            try:
+                if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+                    while True:
+                        size = int(((await read(reader.readline())).split(b';')[0].strip() or b'0'), 16)
+                        if size == 0:
+                            # Trailers up to the empty line
+                            while (await read(reader.readline())) not in (b'\r\n', b'\n', b''):
+                                pass
+                            break
+                        yield (await read(reader.readexactly(size + 2)))[:-2]
+                    reusable = keep_alive
+                elif 'content-length' in response_headers:
+                    remaining = int(response_headers['content-length'])
+                    while remaining:
+                        data = await read(reader.read(min(remaining, self.READ_SIZE)))
+                        if not data:
+                            raise ConnectionResetError("the response was cut short")
+                        remaining -= len(data)
+                        yield data
+                    reusable = keep_alive
+                else:
+                    # Neither length nor chunks, the body ends with the connection
+                    while data := await read(reader.read(self.READ_SIZE)):
+                        yield data
+            finally:
+                if reusable:
+                    self.release(origin, reader, writer)
+                else:
+                    writer.close()
+        
+        return status, response_headers, chunks()
+
+# One streamed chat completion
+class AiRequest:
+    def __init__(self, kind, cache_key, cursor=None):
+        self.kind = kind
+        self.cache_key = cache_key
+        # Where a refactoring goes in the document, None when the answer goes to the panel
+        self.cursor = cursor
+        self.inserted = False
+        self.future = None
+        self.stopped = False
+    
+    def cancel(self):
+        self.stopped = True
+        if self.future is not None:
+            self.future.cancel()
+
+# OpenAI style chat completions, streamed over pooled connections from an asyncio loop in its own thread
+class AiClient(QObject):
+    DEFAULT_URL = "https://api.openai.com/v1"
+    MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-4.1-mini", "gpt-4.1"]
+    
+    # Emitted from the loop thread, received on the GUI thread: (request, text)
+    tokens = pyqtSignal(object, str)
+    completed = pyqtSignal(object, str)
+    failed = pyqtSignal(object, str)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.pool = HttpConnectionPool()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ai-client", daemon=True)
+        self.thread.start()
+    
+    @staticmethod
+    def endpoint(url):
+        url = (url or AiClient.DEFAULT_URL).rstrip('/')
+        return url if url.endswith('/chat/completions') else url + '/chat/completions'
+    
+    def complete(self, request, url, api_key, model, temperature, messages):
+        import asyncio
+        import json
+        body = json.dumps({"model": model, "messages": messages, "temperature": temperature,
+                           "stream": True}).encode('utf-8')
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        request.future = asyncio.run_coroutine_threadsafe(
+            self.stream_completion(request, self.endpoint(url), headers, body), self.loop)
+    
+    async def stream_completion(self, request, url, headers, body):
+        import asyncio
+        import json
+        try:
+            status, response_headers, chunks = await self.pool.post(url, headers, body)
+            if status != 200:
+                data = b''.join([data async for data in chunks])
+                try:
+                    message = json.loads(data)["error"]["message"]
+                except (ValueError, KeyError, TypeError):
+                    message = data.decode('utf-8', 'replace').strip()[:200]
+                raise ValueError(f"HTTP {status}: {message}")
+            
+            parts = []
+            if 'text/event-stream' in response_headers.get('content-type', ''):
+                pending = b''
+                async for data in chunks:
+                    *lines, pending = (pending + data).split(b'\n')
+                    # Everything that came in one read is handed over in one signal
+                    tokens = []
+                    for line in lines:
+                        if not line.startswith(b'data:'):
+                            continue
+                        payload = line[5:].strip()
+                        if payload == b'[DONE]':
+                            continue
+                        event = json.loads(payload)
+                        if "error" in event:
+                            raise ValueError(event["error"].get("message", "error in the stream"))
+                        choices = event.get("choices") or [{}]
+                        content = (choices[0].get("delta") or {}).get("content")
+                        if content:
+                            tokens.append(content)
+                    if tokens:
+                        parts.append(''.join(tokens))
+                        self.tokens.emit(request, parts[-1])
+            else:
+                # A server that ignores "stream" answers with one JSON document
+                data = b''.join([data async for data in chunks])
+                parts.append(json.loads(data)["choices"][0]["message"]["content"] or '')
+                self.tokens.emit(request, parts[-1])
+            self.completed.emit(request, ''.join(parts))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed.emit(request, str(e) or type(e).__name__)
+    
+    def close(self):
+        self.loop.call_soon_threadsafe(self.pool.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+# Completed AI responses on disk, least recently used evicted past the size budget
+class ResponseCache:
+    def __init__(self, directory, budget):
+        self.directory = directory
+        self.budget = budget
+    
+    @staticmethod
+    def key(model, prompt, selection):
+        import hashlib
+        selection_digest = hashlib.sha256(selection.encode('utf-8', 'surrogatepass')).hexdigest()
+        return hashlib.sha256('\0'.join((model, prompt, selection_digest)).encode('utf-8')).hexdigest()
+    
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+    
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                text = file.read()
+            # A hit counts as use for the eviction order
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return text
+    
+    def put(self, key, text):
+        os.makedirs(self.directory, exist_ok=True)
+        with replacing_file(self.path(key), 'w', 'utf-8') as file:
+            file.write(text)
+        self.evict()
+    
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.txt'):
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+
+# Lone surrogates, what undecodable bytes in an opened file turn into
+LONE_SURROGATE = re.compile('[\ud800-\udfff]')
+
+# Splits text into messages of at most limit UTF-16 code units, the unit Telegram counts in,
+# at line breaks where it can. Blank pieces are dropped, Telegram refuses empty messages
+def split_message(text, limit):
+    chunks = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        units = len(line.encode('utf-16-le', 'surrogatepass')) // 2
+        if size + units > limit and current:
+            chunks.append(''.join(current))
+            current = []
+            size = 0
+        while units > limit:
+            # A line longer than a whole message, cut it but never inside a surrogate pair
+            encoded = line.encode('utf-16-le', 'surrogatepass')
+            cut = limit * 2
+            if 0xD800 <= int.from_bytes(encoded[cut - 2:cut], 'little') <= 0xDBFF:
+                cut -= 2
+            chunks.append(encoded[:cut].decode('utf-16-le', 'surrogatepass'))
+            line = encoded[cut:].decode('utf-16-le', 'surrogatepass')
+            units -= cut // 2
+        current.append(line)
+        size += units
+    if current:
+        chunks.append(''.join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+# Tokens refill at a steady rate up to a burst, each message takes one
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self):
+        # Takes a token and returns 0, or returns the seconds until one is free
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    def drain(self):
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+# Sends shared text to Telegram from an asyncio loop in its own thread. Every share is
+# written to disk first and removed once its last message is sent, so a restart resumes it
+class TelegramQueue(QObject):
+    DEFAULT_URL = "https://api.telegram.org"
+    # Telegram's limit is 4096, the rest is room for the "[i/n]" part header
+    MESSAGE_LIMIT = 4096 - 16
+    # Telegram asks for no more than about one message a second in a chat
+    RATE = 1.0
+    BURST = 3
+    BACKOFF_START = 1
+    BACKOFF_MAX = 300
+    # Seconds between tries for the queue lock while another instance holds it and shares wait
+    LOCK_RETRY = 5
+    
+    # Emitted from the loop thread, received on the GUI thread
+    queue_changed = pyqtSignal(int)  # messages still to send
+    shared = pyqtSignal(str)  # title
+    failed = pyqtSignal(str, str)  # title, error
+    
+    def __init__(self, directory, token, base_url="", parent=None):
+        super().__init__(parent)
+        import asyncio
+        self.directory = directory
+        self.token = token
+        self.base_url = base_url
+        self.pool = HttpConnectionPool()
+        self.bucket = TokenBucket(self.RATE, self.BURST)
+        self.shares = deque()  # {"path", "chat_id", "title", "chunks", "sent"}
+        # Every instance shares one queue directory; only the one holding this lock sends, so
+        # no share goes out twice. It sends what the others queued as well
+        self.lock = QLockFile(os.path.join(directory, "queue.lock"))
+        self.loop = asyncio.new_event_loop()
+        self.wakeup = None
+        self.sender = None
+        self.thread = threading.Thread(target=self.run_loop, name="telegram-queue", daemon=True)
+        self.thread.start()
+    
+    @staticmethod
+    def pending_shares(directory):
+        try:
+            return sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith('.jsonl'))
+        except OSError:
+            return []
+    
+    def run_loop(self):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.sender = self.loop.create_task(self.send_all())
+        self.loop.run_forever()
+    
+    def configure(self, token, base_url):
+        self.loop.call_soon_threadsafe(self.set_configuration, token, base_url)
+    
+    def set_configuration(self, token, base_url):
+        self.token = token
+        self.base_url = base_url
+        self.wakeup.set()
+    
+    def share(self, chat_id, title, text=None, path=None):
+        # Reading, splitting and writing a big file all happen on the loop thread
+        self.loop.call_soon_threadsafe(self.add_share, chat_id, title, text, path)
+    
+    def add_share(self, chat_id, title, text, path):
+        import json
+        try:
+            if path is not None:
+                probe = FileProbe(path)
+                if probe.binary:
+                    raise ValueError("binary files cannot be shared")
+                with open(path, 'r', encoding=probe.stream_encoding, errors='replace') as file:
+                    text = file.read()
+            # Bytes the editor kept undecoded are lone surrogates, which are not valid in a message
+            text = LONE_SURROGATE.sub('\ufffd', text)
+            chunks = split_message(text, self.MESSAGE_LIMIT)
+            if not chunks:
+                raise ValueError("there is nothing to send")
+            if len(chunks) > 1:
+                chunks = [f"[{number}/{len(chunks)}]\n{chunk}" for number, chunk in enumerate(chunks, 1)]
+            os.makedirs(self.directory, exist_ok=True)
+            share_path = os.path.join(self.directory, f"{time.time_ns():020d}.jsonl")
+            # A header line, then one message per line: no single long json call holding the GIL
+            with replacing_file(share_path, 'w', 'utf-8') as file:
+                file.write(json.dumps({"chat_id": chat_id, "title": title}) + '\n')
+                for chunk in chunks:
+                    file.write(json.dumps(chunk) + '\n')
+        except (OSError, ValueError) as e:
+            self.failed.emit(title, str(e))
+            return
+        self.shares.append({"path": share_path, "chat_id": chat_id, "title": title, "chunks": chunks, "sent": 0})
+        self.queue_changed.emit(self.pending_messages())
+        self.wakeup.set()
+    
+    def load_shares(self):
+        # The queue as it is on disk, with what other instances added and sent since
+        import json
+        self.shares.clear()
+        for share_path in self.pending_shares(self.directory):
+            try:
+                with open(share_path, 'r', encoding='utf-8') as file:
+                    share = json.loads(file.readline())
+                    share["chunks"] = [json.loads(line) for line in file]
+                try:
+                    with open(share_path + '.sent', 'r') as file:
+                        sent = int(file.read() or 0)
+                except FileNotFoundError:
+                    sent = 0
+            except (OSError, ValueError) as e:
+                self.failed.emit(os.path.basename(share_path), f"unreadable queue entry: {e}")
+                self.remove_share_files(share_path)
+                continue
+            share.update(path=share_path, sent=sent)
+            self.shares.append(share)
+        self.queue_changed.emit(self.pending_messages())
+    
+    def pending_messages(self):
+        return sum(len(share["chunks"]) - share["sent"] for share in self.shares)
+    
+    @staticmethod
+    def remove_share_files(share_path):
+        for path in (share_path, share_path + '.sent'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    async def wait_for_wakeup(self, timeout=None):
+        import asyncio
+        self.wakeup.clear()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    def take_lock(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError:
+            return False
+        return self.lock.tryLock(0)
+    
+    async def send_all(self):
+        import asyncio
+        import random
+        attempt = 0
+        while True:
+            if not self.token:
+                await self.wait_for_wakeup()
+                continue
+            if not self.lock.isLocked():
+                if not self.take_lock():
+                    # Another instance is sending; what waits on disk is sent by it, or by this
+                    # one once it lets go
+                    await self.wait_for_wakeup(self.LOCK_RETRY if self.pending_shares(self.directory) else None)
+                    continue
+                self.load_shares()
+            if not self.shares:
+                # Before letting go, pick up what other instances queued while this one sent
+                self.load_shares()
+                if not self.shares:
+                    self.lock.unlock()
+                    await self.wait_for_wakeup()
+                    continue
+            
+            while delay := self.bucket.take():
+                await asyncio.sleep(delay)
+            share = self.shares[0]
+            try:
+                retry_after = await self.send_message(share["chat_id"], share["chunks"][share["sent"]])
+            except PermissionError as e:
+                # Refused for good (bad token, unknown chat, ...), retrying would not help
+                self.shares.popleft()
+                self.remove_share_files(share["path"])
+                self.failed.emit(share["title"], str(e))
+                self.queue_changed.emit(self.pending_messages())
+                attempt = 0
+                continue
+            except Exception:
+                # Network trouble or a server error, back off and try the same message again
+                retry_after = min(self.BACKOFF_MAX, self.BACKOFF_START * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+            
+            if retry_after:
+                self.bucket.drain()
+                await asyncio.sleep(retry_after)
+                continue
+            
+            attempt = 0
+            share["sent"] += 1
+            if share["sent"] == len(share["chunks"]):
+                self.shares.popleft()
+                self.remove_share_files(share["path"])
+                self.shared.emit(share["title"])
+            else:
+                try:
+                    with open(share["path"] + '.sent', 'w') as file:
+                        file.write(str(share["sent"]))
+                except OSError:
+                    # Only costs resending a few messages after a restart
+                    pass
+            self.queue_changed.emit(self.pending_messages())
+    
+    async def send_message(self, chat_id, text):
+        # Returns 0 once sent, or the seconds Telegram asks to wait before trying again
+        import json
+        url = f"{(self.base_url or self.DEFAULT_URL).rstrip('/')}/bot{self.token}/sendMessage"
+        body = json.dumps({"chat_id": chat_id, "text": text, "disable_web_page_preview": True}).encode('utf-8')
+        status, headers, chunks = await self.pool.post(url, {"Content-Type": "application/json"}, body)
+        data = b''.join([data async for data in chunks])
+        try:
+            reply = json.loads(data)
+        except ValueError:
+            reply = {}
+        if status == 200 and reply.get("ok"):
+            return 0
+        if status == 429:
+            return (reply.get("parameters") or {}).get("retry_after", self.BACKOFF_START)
+        if status >= 500:
+            raise ConnectionError(f"HTTP {status}")
+        raise PermissionError(reply.get("description") or f"HTTP {status}")
+    
+    async def shut_down(self):
+        import asyncio
+        self.sender.cancel()
+        try:
+            await self.sender
+        except asyncio.CancelledError:
+            pass
+        self.lock.unlock()
+        self.pool.close()
+    
+    def close(self):
+        # Whatever is left stays on disk for the next session
+        import asyncio
+        import concurrent.futures
+        try:
+            asyncio.run_coroutine_threadsafe(self.shut_down(), self.loop).result(1)
+        except concurrent.futures.TimeoutError:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+# Side panel the explanations and summaries stream into
+class AiPanel(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        layout.addWidget(self.output)
+        
+        status_layout = QHBoxLayout()
+        self.status_label = QLabel()
+        status_layout.addWidget(self.status_label, 1)
+        
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        status_layout.addWidget(self.stop_button)
+        layout.addLayout(status_layout)
+    
+    def set_running(self, running):
+        self.stop_button.setEnabled(running)
+
+# Runs a program with QProcess and hands its output over in batches a few times a second.
+# Pipes are always drained, output past what a batch may carry is dropped oldest first,
+# so a script printing millions of lines costs bounded time and memory
+class ProcessRunner(QObject):
+    FLUSH_INTERVAL_MS = 50
+    # Output held until the next batch
+    MAX_PENDING_BYTES = 256 * 1024
+    # Lines per batch, 20,000 a second: the output widget takes about 10 us a line once full
+    MAX_BATCH_LINES = 1000
+    # After asking a program to stop, how long before it is killed
+    STOP_TIMEOUT_MS = 2000
+    
+    output_ready = pyqtSignal(list)  # [(from stderr, text)]
+    run_finished = pyqtSignal(str, float)  # how it ended, seconds
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.process = None
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.skipped = 0
+        self.decoders = {}
+        self.stopped = False
+        self.started = 0
+        
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush)
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.setInterval(self.STOP_TIMEOUT_MS)
+        self.kill_timer.timeout.connect(self.kill)
+    
+    def is_running(self):
+        return self.process is not None
+    
+    def start(self, program, arguments, directory):
+        self.pending.clear()
+        self.pending_bytes = 0
+        self.skipped = 0
+        self.decoders = {False: codecs.getincrementaldecoder('utf-8')('replace'),
+                         True: codecs.getincrementaldecoder('utf-8')('replace')}
+        self.stopped = False
+        self.process = QProcess(self)
+        self.process.setWorkingDirectory(directory)
+        self.process.readyReadStandardOutput.connect(lambda: self.read(False))
+        self.process.readyReadStandardError.connect(lambda: self.read(True))
+        self.process.finished.connect(self.on_finished)
+        self.process.errorOccurred.connect(self.on_error)
+        self.started = time.perf_counter()
+        self.process.start(program, arguments)
+    
+    def stop(self):
+        if self.process is None:
+            return
+        self.stopped = True
+        self.process.terminate()
+        self.kill_timer.start()
+    
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+    
+    def read(self, is_error):
+        process = self.process
+        if process is None:
+            return
+        data = bytes(process.readAllStandardError() if is_error else process.readAllStandardOutput())
+        if len(data) > self.MAX_PENDING_BYTES:
+            self.skipped += data.count(b'\n', 0, len(data) - self.MAX_PENDING_BYTES)
+            data = data[-self.MAX_PENDING_BYTES:]
+        self.pending.append((is_error, data))
+        self.pending_bytes += len(data)
+        while self.pending_bytes > self.MAX_PENDING_BYTES:
+            _, dropped = self.pending.popleft()
+            self.pending_bytes -= len(dropped)
+            self.skipped += dropped.count(b'\n')
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+    
+    def flush(self, final=False):
+        self.flush_timer.stop()
+        batch = []
+        while self.pending:
+            is_error, data = self.pending.popleft()
+            text = self.decoders[is_error].decode(data, final)
+            # Runs of one stream go in as one piece
+            if batch and batch[-1][0] == is_error:
+                batch[-1] = (is_error, batch[-1][1] + text)
+            else:
+                batch.append((is_error, text))
+        self.pending_bytes = 0
+        
+        # Only the last MAX_BATCH_LINES lines
+        lines = 0
+        for index in range(len(batch) - 1, -1, -1):
+            is_error, text = batch[index]
+            cut = len(text)
+            while lines <= self.MAX_BATCH_LINES:
+                cut = text.rfind('\n', 0, cut)
+                if cut < 0:
+                    break
+                lines += 1
+            if cut >= 0:
+                # Earlier pieces go whole, a piece not ending in a line break still shows as a line
+                self.skipped += sum(earlier.count('\n') + (not earlier.endswith('\n'))
+                                    for _, earlier in batch[:index] if earlier)
+                self.skipped += text.count('\n', 0, cut + 1)
+                batch = [(is_error, text[cut + 1:])] + batch[index + 1:]
+                break
+        if self.skipped:
+            batch.insert(0, (True, f"[{self.skipped:,} lines of output skipped]\n"))
+            self.skipped = 0
+        if batch:
+            self.output_ready.emit(batch)
+    
+    def on_finished(self, exit_code, exit_status):
+        if self.sender() is not self.process:
+            return
+        self.read(False)
+        self.read(True)
+        self.flush(final=True)
+        self.kill_timer.stop()
+        if self.stopped:
+            outcome = "Stopped"
+        elif exit_status == QProcess.CrashExit:
+            outcome = "Crashed"
+        else:
+            outcome = f"Exited with code {exit_code}"
+        self.finish(outcome)
+    
+    def on_error(self, error):
+        # Only failing to start means there will be no finished signal
+        if error == QProcess.FailedToStart and self.sender() is self.process:
+            self.finish(f"Could not start: {self.process.errorString()}")
+    
+    def finish(self, outcome):
+        process, self.process = self.process, None
+        process.deleteLater()
+        self.run_finished.emit(outcome, time.perf_counter() - self.started)
+    
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+# Output of the file being run, the widget keeps the last MAX_LINES lines
+class RunPanel(QWidget):
+    MAX_LINES = 10000
+    # Longer lines are wrapped into several blocks, a line never grows without bound
+    MAX_LINE_LENGTH = 4096
+    LONG_LINE = re.compile(f"[^\n]{{{MAX_LINE_LENGTH}}}")
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setUndoRedoEnabled(False)
+        self.output.setMaximumBlockCount(self.MAX_LINES)
+        self.output.setFont(QFont("Monospace", 10))
+        layout.addWidget(self.output)
+        
+        status_layout = QHBoxLayout()
+        self.status_label = QLabel()
+        status_layout.addWidget(self.status_label, 1)
+        
+        self.rerun_button = QPushButton("Run Again")
+        self.rerun_button.setEnabled(False)
+        status_layout.addWidget(self.rerun_button)
+        
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        status_layout.addWidget(self.stop_button)
+        layout.addLayout(status_layout)
+        
+        self.stderr_format = QTextCharFormat()
+        self.stderr_format.setForeground(QColor("#FF6B6B"))
+        self.stdout_format = QTextCharFormat()
+    
+    def set_running(self, running):
+        self.stop_button.setEnabled(running)
+        self.rerun_button.setEnabled(True)
+    
+    def clear(self):
+        self.output.clear()
+    
+    def append_output(self, batch):
+        bar = self.output.verticalScrollBar()
+        follow = bar.value() >= bar.maximum() - 1
+        document = self.output.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for is_error, text in batch:
+            # Output without line breaks goes on the last line until that is too long
+            first_line = text.find('\n')
+            if document.lastBlock().length() + (len(text) if first_line < 0 else first_line) > self.MAX_LINE_LENGTH:
+                text = '\n' + text
+            text = self.LONG_LINE.sub(lambda match: match.group() + '\n', text)
+            cursor.insertText(text, self.stderr_format if is_error else self.stdout_format)
+        cursor.endEditBlock()
+        if follow:
+            bar.setValue(bar.maximum())
+
+# An open document plus what saving, journaling and the cache need to know about it
+class Buffer:
+    def __init__(self, document, highlighter, path=None, newline=os.linesep, encoding='utf-8', bom=b''):
+        self.document = document
+        self.highlighter = highlighter
+        self.path = path
+        self.newline = newline
+        # Written back on save as the file was read
+        self.encoding = encoding
+        self.bom = bom
+        self.journal = None
+        # (mtime_ns, size) of the file when the document last matched it
+        self.disk_state = None
+        self.cursor_position = 0
+        self.scroll_position = 0
+        self.identifiers = IdentifierIndex(document)
+        # [(cursor over the marked text, message)] from the last lint, the cursors follow edits
+        self.diagnostics = []
+    
+    def record_disk_state(self):
+        try:
+            file_stat = os.stat(self.path)
+            self.disk_state = (file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            self.disk_state = None
+    
+    def matches_disk(self):
+        try:
+            file_stat = os.stat(self.path)
+        except OSError:
+            return False
+        return self.disk_state == (file_stat.st_mtime_ns, file_stat.st_size)
+    
+    def memory_size(self):
+        # UTF-16 text plus block, layout and format data, roughly
+        return self.document.characterCount() * 4
+    
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.identifiers.close()
+        self.document.deleteLater()
+
+# Documents of recently opened files, least recently used evicted first
+class DocumentCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.buffers = OrderedDict()
+    
+    def get(self, path):
+        buffer = self.buffers.get(path)
+        if buffer is not None:
+            self.buffers.move_to_end(path)
+        return buffer
+    
+    def put(self, buffer):
+        self.buffers[buffer.path] = buffer
+        self.buffers.move_to_end(buffer.path)
+    
+    def remove(self, path):
+        return self.buffers.pop(path, None)
+    
+    def memory_size(self):
+        return sum(buffer.memory_size() for buffer in self.buffers.values())
+    
+    def evict(self, keep=()):
+        # Returns the evicted buffers, the caller closes them. Modified
+        # buffers are never evicted, that would throw unsaved edits away
+        evicted = []
+        size = self.memory_size()
+        for path, buffer in list(self.buffers.items()):
+            if size <= self.budget:
+                break
+            if buffer in keep or buffer.document.isModified():
+                continue
+            size -= buffer.memory_size()
+            del self.buffers[path]
+            evicted.append(buffer)
+        return evicted
+
+# Main application window
+class CodeNotepad(QMainWindow):
+    # Seconds per event loop pass spent inserting loaded text into the editor
+    CHUNK_TIME_BUDGET = 0.03
+    # Watching every directory of a huge tree would exhaust inotify watches,
+    # directories past this many are only watched once they are expanded
+    MAX_WATCHED_DIRECTORIES = 4096
+    WORKSPACE_RESCAN_DELAY_MS = 200
+    # Quiet time after a workspace change before the quick open index is rebuilt
+    PATH_INDEX_DELAY_MS = 1000
+    # Pause in typing before the find bar searches again
+    FIND_DELAY_MS = 150
+    # Extra selections are only made for what is on screen, this bounds a very dense screen
+    MAX_VISIBLE_MATCHES = 2000
+    # Quiet time before the outline is parsed again after typing, and the workspace symbols after changes
+    OUTLINE_DELAY_MS = 500
+    SYMBOL_INDEX_DELAY_MS = 1000
+    # Outlines kept by content digest, switching back to a document needs no parse
+    OUTLINE_CACHE_SIZE = 32
+    PYTHON_EXTENSIONS = ('.py', '.pyw')
+    # Shares left from the last session are resumed this long after start up
+    TELEGRAM_RESUME_DELAY_MS = 2000
+    # With instrumentation on: how often the event loop is probed for lag, and the readout refreshed
+    LOOP_PROBE_INTERVAL_MS = 50
+    READOUT_INTERVAL_MS = 1000
+    LAG_TRACE_NS = 1000000
+    # Saves in quick succession are linted once, diagnostics are kept by content digest
+    LINT_DELAY_MS = 300
+    LINT_CACHE_SIZE = 64
+    # AI actions: (title, system prompt)
+    AI_ACTIONS = {
+        "explain": ("Explain", "Explain what the following code does, step by step, "
+                               "for a reader who has not seen it before."),
+        "refactor": ("Refactor", "Refactor the following code for readability without changing its behaviour. "
+                                 "Reply with the code only, without Markdown fences or explanations."),
+        "summarize": ("Summarize", "Summarize the following text in a few sentences."),
+    }
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Accurate Code Pad")
+        self.setGeometry(100, 100, 1200, 800)
+        
+        # Apply red and yellow theme
+        self.apply_theme()
+        mark_startup("theme")
+        
+        # Initialize variables
+        self.current_file = None
+        self.file_list = []
+        self.buffer = None
+        self.loading_buffer = None
+        self.loader = None
+        self.saver = None
+        self.queued_save = None
+        self.workspace_scanner = None
+        self.workspace_model = None
+        self.workspace_watcher = None
+        self.changed_directories = set()
+        self.workspace_timer = QTimer(self)
+        self.workspace_timer.setSingleShot(True)
+        self.workspace_timer.setInterval(self.WORKSPACE_RESCAN_DELAY_MS)
+        self.workspace_timer.timeout.connect(self.rescan_changed_directories)
+        self.path_index = None
+        self.path_index_builder = None
+        self.workspace_scan_done = False
+        self.process_pool = None
+        self.symbol_table = SymbolTable()
+        self.symbol_indexer = None
+        self.symbol_index_timer = QTimer(self)
+        self.symbol_index_timer.setSingleShot(True)
+        self.symbol_index_timer.setInterval(self.SYMBOL_INDEX_DELAY_MS)
+        self.symbol_index_timer.timeout.connect(self.start_symbol_index)
+        self.outline_parser = None
+        self.replacer = None
+        self.outline_digest = None
+        self.outline_symbols = []
+        self.outline_cache = OrderedDict()
+        self.outline_timer = QTimer(self)
+        self.outline_timer.setSingleShot(True)
+        self.outline_timer.setInterval(self.OUTLINE_DELAY_MS)
+        self.outline_timer.timeout.connect(self.update_outline)
+        self.file_search = None
+        self.find_in_files_root = None
+        # Started on the first AI action
+        self.ai_client = None
+        self.ai_request = None
+        self.response_cache = None
+        # Started on the first share, or to resume shares left from the last session
+        self.telegram_queue = None
+        self.export = None
+        # Line to show once the file being loaded is in the editor
+        self.pending_line = None
+        self.document_search = DocumentSearch(self)
+        self.document_search.matches_changed.connect(self.on_find_matches_changed)
+        self.find_timer = QTimer(self)
+        self.find_timer.setSingleShot(True)
+        self.find_timer.setInterval(self.FIND_DELAY_MS)
+        self.find_timer.timeout.connect(self.update_find_pattern)
+        # Repainting the match highlights waits for the event loop, scrolling fires often
+        self.find_selection_timer = QTimer(self)
+        self.find_selection_timer.setSingleShot(True)
+        self.find_selection_timer.setInterval(0)
+        self.find_selection_timer.timeout.connect(self.update_extra_selections)
+        self.find_format = QTextCharFormat()
+        self.find_format.setBackground(QColor("#8B6914"))
+        self.path_index_timer = QTimer(self)
+        self.path_index_timer.setSingleShot(True)
+        self.path_index_timer.setInterval(self.PATH_INDEX_DELAY_MS)
+        self.path_index_timer.timeout.connect(self.rebuild_path_index)
+        self.loader_done = False
+        self.pending_chunks = deque()
+        self.chunk_timer = QTimer(self)
+        self.chunk_timer.setInterval(0)
+        self.chunk_timer.timeout.connect(self.insert_pending_chunks)
+        # Only run while instrumentation is on
+        self.loop_timer = QTimer(self)
+        self.loop_timer.setTimerType(Qt.PreciseTimer)
+        self.loop_timer.setInterval(self.LOOP_PROBE_INTERVAL_MS)
+        self.loop_timer.timeout.connect(self.probe_event_loop)
+        self.loop_expected = 0
+        self.loop_lag_max = 0
+        self.readout_timer = QTimer(self)
+        self.readout_timer.setInterval(self.READOUT_INTERVAL_MS)
+        self.readout_timer.timeout.connect(self.update_performance_readout)
+        # The buffer to run once its save is done, the file last run and whether to run it
+        # again once the running one has stopped
+        self.run_after_save = None
+        self.run_path = None
+        self.rerun_pending = False
+        # Started on the first lint
+        self.lint_runner = None
+        # path -> running LintJob, and path -> (buffer, saved text, revision) waiting for the delay
+        self.lint_jobs = {}
+        self.lint_queue = OrderedDict()
+        self.lint_cache = OrderedDict()
+        # Whether the default linter is installed, looked up on the first save
+        self.default_linter_found = None
+        self.lint_timer = QTimer(self)
+        self.lint_timer.setSingleShot(True)
+        self.lint_timer.setInterval(self.LINT_DELAY_MS)
+        self.lint_timer.timeout.connect(self.run_lints)
+        self.lint_format = QTextCharFormat()
+        self.lint_format.setUnderlineStyle(QTextCharFormat.SpellCheckUnderline)
+        self.lint_format.setUnderlineColor(QColor("#FF5555"))
+        
+        # Setup UI
+        self.setup_ui()
+        mark_startup("widgets")
+        
+        # Load settings
+        # Same store the settings dialog writes to
+        self.settings = open_settings()
+        
+        # Update editor settings
+        self.update_editor_settings()
+        
+        # Documents stay open after switching away, up to a memory budget
+        self.document_cache = DocumentCache(self.settings.value("document_cache_mb", 256, type=int) * 1024 * 1024)
+        
+        # Journal unsaved edits and restore what a crashed session left behind
+        try:
+            self.journal_session = JournalSession()
+        except OSError as e:
+            self.journal_session = None
+            self.status_bar.showMessage(f"Crash recovery disabled: {str(e)}")
+        mark_startup("settings and journal")
+        
+        # Start with an empty untitled buffer, each buffer has its own highlighter
+        self.show_buffer(self.create_buffer())
+        self.start_journal(self.buffer)
+        QTimer.singleShot(0, self.recover_buffers)
+        QTimer.singleShot(self.TELEGRAM_RESUME_DELAY_MS, self.resume_telegram_queue)
+        mark_startup("first buffer")
+    
+    def apply_theme(self):
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #2B2B2B;
+            }
+            QMenuBar {
+                background-color: #8B0000;
+                color: #FFD700;
+            }
+            QMenuBar::item:selected {
+                background-color: #FF0000;
+            }
+            QMenu {
+                background-color: #8B0000;
+                color: #FFD700;
+                border: 1px solid #FF0000;
+            }
+            QMenu::item:selected {
+                background-color: #FF0000;
+            }
+            QToolBar {
+                background-color: #8B0000;
+                border: none;
+            }
+            QToolButton {
+                background-color: #8B0000;
+                color: #FFD700;
+                border: none;
+                padding: 5px;
+            }
+            QToolButton:hover {
+                background-color: #FF0000;
+            }
+            QStatusBar {
+                background-color: #8B0000;
+                color: #FFD700;
+            }
+            QTextEdit, QPlainTextEdit {
+                background-color: #1E1E1E;
+                color: #FFFFFF;
+                selection-background-color: #FF6B6B;
+            }
+            QListWidget, QTreeView {
+                background-color: #1E1E1E;
+                color: #FFFFFF;
+                border: none;
+            }
+            QListWidget::item:selected, QTreeView::item:selected {
+                background-color: #FF6B6B;
+                color: #000000;
+            }
+            QSplitter::handle {
+                background-color: #8B0000;
+            }
+            QDialog {
+                background-color: #2B2B2B;
+            }
+            QGroupBox {
+                color: #FFD700;
+                font-weight: bold;
+                border: 1px solid #FF6B6B;
+                border-radius: 5px;
+                margin-top: 1ex;
+            }
+            QGroupBox::title {
+                subcontrol-origin: margin;
+                subcontrol-position: top center;
+                padding: 0 5px;
+            }
+            QLabel {
+                color: #FFD700;
+            }
+            QLineEdit {
+                background-color: #1E1E1E;
+                color: #FFFFFF;
+                border: 1px solid #FF6B6B;
+                padding: 5px;
+            }
+            QPushButton {
+                background-color: #8B0000;
+                color: #FFD700;
+                border: none;
+                padding: 5px 10px;
+            }
+            QPushButton:hover {
+                background-color: #FF0000;
+            }
+            QComboBox {
+                background-color: #1E1E1E;
+                color: #FFFFFF;
+                border: 1px solid #FF6B6B;
+                padding: 5px;
+            }
+            QSpinBox {
+                background-color: #1E1E1E;
+                color: #FFFFFF;
+                border: 1px solid #FF6B6B;
+                padding: 5px;
+            }
+            QCheckBox {
+                color: #FFD700;
+            }
+            QTabWidget::pane {
+                border: 1px solid #FF6B6B;
+                background-color: #2B2B2B;
+            }
+            QTabBar::tab {
+                background-color: #8B0000;
+                color: #FFD700;
+                padding: 8px;
+                border-top-left-radius: 4px;
+                border-top-right-radius: 4px;
+            }
+            QTabBar::tab:selected {
+                background-color: #FF0000;
+            }
+        """)
+    
+    def setup_ui(self):
+        # Central widget
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        # Main layout
+        main_layout = QHBoxLayout(central_widget)
+        
+        # Splitter for sidebar and editor
+        splitter = QSplitter(Qt.Horizontal)
+        
+        # Sidebar with the opened files and the workspace folder
+        self.sidebar_tabs = QTabWidget()
+        self.sidebar_tabs.setMaximumWidth(250)
+        
+        # Sidebar for file list
+        self.sidebar = QListWidget()
+        self.sidebar.itemDoubleClicked.connect(self.open_file_from_list)
+        self.sidebar_tabs.addTab(self.sidebar, "Open Files")
+        
+        # Workspace tree, filled once a folder is opened
+        self.workspace_view = QTreeView()
+        self.workspace_view.setHeaderHidden(True)
+        self.workspace_view.setUniformRowHeights(True)
+        self.workspace_view.doubleClicked.connect(self.open_file_from_workspace)
+        self.workspace_view.expanded.connect(self.on_workspace_expanded)
+        self.sidebar_tabs.addTab(self.workspace_view, "Workspace")
+        splitter.addWidget(self.sidebar_tabs)
+        
+        # Editor area
+        editor_widget = QWidget()
+        editor_layout = QVBoxLayout(editor_widget)
+        
+        # Text editor, swapped for the read-only viewer when a file is too large to load
+        self.editor_stack = QStackedWidget()
+        self.editor = CodeEditor()
+        self.editor_stack.addWidget(self.editor)
+        
+        self.large_view = LargeFileView()
+        self.large_view.line_count_changed.connect(self.on_large_file_indexed)
+        self.editor_stack.addWidget(self.large_view)
+        editor_layout.addWidget(self.editor_stack)
+        self.autocompleter = Autocompleter(self.editor, self)
+        
+        self.find_bar = FindBar()
+        self.find_bar.find_edit.textChanged.connect(lambda text: self.find_timer.start())
+        self.find_bar.regex_check.toggled.connect(lambda checked: self.find_timer.start())
+        self.find_bar.case_check.toggled.connect(lambda checked: self.find_timer.start())
+        self.find_bar.find_edit.returnPressed.connect(self.find_next)
+        self.find_bar.next_button.clicked.connect(self.find_next)
+        self.find_bar.previous_button.clicked.connect(self.find_previous)
+        self.find_bar.replace_button.clicked.connect(self.replace_match)
+        self.find_bar.replace_all_button.clicked.connect(self.replace_all)
+        self.find_bar.closed.connect(self.on_find_bar_closed)
+        self.find_bar.hide()
+        editor_layout.addWidget(self.find_bar)
+        self.editor.verticalScrollBar().valueChanged.connect(lambda value: self.find_selection_timer.start())
+        self.editor.verticalScrollBar().rangeChanged.connect(lambda minimum, maximum: self.find_selection_timer.start())
+        
+        splitter.addWidget(editor_widget)
         splitter.setSizes([200, 1000])
         
         main_layout.addWidget(splitter)
         
+        # Find in files results, docked below the editor
+        self.find_in_files_panel = FindInFilesPanel()
+        self.find_in_files_panel.search_button.clicked.connect(self.toggle_find_in_files)
+        self.find_in_files_panel.results_tree.itemActivated.connect(self.open_find_result)
+        self.find_in_files_dock = QDockWidget("Find in Files", self)
+        self.find_in_files_dock.setWidget(self.find_in_files_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.find_in_files_dock)
+        self.find_in_files_dock.hide()
+        
+        # Classes and functions of the current document
+        self.outline_tree = QTreeWidget()
+        self.outline_tree.setHeaderHidden(True)
+        self.outline_tree.setUniformRowHeights(True)
+        self.outline_tree.itemActivated.connect(self.open_outline_item)
+        self.outline_dock = QDockWidget("Outline", self)
+        self.outline_dock.setWidget(self.outline_tree)
+        self.outline_dock.visibilityChanged.connect(lambda visible: self.update_outline() if visible else None)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.outline_dock)
+        self.outline_dock.hide()
+        
+        # Explanations and summaries of the selection
+        self.ai_panel = AiPanel()
+        self.ai_panel.stop_button.clicked.connect(self.stop_ai_request)
+        self.ai_dock = QDockWidget("AI Assistant", self)
+        self.ai_dock.setWidget(self.ai_panel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.ai_dock)
+        self.ai_dock.hide()
+        
+        # Output of the file being run
+        self.run_panel = RunPanel()
+        self.run_panel.stop_button.clicked.connect(self.stop_run)
+        self.run_panel.rerun_button.clicked.connect(self.rerun_file)
+        self.run_dock = QDockWidget("Run", self)
+        self.run_dock.setWidget(self.run_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.run_dock)
+        self.run_dock.hide()
+        self.runner = ProcessRunner(self)
+        self.runner.output_ready.connect(self.run_panel.append_output)
+        self.runner.run_finished.connect(self.on_run_finished)
+        self.editor.textChanged.connect(self.on_editor_text_changed)
+        
         # Setup menu bar
         self.setup_menu_bar()
         
@@ -356,6 +4513,21 @@ class CodeNotepad(QMainWindow):
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Ready")
+        
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.setRange(0, 100)
+        self.load_progress.hide()
+        self.status_bar.addPermanentWidget(self.load_progress)
+        
+        self.cancel_load_button = QPushButton("Cancel")
+        self.cancel_load_button.clicked.connect(self.cancel_loading)
+        self.cancel_load_button.hide()
+        self.status_bar.addPermanentWidget(self.cancel_load_button)
+        
+        self.performance_label = QLabel()
+        self.performance_label.hide()
+        self.status_bar.addPermanentWidget(self.performance_label)
     
     def setup_menu_bar(self):
         menubar = self.menuBar()
@@ -373,6 +4545,16 @@ class CodeNotepad(QMainWindow):
         open_action.triggered.connect(self.open_file)
         file_menu.addAction(open_action)
         
+        open_folder_action = QAction("Open Folder", self)
+        open_folder_action.setShortcut("Ctrl+Shift+O")
+        open_folder_action.triggered.connect(self.open_folder)
+        file_menu.addAction(open_folder_action)
+        
+        quick_open_action = QAction("Quick Open", self)
+        quick_open_action.setShortcut("Ctrl+E")
+        quick_open_action.triggered.connect(self.quick_open)
+        file_menu.addAction(quick_open_action)
+        
         save_action = QAction("Save", self)
         save_action.setShortcut("Ctrl+S")
         save_action.triggered.connect(self.save_file)
@@ -383,6 +4565,10 @@ class CodeNotepad(QMainWindow):
         save_as_action.triggered.connect(self.save_as_file)
         file_menu.addAction(save_as_action)
         
+        cancel_load_action = QAction("Cancel Loading", self)
+        cancel_load_action.triggered.connect(self.cancel_loading)
+        file_menu.addAction(cancel_load_action)
+        
         file_menu.addSeparator()
         
         print_action = QAction("Print", self)
@@ -390,6 +4576,25 @@ class CodeNotepad(QMainWindow):
         print_action.triggered.connect(self.print_file)
         file_menu.addAction(print_action)
         
+        export_menu = file_menu.addMenu("Export")
+        for format_name in EXPORT_FORMATS:
+            export_action = QAction(f"{format_name}...", self)
+            export_action.triggered.connect(lambda checked, name=format_name: self.export_file(name))
+            export_menu.addAction(export_action)
+        export_menu.addSeparator()
+        cancel_export_action = QAction("Cancel Export", self)
+        cancel_export_action.triggered.connect(self.stop_export)
+        export_menu.addAction(cancel_export_action)
+        
+        share_selection_action = QAction("Share Selection to Telegram", self)
+        share_selection_action.setShortcut("Ctrl+Alt+T")
+        share_selection_action.triggered.connect(self.share_selection)
+        file_menu.addAction(share_selection_action)
+        
+        share_file_action = QAction("Share File to Telegram", self)
+        share_file_action.triggered.connect(self.share_file)
+        file_menu.addAction(share_file_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("Exit", self)
@@ -427,6 +4632,38 @@ class CodeNotepad(QMainWindow):
         paste_action.triggered.connect(self.editor.paste)
         edit_menu.addAction(paste_action)
         
+        edit_menu.addSeparator()
+        
+        find_action = QAction("Find", self)
+        find_action.setShortcut("Ctrl+F")
+        find_action.triggered.connect(self.find_text)
+        edit_menu.addAction(find_action)
+        
+        find_next_action = QAction("Find Next", self)
+        find_next_action.setShortcut("F3")
+        find_next_action.triggered.connect(self.find_next)
+        edit_menu.addAction(find_next_action)
+        
+        find_previous_action = QAction("Find Previous", self)
+        find_previous_action.setShortcut("Shift+F3")
+        find_previous_action.triggered.connect(self.find_previous)
+        edit_menu.addAction(find_previous_action)
+        
+        find_in_files_action = QAction("Find in Files", self)
+        find_in_files_action.setShortcut("Ctrl+Shift+F")
+        find_in_files_action.triggered.connect(self.show_find_in_files)
+        edit_menu.addAction(find_in_files_action)
+        
+        go_to_line_action = QAction("Go to Line", self)
+        go_to_line_action.setShortcut("Ctrl+G")
+        go_to_line_action.triggered.connect(self.go_to_line)
+        edit_menu.addAction(go_to_line_action)
+        
+        go_to_definition_action = QAction("Go to Definition", self)
+        go_to_definition_action.setShortcut("F12")
+        go_to_definition_action.triggered.connect(self.go_to_definition)
+        edit_menu.addAction(go_to_definition_action)
+        
         # View menu
         view_menu = menubar.addMenu("View")
         
@@ -440,6 +4677,66 @@ class CodeNotepad(QMainWindow):
         zoom_out_action.triggered.connect(self.zoom_out)
         view_menu.addAction(zoom_out_action)
         
+        view_menu.addSeparator()
+        
+        outline_action = self.outline_dock.toggleViewAction()
+        outline_action.setShortcut("Ctrl+Shift+L")
+        view_menu.addAction(outline_action)
+        view_menu.addAction(self.ai_dock.toggleViewAction())
+        view_menu.addAction(self.run_dock.toggleViewAction())
+        
+        view_menu.addSeparator()
+        
+        export_trace_action = QAction("Export Performance Trace...", self)
+        export_trace_action.triggered.connect(self.export_performance_trace)
+        view_menu.addAction(export_trace_action)
+        
+        reset_timings_action = QAction("Reset Performance Timings", self)
+        reset_timings_action.triggered.connect(self.reset_performance_timings)
+        view_menu.addAction(reset_timings_action)
+        
+        # Run menu
+        run_menu = menubar.addMenu("Run")
+        
+        run_file_action = QAction("Run File", self)
+        run_file_action.setShortcut("F5")
+        run_file_action.triggered.connect(self.run_current_file)
+        run_menu.addAction(run_file_action)
+        
+        rerun_action = QAction("Run Again", self)
+        rerun_action.setShortcut("Ctrl+F5")
+        rerun_action.triggered.connect(self.rerun_file)
+        run_menu.addAction(rerun_action)
+        
+        stop_run_action = QAction("Stop", self)
+        stop_run_action.setShortcut("Shift+F5")
+        stop_run_action.triggered.connect(self.stop_run)
+        run_menu.addAction(stop_run_action)
+        
+        # AI menu, each action works on the selection or the whole document
+        ai_menu = menubar.addMenu("AI")
+        
+        explain_action = QAction("Explain Selection", self)
+        explain_action.setShortcut("Ctrl+Alt+E")
+        explain_action.triggered.connect(lambda: self.run_ai_action("explain"))
+        ai_menu.addAction(explain_action)
+        
+        refactor_action = QAction("Refactor Selection", self)
+        refactor_action.setShortcut("Ctrl+Alt+R")
+        refactor_action.triggered.connect(lambda: self.run_ai_action("refactor"))
+        ai_menu.addAction(refactor_action)
+        
+        summarize_action = QAction("Summarize Selection", self)
+        summarize_action.setShortcut("Ctrl+Alt+S")
+        summarize_action.triggered.connect(lambda: self.run_ai_action("summarize"))
+        ai_menu.addAction(summarize_action)
+        
+        ai_menu.addSeparator()
+        
+        stop_ai_action = QAction("Stop AI Request", self)
+        stop_ai_action.triggered.connect(self.stop_ai_request)
+        ai_menu.addAction(stop_ai_action)
+        
         # Settings menu
         settings_menu = menubar.addMenu("Settings")
         
@@ -490,19 +4787,452 @@ class CodeNotepad(QMainWindow):
         toolbar.addAction(paste_action)
     
     def update_editor_settings(self):
+        start = time.perf_counter_ns()
         # Set font
         font_size = self.settings.value("font_size", 12, type=int)
         font = QFont("Monospace", font_size)
         self.editor.setFont(font)
+        self.large_view.setFont(font)
         
         # Set tab width
         tab_width = self.settings.value("tab_width", 4, type=int)
-        self.editor.setTabStopDistance(tab_width * self.editor.fontMetrics().width(' '))
+        self.tab_stop_distance = tab_width * self.editor.fontMetrics().width(' ')
+        self.editor.setTabStopDistance(self.tab_stop_distance)
+        
+        self.editor.set_line_numbers_visible(self.settings.value("line_numbers", True, type=bool))
+        
+        self.set_instrumentation(self.settings.value("instrumentation", False, type=bool))
+        INSTRUMENTATION.record("update_editor_settings", start)
+    
+    def set_instrumentation(self, enabled):
+        if enabled == INSTRUMENTATION.enabled:
+            return
+        INSTRUMENTATION.enabled = enabled
+        self.performance_label.setVisible(enabled)
+        if enabled:
+            self.loop_expected = time.perf_counter_ns() + self.LOOP_PROBE_INTERVAL_MS * 1000000
+            self.loop_lag_max = 0
+            self.loop_timer.start()
+            self.readout_timer.start()
+            self.update_performance_readout()
+        else:
+            self.loop_timer.stop()
+            self.readout_timer.stop()
+    
+    def probe_event_loop(self):
+        # However late this timer fires is how long the event loop was busy elsewhere
+        now = time.perf_counter_ns()
+        lag = max(0, now - self.loop_expected)
+        self.loop_expected = now + self.LOOP_PROBE_INTERVAL_MS * 1000000
+        self.loop_lag_max = max(self.loop_lag_max, lag)
+        # Only stalls are worth a span in the trace
+        INSTRUMENTATION.record("event loop lag", now - lag, now, trace=lag >= self.LAG_TRACE_NS)
+    
+    def update_performance_readout(self):
+        INSTRUMENTATION.fold()
+        histograms = INSTRUMENTATION.histograms
+        parts = [f"Lag {format_duration(self.loop_lag_max)}"]
+        self.loop_lag_max = 0
+        for name, label in (("highlightBlock", "Highlight"), ("paint", "Paint")):
+            if name in histograms:
+                parts.append(f"{label} p95 {format_duration(histograms[name].percentile(0.95))}")
+        self.performance_label.setText(" | ".join(parts))
+        
+        rows = [f"{name}: {histogram.count:,} calls, p50 {format_duration(histogram.percentile(0.5))}, "
+                f"p95 {format_duration(histogram.percentile(0.95))}, p99 {format_duration(histogram.percentile(0.99))}, "
+                f"max {format_duration(histogram.max)}"
+                for name, histogram in sorted(histograms.items())]
+        self.performance_label.setToolTip("\n".join(rows))
+    
+    def export_performance_trace(self):
+        import json
+        if not INSTRUMENTATION.events:
+            self.status_bar.showMessage("No timings recorded, turn on Record Performance Timings in Preferences")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Performance Trace", "codepad-trace.json",
+                                                   "Trace Files (*.json);;All Files (*)")
+        if not file_path:
+            return
+        temp_path = None
+        try:
+            file, temp_path = open_export_temp(file_path)
+            with file:
+                json.dump(INSTRUMENTATION.trace(), file)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            if temp_path is not None:
+                discard_export_temp(temp_path)
+            QMessageBox.critical(self, "Error", f"Could not export trace: {str(e)}")
+            return
+        self.status_bar.showMessage(f"Exported {len(INSTRUMENTATION.events):,} spans to {file_path}")
+    
+    def reset_performance_timings(self):
+        INSTRUMENTATION.reset()
+        self.loop_lag_max = 0
+        if INSTRUMENTATION.enabled:
+            self.update_performance_readout()
+        self.status_bar.showMessage("Performance timings reset")
+    
+    def create_buffer(self, path=None, newline=os.linesep, encoding='utf-8', bom=b''):
+        document = QTextDocument(self)
+        # The plain text editor only takes documents with the block layout
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        return Buffer(document, PythonHighlighter(document), path, newline, encoding, bom)
+    
+    def show_buffer(self, buffer):
+        # Swap documents instead of reloading, keeping undo history, layout and highlighting
+        if self.buffer is not None and self.buffer is not buffer:
+            self.buffer.cursor_position = self.editor.textCursor().position()
+            self.buffer.scroll_position = self.editor.verticalScrollBar().value()
+        
+        self.buffer = buffer
+        document = buffer.document
+        if document.defaultFont() != self.editor.font():
+            document.setDefaultFont(self.editor.font())
+        self.editor.setDocument(document)
+        self.editor.setTabStopDistance(self.tab_stop_distance)
+        
+        cursor = QTextCursor(document)
+        cursor.setPosition(min(buffer.cursor_position, document.characterCount() - 1))
+        self.editor.setTextCursor(cursor)
+        self.editor.verticalScrollBar().setValue(buffer.scroll_position)
+        
+        self.current_file = buffer.path
+        self.setWindowTitle(f"Code Notepad - {buffer.path or 'New File'}")
+        self.autocompleter.set_identifiers(buffer.identifiers)
+        self.editor.diagnostics = buffer.diagnostics
+        self.find_selection_timer.start()
+        if self.find_bar.isVisible():
+            self.update_find_pattern()
+        self.update_outline()
+    
+    def release_buffer(self):
+        # Untitled buffers are not cached, replacing one discards it as before
+        if self.buffer is not None and self.buffer.path is None:
+            buffer, self.buffer = self.buffer, None
+            buffer.close()
+    
+    def cache_buffer(self, buffer):
+        self.document_cache.put(buffer)
+        keep = {self.buffer, self.loading_buffer}
+        if self.saver is not None:
+            keep.add(self.saver.buffer)
+        for evicted in self.document_cache.evict(keep):
+            evicted.close()
+    
+    def open_buffers(self):
+        buffers = list(self.document_cache.buffers.values())
+        for buffer in (self.buffer, self.loading_buffer):
+            if buffer is not None and buffer not in buffers:
+                buffers.append(buffer)
+        return buffers
+    
+    def is_large_file(self, file_path):
+        threshold = self.settings.value("large_file_threshold_mb", 64, type=int) * 1024 * 1024
+        return os.path.getsize(file_path) >= threshold
+    
+    def in_large_file_mode(self):
+        return self.editor_stack.currentWidget() is self.large_view
+    
+    def show_editor(self):
+        if self.in_large_file_mode():
+            self.large_view.close_file()
+            self.editor_stack.setCurrentWidget(self.editor)
+    
+    def open_large_file(self, file_path, probe=None):
+        # Memory-map the file and index it in the background instead of loading it
+        probe = probe or FileProbe(file_path)
+        # Lines are found by their b'\n' bytes, which UTF-16 and UTF-32 do not have on their own
+        hex_view = probe.binary or probe.encoding.startswith(('utf-16', 'utf-32'))
+        try:
+            if hex_view:
+                self.large_view.open(file_path, hex_view=True)
+            else:
+                self.large_view.open(file_path, probe.encoding, probe.bom)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            return
+        
+        self.editor_stack.setCurrentWidget(self.large_view)
+        self.large_view.setFocus()
+        self.current_file = file_path
+        self.setWindowTitle(f"Code Notepad - {file_path} [{'binary' if probe.binary else 'read-only'}]")
+        
+        # Add to file list if not already there
+        if file_path not in self.file_list:
+            self.file_list.append(file_path)
+            self.sidebar.addItem(file_path)
+        
+        if probe.binary:
+            self.status_bar.showMessage(f"Opened {file_path} as binary in hex view (read-only)")
+        elif hex_view:
+            self.status_bar.showMessage(f"Opened {file_path} ({probe.description()}) in hex view (read-only)")
+        else:
+            self.status_bar.showMessage(f"Opened {file_path} ({probe.description()}) in large file mode (read-only)")
+    
+    def on_large_file_indexed(self, line_count):
+        if self.large_view.is_indexed():
+            self.status_bar.showMessage(f"Indexed {line_count:,} lines of {self.large_view.path}")
+        else:
+            self.status_bar.showMessage(f"Indexing {self.large_view.path}... {line_count:,} lines")
+    
+    def start_journal(self, buffer):
+        self.stop_journal(buffer)
+        if self.journal_session is None:
+            return
+        try:
+            buffer.journal = self.journal_session.create(buffer.document, buffer.path, buffer.newline,
+                                                         buffer.encoding, buffer.bom, self)
+        except OSError as e:
+            self.status_bar.showMessage(f"Could not start the edit journal: {str(e)}")
+    
+    def stop_journal(self, buffer):
+        if buffer.journal is not None:
+            buffer.journal.close()
+            buffer.journal = None
+    
+    def recover_buffers(self):
+        if self.journal_session is None:
+            return
+        
+        recovered, errors = self.journal_session.recover()
+        if errors:
+            QMessageBox.warning(self, "Crash Recovery", "Some unsaved changes could not be recovered:\n" + "\n".join(errors))
+        if not recovered:
+            return
+        
+        names = "\n".join(file_path or "Untitled" for file_path, *_ in recovered)
+        answer = QMessageBox.question(self, "Crash Recovery",
+                                      f"Accurate Code Pad did not shut down cleanly. Restore unsaved changes to:\n{names}")
+        if answer != QMessageBox.Yes:
+            return
+        
+        self.cancel_loading()
+        self.show_editor()
+        restored = []
+        for file_path, text, newline, encoding, bom in recovered:
+            if file_path is None and any(buffer.path is None for buffer in restored):
+                # Only one untitled buffer can be open
+                continue
+            if file_path is not None and self.document_cache.get(file_path) is not None:
+                continue
+            
+            buffer = self.create_buffer(file_path, newline, encoding, bom)
+            buffer.document.setPlainText(text)
+            buffer.document.setModified(True)
+            self.start_journal(buffer)
+            if buffer.journal is not None:
+                # The buffer differs from the file on disk, so the journal starts from a snapshot
+                buffer.journal.compact()
+            
+            if file_path is not None:
+                buffer.record_disk_state()
+                self.cache_buffer(buffer)
+                # Add to file list if not already there
+                if file_path not in self.file_list:
+                    self.file_list.append(file_path)
+                    self.sidebar.addItem(file_path)
+            restored.append(buffer)
+        
+        # Recovered journals are newest first, show the most recent buffer
+        self.release_buffer()
+        self.show_buffer(restored[0])
+        self.setWindowTitle(f"Code Notepad - {restored[0].path or 'New File'} [recovered]")
+        self.status_bar.showMessage(f"Recovered unsaved changes to {len(restored)} file(s)")
+    
+    def open_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if folder:
+            self.open_workspace(folder)
+    
+    def open_workspace(self, folder):
+        self.close_workspace()
+        folder = os.path.abspath(folder)
+        
+        self.workspace_model = WorkspaceModel(folder, self)
+        self.workspace_view.setModel(self.workspace_model)
+        self.workspace_watcher = QFileSystemWatcher(self)
+        self.workspace_watcher.directoryChanged.connect(self.on_workspace_directory_changed)
+        self.workspace_scanner = WorkspaceScanner(folder, self)
+        self.workspace_scanner.scanned.connect(self.on_workspace_scanned)
+        self.workspace_scanner.scan_finished.connect(self.on_workspace_scan_finished)
+        self.workspace_scanner.start()
+        # Quick open works from the last session's index until the scan has caught up
+        self.workspace_scan_done = False
+        self.start_path_index_builder(PathIndexBuilder(folder, parent=self))
+        
+        self.sidebar_tabs.setCurrentWidget(self.workspace_view)
+        self.status_bar.showMessage(f"Scanning {folder}...")
+    
+    def close_workspace(self):
+        if self.workspace_scanner is not None:
+            self.workspace_scanner.stop()
+            self.workspace_scanner.wait()
+            self.workspace_scanner.deleteLater()
+            self.workspace_scanner = None
+        if self.workspace_watcher is not None:
+            self.workspace_watcher.deleteLater()
+            self.workspace_watcher = None
+        self.workspace_timer.stop()
+        self.changed_directories.clear()
+        self.path_index_timer.stop()
+        if self.path_index_builder is not None:
+            # Let a save in progress complete, the index is not discarded with the workspace
+            self.path_index_builder.wait()
+            self.path_index_builder.deleteLater()
+            self.path_index_builder = None
+        self.path_index = None
+        self.symbol_index_timer.stop()
+        if self.symbol_indexer is not None:
+            self.symbol_indexer.requestInterruption()
+            self.symbol_indexer.wait()
+            self.symbol_indexer.deleteLater()
+            self.symbol_indexer = None
+        self.symbol_table = SymbolTable()
+        self.autocompleter.set_workspace_words({})
+        self.workspace_view.setModel(None)
+        if self.workspace_model is not None:
+            self.workspace_model.deleteLater()
+            self.workspace_model = None
+    
+    def on_workspace_scanned(self, listings):
+        if self.sender() is not self.workspace_scanner:
+            return
+        self.workspace_model.apply_listings(listings)
+        if self.workspace_scan_done:
+            self.path_index_timer.start()
+            self.symbol_index_timer.start()
+        
+        # Watch shallow directories first, the scanner lists them before their contents
+        room = self.MAX_WATCHED_DIRECTORIES - len(self.workspace_watcher.directories())
+        if room > 0:
+            paths = [self.workspace_scanner.absolute(relative_directory)
+                     for relative_directory, directories, _ in listings[:room] if directories is not None]
+            if paths:
+                self.workspace_watcher.addPaths(paths)
+    
+    def on_workspace_scan_finished(self, file_count, seconds):
+        if self.sender() is not self.workspace_scanner:
+            return
+        self.workspace_scan_done = True
+        self.rebuild_path_index()
+        self.start_symbol_index()
+        self.status_bar.showMessage(f"Workspace {self.workspace_scanner.root}: {file_count:,} files in {seconds:.1f} s")
+    
+    def rebuild_path_index(self):
+        if self.workspace_model is None:
+            return
+        if self.path_index_builder is not None:
+            # One build at a time, the next one starts when this one is done
+            self.path_index_timer.start()
+            return
+        paths = list(self.workspace_model.file_paths())
+        self.start_path_index_builder(PathIndexBuilder(self.workspace_model.root_path, paths, self))
+    
+    def start_path_index_builder(self, builder):
+        self.path_index_builder = builder
+        builder.built.connect(self.on_path_index_built)
+        builder.finished.connect(self.on_path_index_builder_finished)
+        builder.start()
+    
+    def on_path_index_built(self, index):
+        if self.sender() is not self.path_index_builder:
+            return
+        # A cached index never replaces one built from this session's scan
+        if self.sender().paths is not None or self.path_index is None:
+            self.path_index = index
+    
+    def on_path_index_builder_finished(self):
+        if self.sender() is self.path_index_builder:
+            self.path_index_builder.deleteLater()
+            self.path_index_builder = None
+    
+    def worker_pool(self):
+        # Shared by find in files and the symbol indexer, started on first use
+        if self.process_pool is None:
+            # Spawned rather than forked, a fork of a threaded Qt process is not safe
+            import concurrent.futures
+            import multiprocessing
+            self.process_pool = concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context('spawn'))
+        return self.process_pool
+    
+    def start_symbol_index(self):
+        if self.workspace_model is None or not self.workspace_scan_done:
+            return
+        if self.symbol_indexer is not None:
+            # One run at a time, the next one starts when this one is done
+            self.symbol_index_timer.start()
+            return
+        paths = [path for path in self.workspace_model.file_paths() if path.endswith(self.PYTHON_EXTENSIONS)]
+        self.symbol_table.retain(paths)
+        # The first run of a session starts from the cache saved by the last one
+        cache = dict(self.symbol_table.files) if self.symbol_table.files else None
+        self.symbol_indexer = SymbolIndexer(self.worker_pool(), self.workspace_model.root_path, paths, cache, self)
+        self.symbol_indexer.indexed.connect(self.on_symbols_indexed)
+        self.symbol_indexer.index_finished.connect(self.on_symbol_index_finished)
+        self.symbol_indexer.start()
+    
+    def on_symbols_indexed(self, entries):
+        if self.sender() is self.symbol_indexer:
+            self.symbol_table.update(entries)
+    
+    def on_symbol_index_finished(self, parsed, file_count, seconds):
+        indexer = self.sender()
+        if indexer is not self.symbol_indexer:
+            return
+        indexer.wait()
+        indexer.deleteLater()
+        self.symbol_indexer = None
+        self.autocompleter.set_workspace_words(
+            {name: len(locations) for name, locations in self.symbol_table.definitions.items()})
+        if parsed:
+            self.status_bar.showMessage(
+                f"Indexed symbols of {file_count:,} Python files ({parsed:,} parsed) in {seconds:.1f} s")
+    
+    def quick_open(self):
+        if self.path_index is None:
+            if self.workspace_model is None:
+                QMessageBox.information(self, "Quick Open", "Open a folder first")
+            else:
+                self.status_bar.showMessage("Workspace is still being indexed")
+            return
+        dialog = QuickOpenDialog(self.path_index, self)
+        if dialog.exec_() == QDialog.Accepted and dialog.selected_path:
+            self.load_file(os.path.join(self.path_index.root, *dialog.selected_path.split('/')))
+    
+    def on_workspace_expanded(self, index):
+        # Past the watch limit a directory is watched, and refreshed, once it is looked at
+        path = self.workspace_model.absolute_path(index)
+        if path not in self.workspace_watcher.directories():
+            self.workspace_watcher.addPath(path)
+            self.workspace_scanner.rescan(self.workspace_model.node(index).path)
+    
+    def on_workspace_directory_changed(self, path):
+        relative_directory = os.path.relpath(path, self.workspace_scanner.root)
+        self.changed_directories.add('' if relative_directory == '.' else relative_directory.replace(os.sep, '/'))
+        # Editors and build tools touch many files at once, coalesce them into one rescan per directory
+        self.workspace_timer.start()
+    
+    def rescan_changed_directories(self):
+        if self.workspace_scanner is None:
+            return
+        for relative_directory in sorted(self.changed_directories):
+            self.workspace_scanner.rescan(relative_directory)
+        self.changed_directories.clear()
+    
+    def open_file_from_workspace(self, index):
+        node = self.workspace_model.node(index)
+        if not node.is_dir:
+            self.load_file(self.workspace_model.absolute_path(index))
     
     def new_file(self):
-        self.editor.clear()
-        self.current_file = None
-        self.setWindowTitle("Code Notepad - New File")
+        self.cancel_loading()
+        self.show_editor()
+        self.release_buffer()
+        buffer = self.create_buffer()
+        self.show_buffer(buffer)
+        self.start_journal(buffer)
         self.status_bar.showMessage("New file created")
     
     def open_file(self):
@@ -511,73 +5241,1062 @@ class CodeNotepad(QMainWindow):
         )
         
         if file_path:
-            try:
-                with open(file_path, 'r') as file:
-                    content = file.read()
-                    self.editor.setPlainText(content)
-                    self.current_file = file_path
-                    self.setWindowTitle(f"Code Notepad - {file_path}")
-                    
-                    # Add to file list if not already there
-                    if file_path not in self.file_list:
-                        self.file_list.append(file_path)
-                        self.sidebar.addItem(file_path)
-                    
-                    self.status_bar.showMessage(f"Opened {file_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            self.load_file(file_path)
     
     def open_file_from_list(self, item):
-        file_path = item.text()
+        self.load_file(item.text())
+    
+    def load_file(self, file_path):
+        start = time.perf_counter_ns()
+        self.pending_line = None
         try:
-            with open(file_path, 'r') as file:
-                content = file.read()
-                self.editor.setPlainText(content)
-                self.current_file = file_path
-                self.setWindowTitle(f"Code Notepad - {file_path}")
-                self.status_bar.showMessage(f"Opened {file_path}")
+            # Binary files are never decoded, they are shown in hex from the memory map
+            probe = FileProbe(file_path)
+            if probe.binary or self.is_large_file(file_path):
+                self.cancel_loading()
+                self.open_large_file(file_path, probe)
+                INSTRUMENTATION.record("open_file", start)
+                return
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Could not open file: {str(e)}")
+            return
+        
+        # Only one file loads at a time, a new request replaces the running one
+        self.cancel_loading()
+        self.show_editor()
+        
+        cached = self.document_cache.get(file_path)
+        if cached is not None:
+            # Unsaved edits win over the file on disk
+            if cached.document.isModified() or cached.matches_disk():
+                self.release_buffer()
+                self.show_buffer(cached)
+                self.status_bar.showMessage(f"Switched to {file_path}")
+                return
+            self.document_cache.remove(file_path)
+            if cached is self.buffer:
+                self.buffer = None
+            cached.close()
+        
+        self.release_buffer()
+        buffer = self.create_buffer(file_path, probe.newline or os.linesep, probe.encoding, probe.bom)
+        buffer.document.setUndoRedoEnabled(False)
+        self.loading_buffer = buffer
+        self.show_buffer(buffer)
+        self.editor.setReadOnly(True)
+        
+        # Add to file list if not already there
+        if file_path not in self.file_list:
+            self.file_list.append(file_path)
+            self.sidebar.addItem(file_path)
+        
+        self.loader = FileLoader(file_path, probe, parent=self)
+        self.loader.started_ns = start
+        self.loader.chunk_loaded.connect(self.on_chunk_loaded)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.finished_loading.connect(self.on_load_finished)
+        self.loader.failed.connect(self.on_load_failed)
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.cancel_load_button.show()
+        self.status_bar.showMessage(f"Loading {file_path}...")
+        self.loader.start()
+    
+    def cancel_loading(self):
+        if self.loader is None:
+            return
+        
+        loader, self.loader = self.loader, None
+        loader.cancel()
+        loader.wait()
+        loader.deleteLater()
+        self.discard_loading_buffer()
+        self.status_bar.showMessage(f"Cancelled loading {loader.path}")
+    
+    def discard_loading_buffer(self):
+        # A partly loaded document must never be mistaken for the whole file
+        buffer, self.loading_buffer = self.loading_buffer, None
+        self.finish_loading(buffer)
+        if buffer is self.buffer:
+            self.buffer = None
+            self.show_buffer(self.create_buffer())
+            self.start_journal(self.buffer)
+        buffer.close()
+    
+    def finish_loading(self, buffer):
+        self.chunk_timer.stop()
+        self.pending_chunks.clear()
+        self.loader_done = False
+        self.load_progress.hide()
+        self.cancel_load_button.hide()
+        self.editor.setReadOnly(False)
+        buffer.document.setUndoRedoEnabled(True)
+    
+    def on_chunk_loaded(self, text):
+        # Chunks still queued from a cancelled loader are dropped
+        if self.sender() is not self.loader:
+            return
+        self.pending_chunks.append(text)
+        self.chunk_timer.start()
+    
+    def insert_pending_chunks(self):
+        # Insert chunks for a bounded time per event loop pass so the editor
+        # keeps painting and reacting to input while a big file streams in
+        cursor = QTextCursor(self.loading_buffer.document)
+        cursor.movePosition(QTextCursor.End)
+        deadline = time.perf_counter() + self.CHUNK_TIME_BUDGET
+        while self.pending_chunks and time.perf_counter() < deadline:
+            cursor.insertText(self.pending_chunks.popleft())
+            self.loader.chunk_consumed()
+        
+        if not self.pending_chunks:
+            self.chunk_timer.stop()
+            if self.loader_done:
+                self.complete_loading()
+    
+    def on_load_progress(self, read, total):
+        if self.sender() is not self.loader:
+            return
+        self.load_progress.setValue(int(read * 100 / total) if total else 100)
+    
+    def on_load_finished(self):
+        if self.sender() is not self.loader:
+            return
+        
+        self.loader_done = True
+        if not self.pending_chunks:
+            self.complete_loading()
+    
+    def complete_loading(self):
+        loader, self.loader = self.loader, None
+        loader.wait()
+        loader.deleteLater()
+        buffer, self.loading_buffer = self.loading_buffer, None
+        self.finish_loading(buffer)
+        
+        buffer.newline = loader.newline or os.linesep
+        buffer.record_disk_state()
+        buffer.document.setModified(False)
+        self.start_journal(buffer)
+        self.cache_buffer(buffer)
+        if buffer is self.buffer:
+            self.editor.moveCursor(QTextCursor.Start)
+            if self.pending_line is not None:
+                self.move_to_line(self.pending_line)
+        self.pending_line = None
+        self.status_bar.showMessage(f"Opened {loader.path} ({loader.probe.description()})")
+        INSTRUMENTATION.record("open_file", loader.started_ns)
+    
+    def on_load_failed(self, error):
+        if self.sender() is not self.loader:
+            return
+        
+        loader, self.loader = self.loader, None
+        loader.wait()
+        loader.deleteLater()
+        self.discard_loading_buffer()
+        QMessageBox.critical(self, "Error", f"Could not open file: {error}")
     
     def save_file(self):
         if self.current_file:
-            try:
-                with open(self.current_file, 'w') as file:
-                    file.write(self.editor.toPlainText())
-                self.status_bar.showMessage(f"Saved {self.current_file}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not save file: {str(e)}")
+            self.start_save(self.current_file)
         else:
             self.save_as_file()
     
     def save_as_file(self):
+        if not self.can_save():
+            return
+        
         file_path, _ = QFileDialog.getSaveFileName(
             self, "Save File", "", "All Files (*);;Python Files (*.py);;Text Files (*.txt)"
         )
         
         if file_path:
-            try:
-                with open(file_path, 'w') as file:
-                    file.write(self.editor.toPlainText())
+            self.start_save(file_path)
+    
+    def can_save(self):
+        if self.in_large_file_mode():
+            self.status_bar.showMessage("Files opened in large file mode are read-only")
+            return False
+        if self.loader is not None:
+            self.status_bar.showMessage("Wait for the file to finish loading before saving")
+            return False
+        return True
+    
+    def start_save(self, file_path, buffer=None):
+        if not self.can_save():
+            return
+        buffer = buffer or self.buffer
+        
+        # One save at a time, a request made meanwhile runs with a fresh snapshot afterwards
+        if self.saver is not None:
+            self.queued_save = (file_path, buffer)
+            return
+        
+        start = time.perf_counter_ns()
+        document = buffer.document
+        fsync_policy = self.settings.value("fsync_policy", FileSaver.FSYNC_ALWAYS)
+        self.saver = FileSaver(file_path, document.toPlainText(), document, encoding=buffer.encoding,
+                               bom=buffer.bom, newline=buffer.newline,
+                               fsync_policy=fsync_policy, parent=self)
+        self.saver.buffer = buffer
+        self.saver.started_ns = start
+        self.saver.saved.connect(self.on_file_saved)
+        self.saver.failed.connect(self.on_save_failed)
+        self.saver.unencodable.connect(self.on_save_unencodable)
+        self.saver.finished.connect(self.on_saver_finished)
+        self.status_bar.showMessage(f"Saving {file_path}...")
+        self.saver.start()
+    
+    def on_file_saved(self, file_path, size, seconds):
+        saver = self.sender()
+        buffer = saver.buffer
+        document = buffer.document
+        
+        if file_path != buffer.path:
+            # Saved under a new name: the buffer now stands for that file
+            if buffer.path is not None:
+                self.document_cache.remove(buffer.path)
+            replaced = self.document_cache.remove(file_path)
+            if replaced is not None and replaced is not buffer:
+                replaced.close()
+            buffer.path = file_path
+            self.cache_buffer(buffer)
+            
+            # Add to file list if not already there
+            if file_path not in self.file_list:
+                self.file_list.append(file_path)
+                self.sidebar.addItem(file_path)
+            if buffer is self.buffer:
                 self.current_file = file_path
                 self.setWindowTitle(f"Code Notepad - {file_path}")
-                
-                # Add to file list if not already there
-                if file_path not in self.file_list:
-                    self.file_list.append(file_path)
-                    self.sidebar.addItem(file_path)
-                
-                self.status_bar.showMessage(f"Saved {file_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not save file: {str(e)}")
+        
+        # Only clear the modified flag if nothing was typed while saving
+        if document.revision() == saver.revision:
+            document.setModified(False)
+            buffer.record_disk_state()
+            self.schedule_lint(buffer, saver.text, saver.revision)
+            if self.run_after_save is buffer:
+                self.run_after_save = None
+                self.run_file(file_path)
+            if buffer.journal is not None:
+                buffer.journal.reset(file_path, saver.newline, saver.encoding, saver.bom)
+        elif buffer.journal is not None:
+            buffer.journal.path = file_path
+            buffer.journal.compact()
+        
+        if self.workspace_model is not None and file_path.endswith(self.PYTHON_EXTENSIONS) and \
+                file_path.startswith(os.path.join(self.workspace_model.root_path, '')):
+            self.symbol_index_timer.start()
+        
+        INSTRUMENTATION.record("save_file", saver.started_ns)
+        megabytes = size / (1024 * 1024)
+        per_megabyte = seconds * 1000 / megabytes if size else 0
+        self.status_bar.showMessage(
+            f"Saved {file_path} ({megabytes:.2f} MB in {seconds * 1000:.0f} ms, {per_megabyte:.1f} ms/MB)")
+    
+    def on_save_failed(self, error):
+        self.run_after_save = None
+        QMessageBox.critical(self, "Error", f"Could not save file: {error}")
+    
+    def on_save_unencodable(self, encoding, char, line):
+        # The saver may finish and be deleted while the question is open
+        saver = self.sender()
+        file_path, buffer = saver.path, saver.buffer
+        answer = QMessageBox.question(
+            self, "Save",
+            f"{file_path} is {encoding.upper()}, which cannot hold {char!r} on line {line:,}.\n\n"
+            "Save it as UTF-8 instead?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if answer != QMessageBox.Yes:
+            self.run_after_save = None
+            self.status_bar.showMessage(f"{file_path} was not saved")
+            return
+        buffer.encoding = 'utf-8'
+        buffer.bom = b''
+        self.start_save(file_path, buffer)
+    
+    def on_saver_finished(self):
+        self.saver.deleteLater()
+        self.saver = None
+        if self.queued_save is not None:
+            (file_path, buffer), self.queued_save = self.queued_save, None
+            self.start_save(file_path, buffer)
     
     def print_file(self):
+        from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
         printer = QPrinter()
         dialog = QPrintDialog(printer, self)
         
         if dialog.exec_() == QPrintDialog.Accepted:
             self.editor.print_(printer)
     
+    def run_current_file(self):
+        if self.in_large_file_mode():
+            self.run_file(self.current_file)
+            return
+        buffer = self.buffer
+        if buffer.path is None or buffer.document.isModified():
+            # Run what is on screen: save first, the run starts once the save is done
+            self.run_after_save = buffer
+            self.save_file()
+            if self.saver is None and self.queued_save is None:
+                # Save as was cancelled, or the file cannot be saved right now
+                self.run_after_save = None
+            return
+        self.run_file(buffer.path)
+    
+    def run_file(self, path):
+        if not path.endswith(self.PYTHON_EXTENSIONS):
+            self.status_bar.showMessage("Only Python files can be run")
+            return
+        self.run_path = path
+        if self.runner.is_running():
+            # Started again once the running one has stopped
+            self.rerun_pending = True
+            self.runner.stop()
+            return
+        self.run_panel.clear()
+        self.run_panel.status_label.setText(f"Running {os.path.basename(path)}...")
+        self.run_panel.set_running(True)
+        self.run_dock.show()
+        self.runner.start(sys.executable, ["-u", path], os.path.dirname(path))
+    
+    def rerun_file(self):
+        if self.run_path is not None:
+            self.run_file(self.run_path)
+    
+    def stop_run(self):
+        self.rerun_pending = False
+        self.runner.stop()
+    
+    def on_run_finished(self, outcome, seconds):
+        self.run_panel.set_running(False)
+        self.run_panel.status_label.setText(f"{outcome} after {seconds:.1f} s")
+        if self.rerun_pending:
+            self.rerun_pending = False
+            self.run_file(self.run_path)
+    
+    def find_text(self):
+        # Start from the selection when it is a single line
+        selected = self.editor.textCursor().selectedText()
+        if selected and '\u2029' not in selected:
+            self.find_bar.find_edit.setText(selected)
+        self.find_bar.show()
+        self.find_bar.find_edit.setFocus()
+        self.find_bar.find_edit.selectAll()
+        self.update_find_pattern()
+    
+    def update_find_pattern(self):
+        self.find_timer.stop()
+        if not self.find_bar.isVisible():
+            return
+        try:
+            pattern = self.find_bar.pattern()
+        except re.error as e:
+            self.document_search.clear()
+            self.find_bar.count_label.setText(f"Invalid pattern: {str(e)}")
+            return
+        # The large file viewer searches the file itself when asked, nothing to highlight
+        if self.in_large_file_mode():
+            pattern = None
+        self.document_search.set_pattern(self.editor.document(), pattern, self.find_bar.line_bound())
+    
+    def on_find_bar_closed(self):
+        self.find_timer.stop()
+        self.document_search.clear()
+        self.editor.setFocus()
+    
+    def on_find_matches_changed(self):
+        search = self.document_search
+        if search.pattern is None:
+            self.find_bar.count_label.setText("")
+        else:
+            position = self.editor.textCursor().selectionStart()
+            index = bisect.bisect_left(search.starts, position)
+            current = index + 1 if index < len(search.starts) and search.starts[index] == position else 0
+            total = f"{len(search.starts):,}" + ("" if search.complete else "+")
+            self.find_bar.count_label.setText(f"{current:,} of {total}" if current else f"{total} matches")
+        self.find_selection_timer.start()
+    
+    def update_extra_selections(self):
+        # Lint markers, then find matches on screen
+        selections = []
+        for cursor, _ in self.editor.diagnostics:
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = cursor
+            selection.format = self.lint_format
+            selections.append(selection)
+        
+        search = self.document_search
+        if search.pattern is None or search.document is not self.editor.document():
+            self.editor.setExtraSelections(selections)
+            return
+        viewport = self.editor.viewport()
+        top = self.editor.cursorForPosition(QPoint(0, 0)).position()
+        bottom = self.editor.cursorForPosition(QPoint(viewport.width(), viewport.height())).position()
+        first = bisect.bisect_right(search.ends, top)
+        last = min(bisect.bisect_right(search.starts, bottom), first + self.MAX_VISIBLE_MATCHES)
+        
+        for index in range(first, last):
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = QTextCursor(search.document)
+            selection.cursor.setPosition(search.starts[index])
+            selection.cursor.setPosition(search.ends[index], QTextCursor.KeepAnchor)
+            selection.format = self.find_format
+            selections.append(selection)
+        self.editor.setExtraSelections(selections)
+    
+    def find_next(self):
+        self.find_match(backward=False)
+    
+    def find_previous(self):
+        self.find_match(backward=True)
+    
+    def find_match(self, backward):
+        text = self.find_bar.find_edit.text()
+        if not text:
+            return
+        
+        if self.in_large_file_mode():
+            search = self.large_view.find(text)
+            if search is not None:
+                search.not_found.connect(lambda needle: self.status_bar.showMessage(f"'{needle}' not found"))
+                search.found.connect(lambda offset, line: self.status_bar.showMessage(f"Found at line {line + 1:,}"))
+                self.status_bar.showMessage(f"Searching for '{text}'...")
+            return
+        
+        if self.find_timer.isActive() or self.document_search.restart_timer.isActive():
+            self.update_find_pattern()
+        search = self.document_search
+        if search.pattern is None:
+            return
+        cursor = self.editor.textCursor()
+        search.search_until(cursor.selectionStart() + 1)
+        if backward:
+            index = bisect.bisect_left(search.starts, cursor.selectionStart()) - 1
+            if index < 0:
+                search.search_until(search.document.characterCount())
+                index = len(search.starts) - 1
+        else:
+            index = bisect.bisect_left(search.starts, cursor.selectionStart() + (1 if cursor.hasSelection() else 0))
+            if index >= len(search.starts) and search.complete:
+                # Wrap around to the start of the document
+                index = 0
+        
+        if not 0 <= index < len(search.starts):
+            self.status_bar.showMessage(f"'{text}' not found")
+            return
+        cursor.setPosition(search.starts[index])
+        cursor.setPosition(search.ends[index], QTextCursor.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.on_find_matches_changed()
+    
+    def replace_match(self):
+        if self.in_large_file_mode() or self.editor.isReadOnly():
+            return
+        try:
+            pattern = self.find_bar.pattern()
+        except re.error:
+            return
+        cursor = self.editor.textCursor()
+        # Only a selection the pattern matches exactly is replaced, otherwise move to the next match
+        match = pattern.fullmatch(cursor.selectedText().replace('\u2029', '\n')) if pattern and cursor.hasSelection() else None
+        if match is not None:
+            try:
+                cursor.insertText(self.find_bar.replacement(match))
+            except (re.error, IndexError) as e:
+                QMessageBox.critical(self, "Error", f"Invalid replacement: {str(e)}")
+                return
+            self.document_search.restart()
+        self.find_next()
+    
+    def replace_all(self):
+        if self.in_large_file_mode() or self.editor.isReadOnly():
+            return
+        if self.replacer is not None:
+            self.status_bar.showMessage("Replace all is still running")
+            return
+        try:
+            pattern = self.find_bar.pattern()
+        except re.error:
+            return
+        if pattern is None:
+            return
+        
+        document = self.editor.document()
+        self.replacer = DocumentReplace(document, document.toPlainText(), pattern,
+                                        self.find_bar.replace_edit.text(), self.find_bar.regex_check.isChecked(), self)
+        self.replacer.replaced.connect(self.on_replaced)
+        self.replacer.failed.connect(self.on_replace_failed)
+        self.replacer.finished.connect(self.on_replacer_finished)
+        self.replacer.start()
+        self.status_bar.showMessage("Replacing...")
+    
+    def on_replaced(self, first, last, replaced, count):
+        replacer = self.sender()
+        if replacer is not self.replacer:
+            return
+        if not count:
+            self.status_bar.showMessage(f"'{self.find_bar.find_edit.text()}' not found")
+            return
+        # The buffer may have been switched away from, or closed, in the meantime
+        document = replacer.document
+        if document is not self.editor.document() or document.revision() != replacer.revision:
+            self.status_bar.showMessage("The document changed while replacing, nothing was replaced")
+            return
+        
+        # Swap only the stretch from the first to the last match, as one edit: a single undo
+        # step, and the highlighter and journal see one change instead of one per match
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        cursor.setPosition(first)
+        cursor.setPosition(last, QTextCursor.KeepAnchor)
+        cursor.insertText(replaced)
+        cursor.endEditBlock()
+        self.document_search.restart()
+        self.status_bar.showMessage(f"Replaced {count:,} occurrence(s)")
+    
+    def on_replace_failed(self, error):
+        if self.sender() is self.replacer:
+            self.status_bar.clearMessage()
+            QMessageBox.critical(self, "Error", f"Invalid replacement: {error}")
+    
+    def on_replacer_finished(self):
+        if self.sender() is self.replacer:
+            self.replacer.deleteLater()
+            self.replacer = None
+    
+    def go_to_line(self):
+        if self.in_large_file_mode():
+            line_count = self.large_view.line_count()
+        else:
+            line_count = self.editor.document().blockCount()
+        
+        line, ok = QInputDialog.getInt(self, "Go to Line", f"Line (1 - {line_count:,}):", 1, 1, max(line_count, 1))
+        if not ok:
+            return
+        
+        if self.in_large_file_mode():
+            if not self.large_view.go_to_line(line - 1):
+                self.status_bar.showMessage(f"Line {line:,} has not been indexed yet")
+            return
+        
+        self.move_to_line(line - 1)
+    
+    def move_to_line(self, line):
+        cursor = QTextCursor(self.editor.document().findBlockByNumber(line))
+        self.editor.setTextCursor(cursor)
+        self.editor.setFocus()
+    
+    def show_find_in_files(self):
+        self.find_in_files_dock.show()
+        self.find_in_files_panel.query_edit.setFocus()
+        self.find_in_files_panel.query_edit.selectAll()
+    
+    def toggle_find_in_files(self):
+        if self.file_search is not None:
+            self.stop_find_in_files()
+        else:
+            self.start_find_in_files()
+    
+    def start_find_in_files(self):
+        panel = self.find_in_files_panel
+        query = panel.query_edit.text()
+        if not query:
+            return
+        if self.workspace_model is None:
+            QMessageBox.information(self, "Find in Files", "Open a folder first")
+            return
+        
+        # Files are searched as bytes, non-ASCII text in the query is matched as UTF-8
+        pattern = query.encode('utf-8')
+        if not panel.regex_check.isChecked():
+            pattern = re.escape(pattern)
+        flags = 0 if panel.case_check.isChecked() else re.IGNORECASE
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            QMessageBox.critical(self, "Error", f"Invalid regular expression: {str(e)}")
+            return
+        
+        root = self.find_in_files_root = self.workspace_model.root_path
+        paths = [os.path.join(root, *path.split('/')) for path in self.workspace_model.file_paths()]
+        panel.results_tree.clear()
+        panel.set_searching(True)
+        panel.summary_label.setText(f"Searching {len(paths):,} files...")
+        
+        self.file_search = FindInFilesSearch(self.worker_pool(), paths, pattern, flags, self)
+        self.file_search.results_found.connect(self.on_find_in_files_results)
+        self.file_search.progress.connect(self.on_find_in_files_progress)
+        self.file_search.search_finished.connect(self.on_find_in_files_finished)
+        self.file_search.finished.connect(self.file_search.deleteLater)
+        self.file_search.start()
+    
+    def stop_find_in_files(self):
+        if self.file_search is None:
+            return
+        self.file_search.stop()
+        self.file_search.wait()
+    
+    def on_find_in_files_results(self, results):
+        # Batches still queued from a stopped search are dropped
+        if self.sender() is self.file_search:
+            self.find_in_files_panel.add_results(self.find_in_files_root, results)
+    
+    def on_find_in_files_progress(self, done, total):
+        if self.sender() is self.file_search:
+            self.find_in_files_panel.summary_label.setText(f"Searched {done:,} of {total:,} files...")
+    
+    def on_find_in_files_finished(self, match_count, searched, binaries, seconds):
+        search = self.sender()
+        if search is not self.file_search:
+            return
+        self.file_search = None
+        self.find_in_files_panel.set_searching(False)
+        
+        if search.stopped:
+            state = "Stopped: "
+        elif search.truncated:
+            state = "Stopped at the result limit: "
+        else:
+            state = ""
+        throughput = searched / (1024 * 1024) / seconds if seconds else 0
+        self.find_in_files_panel.summary_label.setText(
+            f"{state}{match_count:,} matching line(s) in {self.find_in_files_panel.results_tree.topLevelItemCount():,} file(s), "
+            f"{searched / (1024 * 1024):,.1f} MB in {seconds:.2f} s ({throughput:,.0f} MB/s), {binaries:,} binary file(s) skipped")
+    
+    def run_ai_action(self, kind):
+        if self.in_large_file_mode() or self.loading_buffer is not None:
+            self.status_bar.showMessage("AI actions need the whole document loaded in the editor")
+            return
+        provider = self.settings.value("api_provider", "OpenAI")
+        api_key = self.settings.value("api_key", "")
+        api_url = self.settings.value("api_url", "")
+        if (provider == "OpenAI" and not api_key) or (provider != "OpenAI" and not api_url):
+            QMessageBox.information(self, "AI", "Set up the API in Settings first")
+            return
+        
+        cursor = self.editor.textCursor()
+        if not cursor.hasSelection():
+            cursor.select(QTextCursor.Document)
+        selection = cursor.selectedText().replace('\u2029', '\n')
+        if not selection.strip():
+            self.status_bar.showMessage("Nothing to send")
+            return
+        
+        self.stop_ai_request()
+        title, prompt = self.AI_ACTIONS[kind]
+        model = self.settings.value("api_model", AiClient.MODELS[0])
+        if self.response_cache is None:
+            self.response_cache = ResponseCache(
+                os.path.join(writable_location(QStandardPaths.GenericCacheLocation), "Codepad", "ai"), 0)
+        self.response_cache.budget = self.settings.value("ai_cache_mb", 64, type=int) * 1024 * 1024
+        request = AiRequest(kind, ResponseCache.key(model, prompt, selection),
+                            cursor if kind == "refactor" else None)
+        
+        self.ai_panel.output.clear()
+        if kind != "refactor":
+            self.ai_dock.show()
+        cached = self.response_cache.get(request.cache_key)
+        if cached is not None:
+            self.insert_ai_text(request, cached)
+            self.ai_panel.status_label.setText(f"{title}: from the cache")
+            self.status_bar.showMessage(f"{title}: from the cache")
+            return
+        
+        if self.ai_client is None:
+            self.ai_client = AiClient(self)
+            self.ai_client.tokens.connect(self.on_ai_tokens)
+            self.ai_client.completed.connect(self.on_ai_completed)
+            self.ai_client.failed.connect(self.on_ai_failed)
+        self.ai_request = request
+        self.ai_client.complete(request, api_url, api_key, model,
+                                self.settings.value("api_temperature", 0.2, type=float),
+                                [{"role": "system", "content": prompt}, {"role": "user", "content": selection}])
+        self.ai_panel.set_running(True)
+        self.ai_panel.status_label.setText(f"{title}: waiting for {model}...")
+        self.status_bar.showMessage(f"{title}: waiting for {model}...")
+    
+    def insert_ai_text(self, request, text):
+        if request.cursor is None:
+            self.ai_panel.output.moveCursor(QTextCursor.End)
+            self.ai_panel.output.insertPlainText(text)
+            return
+        cursor = request.cursor
+        if cursor.isNull():
+            # The document was closed while the answer was coming in
+            self.stop_ai_request()
+            return
+        # The selection stays until the first text arrives, and the whole answer is one undo step
+        if request.inserted:
+            cursor.joinPreviousEditBlock()
+        else:
+            cursor.beginEditBlock()
+            cursor.removeSelectedText()
+        cursor.insertText(text)
+        cursor.endEditBlock()
+        request.inserted = True
+    
+    def stop_ai_request(self):
+        if self.ai_request is None:
+            return
+        self.ai_request.cancel()
+        self.ai_request = None
+        self.ai_panel.set_running(False)
+        self.ai_panel.status_label.setText("Stopped")
+        self.status_bar.showMessage("AI request stopped")
+    
+    def on_ai_tokens(self, request, text):
+        # Tokens still queued from a stopped request are dropped
+        if request is self.ai_request:
+            self.insert_ai_text(request, text)
+    
+    def on_ai_completed(self, request, text):
+        if request is not self.ai_request:
+            return
+        self.ai_request = None
+        self.ai_panel.set_running(False)
+        title = self.AI_ACTIONS[request.kind][0]
+        self.ai_panel.status_label.setText(f"{title}: done")
+        self.status_bar.showMessage(f"{title}: done")
+        if text:
+            try:
+                self.response_cache.put(request.cache_key, text)
+            except OSError as e:
+                self.status_bar.showMessage(f"Could not cache the response: {str(e)}")
+    
+    def on_ai_failed(self, request, message):
+        if request is not self.ai_request:
+            return
+        self.ai_request = None
+        self.ai_panel.set_running(False)
+        self.ai_panel.status_label.setText("Failed")
+        QMessageBox.critical(self, "Error", f"AI request failed: {message}")
+    
+    def export_file(self, format_name):
+        if self.loader is not None:
+            self.status_bar.showMessage("Wait for the file to finish loading before exporting")
+            return
+        if self.export is not None:
+            self.status_bar.showMessage("An export is already running")
+            return
+        if self.in_large_file_mode() and self.large_view.hex_view:
+            self.status_bar.showMessage("Files shown in hex view cannot be exported")
+            return
+        file_filter, extension, _ = EXPORT_FORMATS[format_name]
+        source = self.current_file
+        title = os.path.basename(source) if source else "Untitled"
+        suggested = (os.path.splitext(source)[0] if source else "Untitled") + extension
+        path, _ = QFileDialog.getSaveFileName(self, f"Export as {format_name}", suggested,
+                                              f"{file_filter};;All Files (*)")
+        if not path:
+            return
+        
+        if self.in_large_file_mode():
+            # Hex view is refused above, so the only byte order mark left to skip is UTF-8's
+            encoding = 'utf-8-sig' if self.large_view.bom == codecs.BOM_UTF8 else self.large_view.encoding
+            self.export = FileExport(source, encoding, path, format_name, title, os.linesep, self)
+        else:
+            self.export = DocumentExport(self.editor.document(), path, format_name, title, self.buffer.newline, self)
+        self.export.progress.connect(self.on_export_progress)
+        self.export.export_finished.connect(self.on_export_finished)
+        self.export_path = path
+        self.status_bar.showMessage(f"Exporting to {path}...")
+        self.export.start()
+    
+    def stop_export(self):
+        if self.export is None:
+            return
+        export = self.export
+        export.stop()
+        if isinstance(export, QThread):
+            export.wait()
+    
+    def on_export_progress(self, percent):
+        if self.sender() is self.export:
+            self.status_bar.showMessage(f"Exporting to {self.export_path}... {percent}%")
+    
+    def on_export_finished(self, error):
+        if self.sender() is not self.export:
+            return
+        export, self.export = self.export, None
+        export.deleteLater()
+        if error == "stopped":
+            self.status_bar.showMessage("Export stopped")
+        elif error:
+            QMessageBox.critical(self, "Error", f"Could not export file: {error}")
+        else:
+            self.status_bar.showMessage(f"Exported to {self.export_path}")
+    
+    @staticmethod
+    def telegram_directory():
+        return os.path.join(writable_location(QStandardPaths.GenericDataLocation), "Codepad", "telegram")
+    
+    def start_telegram_queue(self):
+        if self.telegram_queue is None:
+            self.telegram_queue = TelegramQueue(self.telegram_directory(), self.settings.value("telegram_token", ""),
+                                                self.settings.value("telegram_api_url", ""), self)
+            self.telegram_queue.queue_changed.connect(self.on_telegram_queue_changed)
+            self.telegram_queue.shared.connect(self.on_telegram_shared)
+            self.telegram_queue.failed.connect(self.on_telegram_failed)
+        return self.telegram_queue
+    
+    def resume_telegram_queue(self):
+        if self.telegram_queue is None and TelegramQueue.pending_shares(self.telegram_directory()):
+            self.start_telegram_queue()
+    
+    def share_to_telegram(self, title, text=None, path=None):
+        chat_id = self.settings.value("telegram_chat_id", "")
+        if not self.settings.value("telegram_token", "") or not chat_id:
+            QMessageBox.information(self, "Telegram", "Set the Telegram token and chat ID in Settings first")
+            return
+        self.start_telegram_queue().share(chat_id, title, text, path)
+        self.status_bar.showMessage(f"Queued {title} for Telegram")
+    
+    def share_selection(self):
+        if self.in_large_file_mode():
+            self.status_bar.showMessage("Large files are shared whole, use Share File")
+            return
+        selection = self.editor.textCursor().selectedText().replace('\u2029', '\n')
+        if not selection.strip():
+            self.status_bar.showMessage("Select some text to share")
+            return
+        self.share_to_telegram("Selection", text=selection)
+    
+    def share_file(self):
+        path = self.current_file
+        title = os.path.basename(path) if path else "Untitled"
+        if path and (self.in_large_file_mode() or self.loading_buffer is not None or
+                     not self.editor.document().isModified()):
+            # Read from disk on the queue's thread, the editor does not hand the text over
+            self.share_to_telegram(title, path=path)
+        else:
+            self.share_to_telegram(title, text=self.editor.toPlainText())
+    
+    def on_telegram_queue_changed(self, pending):
+        if pending:
+            self.status_bar.showMessage(f"Telegram: {pending:,} message(s) to send")
+    
+    def on_telegram_shared(self, title):
+        self.status_bar.showMessage(f"Shared {title} to Telegram")
+    
+    def on_telegram_failed(self, title, message):
+        QMessageBox.critical(self, "Error", f"Could not share {title} to Telegram: {message}")
+    
+    def open_find_result(self, item):
+        location = item.data(0, FindInFilesPanel.LOCATION_ROLE)
+        if location is None:
+            return
+        self.open_location(*location)
+    
+    def open_location(self, path, line):
+        self.load_file(path)
+        if self.in_large_file_mode():
+            if not self.large_view.go_to_line(line):
+                self.status_bar.showMessage(f"Line {line + 1:,} has not been indexed yet")
+        elif self.loading_buffer is not None:
+            self.pending_line = line
+        elif self.buffer is not None and self.buffer.path == path:
+            # Served from the document cache
+            self.move_to_line(line)
+    
+    def on_editor_text_changed(self):
+        if self.outline_dock.isVisible():
+            self.outline_timer.start()
+        if self.lint_jobs and self.buffer is not None:
+            # The file on disk no longer matches what is being edited, drop its lint
+            job = self.lint_jobs.get(self.buffer.path)
+            if job is not None and job.buffer is self.buffer and job.revision != self.buffer.document.revision():
+                job.cancel()
+                del self.lint_jobs[self.buffer.path]
+    
+    def schedule_lint(self, buffer, text, revision):
+        if not self.settings.value("lint_on_save", True, type=bool) or \
+                not buffer.path.endswith(self.PYTHON_EXTENSIONS):
+            return
+        if self.settings.value("lint_commands", DEFAULT_LINT_COMMANDS) == DEFAULT_LINT_COMMANDS:
+            if self.default_linter_found is None:
+                import importlib.util
+                self.default_linter_found = importlib.util.find_spec(DEFAULT_LINTER_MODULE) is not None
+            if not self.default_linter_found:
+                return
+        self.lint_queue[buffer.path] = (buffer, text, revision)
+        self.lint_timer.start()
+    
+    def run_lints(self):
+        import hashlib
+        commands = [line.strip() for line in
+                    self.settings.value("lint_commands", DEFAULT_LINT_COMMANDS).splitlines() if line.strip()]
+        queued, self.lint_queue = self.lint_queue, OrderedDict()
+        for path, (buffer, text, revision) in queued.items():
+            try:
+                if buffer.document.revision() != revision or buffer.path != path:
+                    # Edited or renamed since the save, the next save lints it
+                    continue
+            except RuntimeError:
+                # Closed since the save
+                continue
+            running = self.lint_jobs.pop(path, None)
+            if running is not None:
+                running.cancel()
+            
+            digest = hashlib.sha1("\0".join(commands + [path, text]).encode('utf-8', 'surrogatepass')).hexdigest()
+            if digest in self.lint_cache:
+                # Saved unchanged: nothing to run
+                self.lint_cache.move_to_end(digest)
+                self.show_diagnostics(buffer, self.lint_cache[digest])
+                continue
+            if not commands:
+                self.show_diagnostics(buffer, [])
+                continue
+            if self.lint_runner is None:
+                self.lint_runner = LintRunner(self)
+                self.lint_runner.linted.connect(self.on_linted)
+            job = self.lint_runner.run(path, commands)
+            job.buffer = buffer
+            job.revision = revision
+            job.digest = digest
+            self.lint_jobs[path] = job
+    
+    def on_linted(self, job, diagnostics, error):
+        if job.cancelled or self.lint_jobs.get(job.path) is not job:
+            return
+        del self.lint_jobs[job.path]
+        if error:
+            self.status_bar.showMessage(f"Could not lint {job.path}: {error}")
+            return
+        self.lint_cache[job.digest] = diagnostics
+        while len(self.lint_cache) > self.LINT_CACHE_SIZE:
+            self.lint_cache.popitem(last=False)
+        try:
+            if job.buffer.document.revision() != job.revision:
+                return
+        except RuntimeError:
+            return
+        self.show_diagnostics(job.buffer, diagnostics)
+    
+    def show_diagnostics(self, buffer, diagnostics):
+        document = buffer.document
+        markers = []
+        for line, column, message in diagnostics:
+            block = document.findBlockByNumber(line - 1)
+            if not block.isValid():
+                continue
+            # The word at the column, or the whole line when there is no column
+            cursor = QTextCursor(block)
+            text = block.text()
+            if column > 0 and column - 1 < len(text) and (text[column - 1].isalnum() or text[column - 1] == '_'):
+                cursor.setPosition(block.position() + column - 1)
+                cursor.select(QTextCursor.WordUnderCursor)
+            else:
+                cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            markers.append((cursor, f"{line}:{column}: {message}" if column else f"{line}: {message}"))
+        buffer.diagnostics = markers
+        if buffer is self.buffer:
+            self.editor.diagnostics = markers
+            self.find_selection_timer.start()
+            count = len(markers)
+            self.status_bar.showMessage(f"{count} problem{'s' if count != 1 else ''} in {buffer.path}"
+                                        if count else f"No problems in {buffer.path}")
+    
+    def update_outline(self):
+        self.outline_timer.stop()
+        if not self.outline_dock.isVisible():
+            return
+        path = self.buffer.path if self.buffer is not None else None
+        if self.in_large_file_mode() or self.loading_buffer is not None or \
+                (path is not None and not path.endswith(self.PYTHON_EXTENSIONS)):
+            self.outline_digest = None
+            self.show_outline([])
+            return
+        
+        import hashlib
+        text = self.editor.document().toPlainText()
+        digest = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        if digest == self.outline_digest:
+            return
+        self.outline_digest = digest
+        if digest in self.outline_cache:
+            self.outline_cache.move_to_end(digest)
+            self.show_outline(self.outline_cache[digest])
+        elif self.outline_parser is not None:
+            # Parse again once the running one is done
+            self.outline_digest = None
+            self.outline_timer.start()
+        else:
+            self.outline_parser = SymbolParser(text, digest, self)
+            self.outline_parser.parsed.connect(self.on_outline_parsed)
+            self.outline_parser.start()
+    
+    def on_outline_parsed(self, digest, symbols):
+        parser = self.sender()
+        parser.wait()
+        parser.deleteLater()
+        if parser is self.outline_parser:
+            self.outline_parser = None
+        self.outline_cache[digest] = symbols
+        while len(self.outline_cache) > self.OUTLINE_CACHE_SIZE:
+            self.outline_cache.popitem(last=False)
+        if digest == self.outline_digest:
+            self.show_outline(symbols)
+    
+    def show_outline(self, symbols):
+        self.outline_symbols = symbols
+        self.outline_tree.clear()
+        items = {}
+        for name, kind, line, _, container in symbols:
+            if kind == "import":
+                continue
+            item = QTreeWidgetItem([f"{name} ({kind})"])
+            item.setData(0, Qt.UserRole, line)
+            parent = items.get(container)
+            if parent is not None:
+                parent.addChild(item)
+            else:
+                self.outline_tree.addTopLevelItem(item)
+            items[f"{container}.{name}" if container else name] = item
+        self.outline_tree.expandAll()
+    
+    def open_outline_item(self, item):
+        self.move_to_line(item.data(0, Qt.UserRole))
+    
+    def go_to_definition(self):
+        if self.in_large_file_mode():
+            return
+        cursor = self.editor.textCursor()
+        cursor.select(QTextCursor.WordUnderCursor)
+        name = cursor.selectedText()
+        if not name.isidentifier():
+            self.status_bar.showMessage("Place the cursor on a name to go to its definition")
+            return
+        
+        start = time.perf_counter()
+        # This document first, then the workspace
+        locations = [(None, line, kind) for symbol_name, kind, line, _, _ in self.outline_symbols
+                     if symbol_name == name and kind != "import"]
+        locations.extend(self.symbol_table.lookup(name))
+        elapsed = time.perf_counter() - start
+        if not locations:
+            self.status_bar.showMessage(f"No definition found for '{name}'")
+            return
+        
+        if len(locations) == 1:
+            location = locations[0]
+        else:
+            labels = [f"{path or 'this file'}:{line + 1} ({kind})" for path, line, kind in locations]
+            label, ok = QInputDialog.getItem(self, "Go to Definition", f"Definitions of '{name}':", labels, 0, False)
+            if not ok:
+                return
+            location = locations[labels.index(label)]
+        
+        path, line, _ = location
+        if path is None:
+            self.move_to_line(line)
+        else:
+            self.open_location(os.path.join(self.workspace_model.root_path, *path.split('/')), line)
+        self.status_bar.showMessage(f"Found {len(locations)} definition(s) of '{name}' in {elapsed * 1000:.2f} ms")
+    
     def zoom_in(self):
         current_font = self.editor.font()
         current_font.setPointSize(current_font.pointSize() + 1)
@@ -589,22 +6308,913 @@ class CodeNotepad(QMainWindow):
             current_font.setPointSize(current_font.pointSize() - 1)
             self.editor.setFont(current_font)
     
+    def closeEvent(self, event):
+        self.cancel_loading()
+        self.stop_export()
+        self.stop_ai_request()
+        if self.ai_client is not None:
+            self.ai_client.close()
+        if self.telegram_queue is not None:
+            self.telegram_queue.close()
+        self.stop_find_in_files()
+        self.runner.close()
+        for job in self.lint_jobs.values():
+            job.cancel()
+        if self.lint_runner is not None:
+            self.lint_runner.close()
+        if self.outline_parser is not None:
+            self.outline_parser.wait()
+        if self.replacer is not None:
+            self.replacer.wait()
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+        self.close_workspace()
+        if self.saver is not None:
+            self.saver.wait()
+        for buffer in self.open_buffers():
+            self.stop_journal(buffer)
+        if self.journal_session is not None:
+            self.journal_session.close()
+        self.large_view.close_file()
+        super().closeEvent(event)
+    
     def open_settings(self):
         dialog = SettingsDialog(self)
         if dialog.exec_() == QDialog.Accepted:
             self.update_editor_settings()
+            self.document_cache.budget = self.settings.value("document_cache_mb", 256, type=int) * 1024 * 1024
+            for evicted in self.document_cache.evict({self.buffer, self.loading_buffer}):
+                evicted.close()
+            if self.telegram_queue is not None:
+                self.telegram_queue.configure(self.settings.value("telegram_token", ""),
+                                              self.settings.value("telegram_api_url", ""))
             self.status_bar.showMessage("Settings saved")
 
+# Waits for the editor's first paint, then writes the start up timings and closes the window
+class StartupProfiler(QObject):
+    def __init__(self, window, output):
+        super().__init__(window)
+        self.window = window
+        self.output = output
+        window.editor.viewport().installEventFilter(self)
+    
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            watched.removeEventFilter(self)
+            mark_startup("first paint")
+            QTimer.singleShot(0, self.finish)
+        return False
+    
+    def report(self):
+        start = STARTUP_TIMES[0][1]
+        previous = start
+        phases = []
+        for phase, at in STARTUP_TIMES[1:]:
+            phases.append({"phase": phase, "ms": round((at - previous) * 1000, 2),
+                           "at_ms": round((at - start) * 1000, 2)})
+            previous = at
+        return {
+            "interpreter_and_compile_cpu_ms": round(STARTUP_CPU_TIME * 1000, 2),
+            "time_to_first_paint_ms": round((previous - start) * 1000, 2),
+            "phases": phases,
+            # Should stay empty, anything here was imported before it was needed
+            "lazy_modules_loaded": [name for name in LAZY_MODULES if name in sys.modules],
+            "modules_loaded": len(sys.modules),
+        }
+    
+    def finish(self):
+        report = self.report()
+        import json
+        text = json.dumps(report, indent=2)
+        try:
+            if self.output == "-":
+                print(text)
+            else:
+                with open(self.output, 'w', encoding='utf-8') as file:
+                    file.write(text + '\n')
+        except OSError as e:
+            print(f"Could not write the start up profile: {str(e)}", file=sys.stderr)
+        self.window.close()
+
+# Highlighter benchmark: single-pass tokenizer vs one QRegExp scan per rule
+class RegExpPerRuleHighlighter(PythonHighlighter):
+    # The previous implementation, kept only as the benchmark baseline
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        
+        self.highlighting_rules = []
+        for word in PythonTokenizer.KEYWORDS:
+            self.highlighting_rules.append((r'\b' + word + r'\b', self.formats['keyword']))
+        self.highlighting_rules.append((r'"[^"\\]*(\\.[^"\\]*)*"', self.formats['string']))
+        self.highlighting_rules.append((r"'[^'\\]*(\\.[^'\\]*)*'", self.formats['string']))
+        self.highlighting_rules.append((r'#.*', self.formats['comment']))
+        self.highlighting_rules.append((r'\b[A-Za-z0-9_]+(?=\()', self.formats['function']))
+        self.highlighting_rules.append((r'\b[0-9]+\b', self.formats['number']))
+    
+    def highlightBlock(self, text):
+        for pattern, format in self.highlighting_rules:
+            expression = QRegExp(pattern)
+            index = expression.indexIn(text)
+            while index >= 0:
+                length = expression.matchedLength()
+                self.setFormat(index, length, format)
+                index = expression.indexIn(text, index + length)
+        
+        self.setCurrentBlockState(0)
+
+def generate_python_source(line_count):
+    template = [
+        'class Widget{n}(object):',
+        '    """Generated widget number {n}."""',
+        '    def method_{n}(self, value=None):',
+        '        # compute the result for {n}',
+        '        if value is not None and value > {n}:',
+        '            return self.render("item-{n}", value * 2)',
+        "        return {{'key': {n}, 'name': 'widget'}}",
+        '',
+    ]
+    lines = []
+    n = 0
+    while len(lines) < line_count:
+        lines.extend(line.format(n=n) for line in template)
+        n += 1
+    return '\n'.join(lines[:line_count])
+
+def benchmark_highlighter(line_count, repeat=3):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    source = generate_python_source(line_count)
+    results = {}
+    
+    for name, highlighter_class in (("regexp-per-rule", RegExpPerRuleHighlighter),
+                                    ("single-pass", PythonHighlighter)):
+        document = QTextDocument()
+        # Without a layout the document never reports edits to the highlighter
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setPlainText(source)
+        highlighter = highlighter_class(document)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            highlighter.rehighlight()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = document.blockCount() / best
+        print(f"{name:>16}: {results[name]:12,.0f} blocks/s ({best * 1000:.1f} ms for {document.blockCount()} blocks)")
+    
+    print(f"{'speedup':>16}: {results['single-pass'] / results['regexp-per-rule']:.1f}x")
+    
+    # A keystroke in the middle of the file should only touch the edited line
+    cursor = QTextCursor(document.findBlockByNumber(document.blockCount() // 2))
+    highlighter.highlighted_blocks = 0
+    start = time.perf_counter()
+    cursor.insertText("x")
+    elapsed = time.perf_counter() - start
+    print(f"{'keystroke':>16}: {highlighter.highlighted_blocks} block(s) rehighlighted in {elapsed * 1000:.2f} ms")
+    return results
+
+def benchmark_search(megabytes, file_kb=256):
+    import concurrent.futures
+    import multiprocessing
+    import tempfile
+    # Synthetic corpus of generated sources with a few binaries mixed in
+    chunk = generate_python_source(file_kb * 1024 // 40).encode('utf-8')[:file_kb * 1024]
+    binary = bytes(range(256)) * (file_kb * 4)
+    file_count = max(1, megabytes * 1024 // file_kb)
+    
+    with tempfile.TemporaryDirectory(prefix="codepad-bench-") as directory:
+        paths = []
+        for n in range(file_count):
+            path = os.path.join(directory, f"file{n}.{'bin' if n % 20 == 19 else 'py'}")
+            with open(path, 'wb') as file:
+                file.write(binary if n % 20 == 19 else chunk.replace(b"method_1(", f"needle_{n}(".encode(), 1))
+            paths.append(path)
+        print(f"corpus: {file_count} files, {file_count * file_kb / 1024:.0f} MB")
+        
+        queries = (("literal", re.escape(b"needle_7"), 0),
+                   ("regex", rb"def \w+_4\d\(self", 0),
+                   ("ignore case", re.escape(b"NEEDLE_7"), re.IGNORECASE))
+        def pooled_search(executor, pattern, flags):
+            futures = [executor.submit(search_file_batch, paths[offset:offset + FindInFilesSearch.BATCH_FILES],
+                                       pattern, flags)
+                       for offset in range(0, len(paths), FindInFilesSearch.BATCH_FILES)]
+            return sum(len(lines) for future in futures for _, lines in future.result()[0])
+        
+        results = {}
+        with concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+            # Untimed pass to start the workers
+            pooled_search(executor, b"needle", 0)
+            for name, pattern, flags in queries:
+                start = time.perf_counter()
+                _, searched, _ = search_file_batch(paths, pattern, flags)
+                single = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                matches = pooled_search(executor, pattern, flags)
+                pooled = time.perf_counter() - start
+                
+                megabytes_searched = searched / (1024 * 1024)
+                results[name] = megabytes_searched / pooled
+                print(f"{name:>12}: {megabytes_searched / single:8,.0f} MB/s in one process, "
+                      f"{results[name]:8,.0f} MB/s pooled ({matches:,} matching lines)")
+    return results
+
+def benchmark_scroll(line_count, steps=200):
+    # Frame time of scrolling a highlighted file: the old rich text editor against the plain text one
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    source = generate_python_source(line_count)
+    results = {}
+    
+    for name, editor_class in (("QTextEdit", QTextEdit), ("CodeEditor", CodeEditor)):
+        editor = editor_class()
+        editor.resize(1000, 800)
+        editor.setFont(QFont("Monospace", 12))
+        document = QTextDocument()
+        if editor_class is CodeEditor:
+            document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setDefaultFont(editor.font())
+        highlighter = PythonHighlighter(document)
+        
+        start = time.perf_counter()
+        document.setPlainText(source)
+        editor.setDocument(document)
+        editor.show()
+        app.processEvents()
+        open_time = time.perf_counter() - start
+        
+        def frame(action):
+            frame_start = time.perf_counter()
+            action()
+            editor.viewport().repaint()
+            if editor_class is CodeEditor:
+                editor.line_number_area.repaint()
+            return time.perf_counter() - frame_start
+        
+        # Straight after opening: jump to the end (Ctrl+End) and around, before any background layout has run
+        bar = editor.verticalScrollBar()
+        jump = frame(lambda: editor.moveCursor(QTextCursor.End))
+        frames = [jump]
+        for step in range(steps // 4):
+            frames.append(frame(lambda: bar.setValue(bar.maximum() * ((step * 37) % steps) // steps)))
+        
+        # Wheel scrolling, three lines a notch, from the middle of the file
+        editor.moveCursor(QTextCursor.Start)
+        bar.setValue(bar.maximum() // 2)
+        for step in range(steps):
+            frames.append(frame(lambda: bar.triggerAction(QAbstractSlider.SliderSingleStepAdd) or
+                                bar.triggerAction(QAbstractSlider.SliderSingleStepAdd) or
+                                bar.triggerAction(QAbstractSlider.SliderSingleStepAdd)))
+        
+        # Typing on screen
+        cursor = editor.cursorForPosition(QPoint(40, 200))
+        editor.setTextCursor(cursor)
+        typing = [frame(lambda: editor.insertPlainText("x")) for step in range(steps // 4)]
+        
+        frames.sort()
+        typing.sort()
+        results[name] = {"open": open_time, "jump": jump, "scroll": frames, "typing": typing}
+        print(f"{name:>12}: open {open_time:.2f} s, jump to end {jump * 1000:.0f} ms, "
+              f"scroll median {frames[len(frames) // 2] * 1000:.2f} ms p95 {frames[int(len(frames) * 0.95)] * 1000:.2f} ms, "
+              f"typing median {typing[len(typing) // 2] * 1000:.2f} ms max {typing[-1] * 1000:.2f} ms")
+        editor.close()
+        del highlighter
+    return results
+
+def benchmark_completion(word_count, queries=2000):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # Identifiers built from syllables, with skewed counts like real code
+    syllables = ["get", "set", "on", "data", "item", "value", "list", "node", "file", "index", "parse", "load",
+                 "save", "read", "write", "user", "name", "path", "text", "line", "count", "buffer", "view"]
+    start = time.perf_counter()
+    counts = {}
+    n = 0
+    while len(counts) < word_count:
+        parts = [syllables[(n * 7 + k * 13) % len(syllables)] for k in range(1 + n % 3)]
+        word = "_".join(parts) + f"_{n}"
+        counts[word] = 1 + (word_count // (n + 1)) % 1000
+        n += 1
+    words = WordIndex(counts)
+    words.freeze()
+    print(f"{'index':>16}: {len(counts):,} identifiers in {time.perf_counter() - start:.2f} s")
+    
+    editor = CodeEditor()
+    autocompleter = Autocompleter(editor)
+    autocompleter.workspace_words = words
+    document = QTextDocument()
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))
+    document.setPlainText(generate_python_source(100000))
+    identifiers = IdentifierIndex(document)
+    autocompleter.identifiers = identifiers
+    
+    # Every prefix a user passes through while typing a word
+    latencies = []
+    typed = list(counts)[::max(1, len(counts) // queries)][:queries]
+    for word in typed:
+        for length in range(Autocompleter.MIN_PREFIX, min(len(word), 8) + 1):
+            query_start = time.perf_counter()
+            autocompleter.complete(word[:length])
+            latencies.append(time.perf_counter() - query_start)
+    latencies.sort()
+    print(f"{'keystroke':>16}: median {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms "
+          f"over {len(latencies):,} prefixes")
+    
+    # A keystroke in a 100k line document only rescans the edited block
+    cursor = QTextCursor(document.findBlockByNumber(50000))
+    update_start = time.perf_counter()
+    cursor.insertText("extra_identifier ")
+    print(f"{'document edit':>16}: index updated in {(time.perf_counter() - update_start) * 1000:.2f} ms "
+          f"({len(identifiers.words.counts):,} identifiers in the document)")
+    return latencies
+
+def benchmark_quick_open(path_count, queries=("f", "fi", "file", "file_1", "file_19999", "f19999", "sub1/f", "zz")):
+    import random
+    generator = random.Random(1)
+    # A generated tree whose numbering puts the exact match for the last file late in sorted order
+    paths = [f"src/mod{n // 1000}/sub{n % 13}/file_{n}_{generator.randrange(10 ** 6)}.py" for n in range(path_count)]
+    start = time.perf_counter()
+    index = PathIndex("", paths)
+    print(f"{'index':>16}: {path_count:,} paths in {time.perf_counter() - start:.2f} s")
+    
+    # Every prefix a user passes through while typing each query
+    latencies = []
+    for query in queries + (f"file_{path_count - 1}",):
+        for length in range(1, len(query) + 1):
+            query_start = time.perf_counter()
+            index.search(query[:length])
+            latencies.append(time.perf_counter() - query_start)
+    latencies.sort()
+    print(f"{'keystroke':>16}: median {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms "
+          f"over {len(latencies):,} prefixes")
+    
+    # The best hits rank first wherever they sort: the name matching exactly, and a short name
+    # behind thousands of longer fuzzy matches
+    late = paths[-1]
+    found = index.search(f"file_{path_count - 1}")
+    print(f"{'late exact match':>16}: {'first' if found[:1] == [late] else 'MISSED'} ({late})")
+    short = PathIndex("", [f"aaa/bbb/a_x_b_{n}.py" for n in range(20000)] + ["zzz/ab.py"])
+    found = short.search("ab")
+    print(f"{'short name':>16}: {'first' if found[:1] == ['zzz/ab.py'] else 'MISSED'} (zzz/ab.py)")
+    return latencies
+
+# Benchmark suite: opens generated files in a real window and times the editor's hot paths.
+# Metrics ending in _ms are compared against a baseline run to catch regressions
+BENCH_SUITE_SIZES = "1K,100K,1M,10M,100M,500M"
+# Slowdowns smaller than this are timer noise, whatever the percentage
+BENCH_NOISE_MS = 1.0
+
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def write_bench_file(path, size):
+    # Generated Python up to size bytes, ending in a line only the search benchmark looks for
+    chunk = (generate_python_source(20000) + '\n').encode('utf-8')
+    tail = b"needle_at_the_end = 1\n"
+    remaining = max(0, size - len(tail))
+    with open(path, 'wb') as file:
+        while remaining > 0:
+            piece = chunk[:remaining]
+            if len(piece) < len(chunk):
+                piece = piece[:piece.rfind(b'\n') + 1] or piece
+            file.write(piece)
+            remaining -= len(piece)
+        file.write(tail)
+
+def benchmark_suite(sizes, output, baseline_path=None, tolerance=25, steps=100):
+    global ISOLATED_DIRECTORY
+    import json
+    import tempfile
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    app.setStyle('Fusion')
+    # Default settings and no lint jobs, so runs compare across machines and leave the user's files alone
+    isolated = tempfile.TemporaryDirectory(prefix="codepad-bench-settings-")
+    ISOLATED_DIRECTORY = isolated.name
+    settings = open_settings()
+    settings.setValue("lint_on_save", False)
+    settings.sync()
+    notepad = CodeNotepad()
+    notepad.resize(1200, 900)
+    notepad.show()
+    app.processEvents()
+    
+    def wait_for(condition, timeout=600):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("benchmark step did not finish")
+            app.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents, 50)
+    
+    def timed(action, condition=lambda: True):
+        start = time.perf_counter()
+        action()
+        wait_for(condition)
+        return (time.perf_counter() - start) * 1000
+    
+    def frames(view, action, count):
+        times = []
+        for _ in range(count):
+            start = time.perf_counter()
+            action()
+            view.viewport().repaint()
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        return times[len(times) // 2], times[int(len(times) * 0.95)], times[-1]
+    
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="codepad-bench-") as directory:
+        for label in sizes.split(','):
+            label = label.strip()
+            path = os.path.join(directory, f"bench_{label}.py")
+            write_bench_file(path, parse_size(label))
+            result = {"bytes": os.path.getsize(path)}
+            
+            if notepad.is_large_file(path):
+                # Read-only memory mapped view, nothing to highlight or save
+                view = notepad.large_view
+                result["mode"] = "large file"
+                result["open_ms"] = timed(lambda: notepad.load_file(path))
+                result["index_ms"] = timed(lambda: None, view.is_indexed)
+                bar = view.verticalScrollBar()
+                bar.setValue(bar.maximum() // 2)
+                result["scroll_median_ms"], result["scroll_p95_ms"], _ = frames(
+                    view, lambda: bar.triggerAction(QAbstractSlider.SliderSingleStepAdd), steps)
+                search = []
+                result["search_ms"] = timed(lambda: search.append(view.find("needle_at_the_end")),
+                                            lambda: search[0].isFinished())
+            else:
+                editor = notepad.editor
+                result["mode"] = "editor"
+                result["open_ms"] = timed(lambda: notepad.load_file(path), lambda: notepad.loader is None)
+                buffer = notepad.buffer
+                result["highlight_ms"] = timed(buffer.highlighter.rehighlight)
+                
+                bar = editor.verticalScrollBar()
+                bar.setValue(bar.maximum() // 2)
+                result["scroll_median_ms"], result["scroll_p95_ms"], _ = frames(
+                    editor, lambda: bar.triggerAction(QAbstractSlider.SliderSingleStepAdd), steps)
+                
+                # Typing on screen rehighlights only the edited block
+                editor.setTextCursor(editor.cursorForPosition(QPoint(40, 200)))
+                result["keystroke_median_ms"], _, result["keystroke_max_ms"] = frames(
+                    editor, lambda: editor.insertPlainText("x"), steps)
+                
+                search = notepad.document_search
+                pattern = re.compile("needle_at_the_end")
+                result["search_ms"] = timed(lambda: search.set_pattern(buffer.document, pattern) or
+                                            search.search_until(buffer.document.characterCount()))
+                search.clear()
+                result["save_ms"] = timed(notepad.save_file, lambda: notepad.saver is None)
+            result["lines"] = notepad.large_view.indexer.line_count if result["mode"] == "large file" \
+                else notepad.buffer.document.blockCount()
+            
+            results[label] = result
+            print(f"{label:>6} ({result['mode']}): " +
+                  ", ".join(f"{name[:-3]} {value:,.1f} ms" for name, value in result.items() if name.endswith("_ms")))
+            notepad.new_file()
+            # Drop the file from the cache so each size starts cold
+            for buffer in list(notepad.document_cache.buffers.values()):
+                if buffer is not notepad.buffer:
+                    notepad.document_cache.remove(buffer.path).close()
+    notepad.close()
+    ISOLATED_DIRECTORY = None
+    isolated.cleanup()
+    
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "qt": QT_VERSION_STR,
+        "platform": sys.platform,
+        "results": results,
+    }
+    
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        # Limits written into the baseline by hand win over the tolerance
+        thresholds = {}
+        for label, metrics in baseline.get("results", {}).items():
+            for name, value in metrics.items():
+                if name.endswith("_ms"):
+                    thresholds[f"{label}/{name}"] = max(value * (1 + tolerance / 100), value + BENCH_NOISE_MS)
+        thresholds.update(baseline.get("thresholds", {}))
+        for key, limit in sorted(thresholds.items()):
+            label, name = key.split('/', 1)
+            value = results.get(label, {}).get(name)
+            if value is not None and value > limit:
+                regressions.append({"metric": key, "value_ms": value, "threshold_ms": limit})
+                print(f"regression: {key} {value:,.1f} ms over the {limit:,.1f} ms threshold")
+        report["baseline"] = baseline_path
+        report["thresholds"] = thresholds
+    report["regressions"] = regressions
+    
+    if output == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"results written to {output}")
+    return 1 if regressions else 0
+
+# Highlights or exports files without a window, spread over a process pool.
+# Directories are searched for Python files. Returns the exit status
+def run_batch(action, format_name, paths, output_directory=None, jobs=None):
+    import concurrent.futures
+    import multiprocessing
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories[:] = sorted(name for name in subdirectories if not name.startswith('.'))
+                sources.extend(os.path.join(directory, name) for name in sorted(names)
+                               if name.endswith(('.py', '.pyw')))
+        else:
+            sources.append(path)
+    if not sources:
+        print("No files to process", file=sys.stderr)
+        return 1
+    
+    extension = EXPORT_FORMATS[format_name][1]
+    if action == "highlight":
+        outputs = [None] * len(sources)
+    elif output_directory:
+        # Mirror the sources' layout under the output directory
+        absolute = [os.path.abspath(source) for source in sources]
+        root = os.path.commonpath([os.path.dirname(source) for source in absolute])
+        outputs = [os.path.join(output_directory, os.path.relpath(source, root)) + extension
+                   for source in absolute]
+    else:
+        outputs = [source + extension for source in sources]
+    
+    jobs = jobs or os.cpu_count() or 1
+    files = list(zip(sources, outputs))
+    # Small batches keep the pool busy to the end, large ones amortize the round trips
+    batch_size = max(1, min(FindInFilesSearch.BATCH_FILES, len(files) // (jobs * 4)))
+    batches = [files[offset:offset + batch_size] for offset in range(0, len(files), batch_size)]
+    
+    start = time.perf_counter()
+    failures = 0
+    total_lines = 0
+    total_bytes = 0
+    # Spawned like the editor's own pool, workers import this file without running main()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                mp_context=multiprocessing.get_context('spawn')) as executor:
+        for results in executor.map(batch_process_files, batches, itertools.repeat(action),
+                                    itertools.repeat(format_name), itertools.repeat(os.linesep)):
+            for source, output, lines, size, seconds, error in results:
+                if error:
+                    failures += 1
+                    print(f"{'failed':>10}  {source}: {error}", file=sys.stderr)
+                    continue
+                total_lines += lines
+                total_bytes += size
+                target = f" -> {output}" if output else ""
+                print(f"{seconds * 1000:8.1f} ms  {lines:>9,} lines  {source}{target}")
+    elapsed = time.perf_counter() - start
+    
+    megabytes = total_bytes / (1024 * 1024)
+    done = len(files) - failures
+    print(f"{done:,} files, {total_lines:,} lines, {megabytes:,.1f} MB in {elapsed:.2f} s with {jobs} processes: "
+          f"{done / elapsed:,.1f} files/s, {total_lines / elapsed:,.0f} lines/s, {megabytes / elapsed:,.1f} MB/s")
+    if failures:
+        print(f"{failures:,} files failed", file=sys.stderr)
+    return 1 if failures else 0
+
+# Local stand-in for the OpenAI chat completions and Telegram Bot APIs, speaking the same HTTP.
+# Used by --check-clients, and by --stand-in-server to try the AI and Telegram actions without
+# an account: point the API URL and Bot API URL settings at it
+class StandInServer:
+    # A chat completion with this model is refused, as a bad API key would be
+    ERROR_MODEL = "stand-in-error"
+    # Messages to this chat are refused, as Telegram does for a chat the bot is not in
+    UNKNOWN_CHAT = "unknown"
+    # Pause between streamed events, so they arrive in more than one read
+    EVENT_DELAY = 0.01
+    
+    def __init__(self, port=0):
+        import asyncio
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        # Replies handed out before the normal ones, [(status, reply)], e.g. a 429 or a 502
+        self.telegram_replies = deque()
+        # (monotonic time, chat_id, text) of every message accepted
+        self.messages = []
+        self.requests = 0
+        self.connections = 0
+        # Close each connection after its response without saying so, like a server dropping idle ones
+        self.drop_connections = False
+        self.thread = None
+    
+    def start(self):
+        # Returns the port listened on, once listening
+        import asyncio
+        ready = threading.Event()
+        
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, '127.0.0.1', self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+        
+        self.thread = threading.Thread(target=run, name="stand-in-server", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.port
+    
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+    
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+    
+    async def handle(self, reader, writer):
+        import asyncio
+        import json
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                target = request_line.decode('latin-1').split()[1]
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    request = {}
+                if target.endswith('/chat/completions'):
+                    await self.chat_completion(writer, request)
+                elif target.endswith('/sendMessage'):
+                    self.send_message(writer, request)
+                else:
+                    self.respond(writer, 404, {"ok": False, "description": "Not Found"})
+                await writer.drain()
+                if self.drop_connections:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    @staticmethod
+    def respond(writer, status, reply):
+        import json
+        body = json.dumps(reply).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} Stand-in\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    
+    async def chat_completion(self, writer, request):
+        import asyncio
+        import json
+        if request.get("model") == self.ERROR_MODEL:
+            self.respond(writer, 401, {"error": {"message": "Incorrect API key provided"}})
+            return
+        messages = request.get("messages") or [{}]
+        answer = f"Stand-in answer to {len(messages[-1].get('content', ''))} characters."
+        writer.write(b"HTTP/1.1 200 Stand-in\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        events = [{"choices": [{"delta": {"content": word}}]} for word in re.findall(r'\S+\s*', answer)]
+        for payload in [json.dumps(event) for event in events] + ["[DONE]"]:
+            data = f"data: {payload}\n\n".encode('utf-8')
+            writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(self.EVENT_DELAY)
+        writer.write(b"0\r\n\r\n")
+    
+    def send_message(self, writer, request):
+        if str(request.get("chat_id")) == self.UNKNOWN_CHAT:
+            self.respond(writer, 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"})
+        elif self.telegram_replies:
+            self.respond(writer, *self.telegram_replies.popleft())
+        else:
+            self.messages.append((time.monotonic(), request.get("chat_id"), request.get("text")))
+            self.respond(writer, 200, {"ok": True, "result": {"message_id": len(self.messages)}})
+
+# Runs the AI client and the Telegram queue against a StandInServer: streaming, connection
+# reuse, a dropped kept-alive connection, rate limiting and retries. Returns the exit status
+def check_clients(timeout=30):
+    import tempfile
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    server = StandInServer()
+    server.start()
+    failures = []
+    
+    def check(name, passed, detail=""):
+        print(f"{'ok' if passed else 'FAIL':<4}  {name}{f': {detail}' if detail else ''}")
+        if not passed:
+            failures.append(name)
+    
+    def wait_for(condition):
+        deadline = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < deadline:
+            app.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents, 50)
+        return condition()
+    
+    client = AiClient()
+    results = {}
+    client.tokens.connect(lambda request, text: results[request].append(text))
+    client.completed.connect(lambda request, text: results[request].append(("completed", text)))
+    client.failed.connect(lambda request, error: results[request].append(("failed", error)))
+    
+    def complete(model="stand-in"):
+        request = AiRequest("explain", None)
+        results[request] = []
+        client.complete(request, server.url() + "/v1", "key", model, 0.2,
+                        [{"role": "user", "content": "x" * 40}])
+        wait_for(lambda: results[request] and isinstance(results[request][-1], tuple))
+        return results[request]
+    
+    events = complete()
+    expected = "Stand-in answer to 40 characters."
+    check("AI answer streams in pieces", len(events) > 2 and events[-1] == ("completed", expected),
+          f"{len(events) - 1} pieces")
+    events = complete()
+    check("AI connection is reused", events[-1] == ("completed", expected) and client.pool.opened == 1,
+          f"{client.pool.opened} connection(s) opened")
+    server.drop_connections = True
+    complete()
+    server.drop_connections = False
+    events = complete()
+    check("AI request survives a dropped kept-alive connection",
+          events[-1] == ("completed", expected) and client.pool.opened == 2,
+          f"{client.pool.opened} connection(s) opened")
+    events = complete(StandInServer.ERROR_MODEL)
+    check("AI error reply is reported", events[-1][0] == "failed" and "401" in events[-1][1], str(events[-1]))
+    client.close()
+    
+    with tempfile.TemporaryDirectory(prefix="codepad-check-") as directory:
+        queue = TelegramQueue(directory, "token", server.url())
+        shared = []
+        errors = []
+        queue.shared.connect(shared.append)
+        queue.failed.connect(lambda title, error: errors.append(error))
+        # The first message is refused with a 429, and its retry with a 502
+        server.telegram_replies.extend([(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}),
+                                        (502, {"ok": False, "description": "Bad Gateway"})])
+        chunks = ["a" * 4000, "b" * 4000, "c" * 4000]
+        start = time.monotonic()
+        queue.share(1, "log", text="\n".join(chunks))
+        wait_for(lambda: shared or errors)
+        # Each part starts with its [i/n] header line and ends at a line break
+        texts = [text.split("\n", 1)[1].rstrip("\n") for _, _, text in server.messages]
+        check("Telegram share is split and sent once, in order", shared == ["log"] and texts == chunks,
+              f"{len(server.messages)} message(s)")
+        check("Telegram 429 retry_after is honoured", server.messages and server.messages[0][0] - start >= 1,
+              f"first message after {server.messages[0][0] - start:.1f} s" if server.messages else "")
+        gaps = [later[0] - earlier[0] for earlier, later in zip(server.messages, server.messages[1:])]
+        check("Telegram messages are paced after a 429", gaps and min(gaps) >= 0.9 / TelegramQueue.RATE,
+              ", ".join(f"{gap:.2f} s" for gap in gaps))
+        check("Telegram 5xx is retried", not server.telegram_replies and not errors)
+        queue.share(StandInServer.UNKNOWN_CHAT, "note", text="hello")
+        wait_for(lambda: errors)
+        check("Telegram unknown chat is reported", errors and "chat not found" in errors[0], str(errors[:1]))
+        check("Telegram queue is empty on disk", not TelegramQueue.pending_shares(directory))
+        queue.close()
+        
+        # Two instances resuming one queue: each message is sent by one of them only
+        server.messages.clear()
+        queue = TelegramQueue(directory, "", server.url())
+        queue.share(1, "left over", text="left over")
+        wait_for(lambda: TelegramQueue.pending_shares(directory))
+        queue.close()
+        queues = [TelegramQueue(directory, "token", server.url()) for _ in range(2)]
+        queues[1].share(1, "new", text="new")
+        wait_for(lambda: len(server.messages) >= 2 and not TelegramQueue.pending_shares(directory))
+        time.sleep(2 / TelegramQueue.RATE)
+        texts = sorted(text for _, _, text in server.messages)
+        check("Telegram queue shared by two instances sends once", texts == ["left over", "new"], str(texts))
+        for queue in queues:
+            queue.close()
+    
+    server.stop()
+    print(f"{len(failures)} of the checks failed" if failures else "all checks passed")
+    return 1 if failures else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Accurate Code Pad")
+    parser.add_argument("--bench-highlighter", type=int, nargs="?", const=20000, metavar="LINES",
+                        help="compare highlighter throughput on a generated Python file and exit")
+    parser.add_argument("--bench-search", type=int, nargs="?", const=256, metavar="MB",
+                        help="measure find in files throughput on a generated corpus and exit")
+    parser.add_argument("--bench-scroll", type=int, nargs="?", const=100000, metavar="LINES",
+                        help="measure scrolling frame times on a generated Python file and exit")
+    parser.add_argument("--bench-completion", type=int, nargs="?", const=1000000, metavar="IDENTIFIERS",
+                        help="measure autocomplete latency over generated identifiers and exit")
+    parser.add_argument("--bench-quick-open", type=int, nargs="?", const=200000, metavar="PATHS",
+                        help="measure quick open latency over generated workspace paths and exit")
+    parser.add_argument("--bench-suite", nargs="?", const="codepad-bench.json", metavar="FILE",
+                        help="time opening, highlighting, typing, scrolling, saving and search on generated files, "
+                             "write JSON results to FILE (default: codepad-bench.json, - for stdout) and exit")
+    parser.add_argument("--bench-sizes", default=BENCH_SUITE_SIZES, metavar="SIZES",
+                        help=f"file sizes for --bench-suite (default: {BENCH_SUITE_SIZES})")
+    parser.add_argument("--bench-baseline", metavar="FILE",
+                        help="results of an earlier --bench-suite run, slower metrics fail the run")
+    parser.add_argument("--bench-tolerance", type=float, default=25, metavar="PERCENT",
+                        help="slowdown over the baseline allowed before a metric fails (default: 25)")
+    parser.add_argument("--profile-startup", nargs="?", const="-", metavar="FILE",
+                        help="write import and construction timings up to the first paint as JSON "
+                             "(to FILE, or stdout) and exit")
+    parser.add_argument("--check-clients", action="store_true",
+                        help="run the AI client and Telegram queue against a local stand-in server and exit")
+    parser.add_argument("--stand-in-server", type=int, nargs="?", const=8765, metavar="PORT",
+                        help="serve stand-ins for the OpenAI and Telegram Bot APIs on PORT (default: 8765) "
+                             "until interrupted")
+    parser.add_argument("--batch", choices=("export", "highlight"),
+                        help="export or highlight the given files and directories without a window and exit")
+    parser.add_argument("--format", default="html", choices=[name.lower() for name in EXPORT_FORMATS],
+                        help="export format for --batch export (default: html)")
+    parser.add_argument("--output-dir", metavar="DIRECTORY",
+                        help="where --batch export writes, next to each source file by default")
+    parser.add_argument("--jobs", type=int, metavar="N", help="worker processes for --batch (default: CPU count)")
+    # Unknown arguments are left for Qt (-style, -platform, ...)
+    args, qt_args = parser.parse_known_args(argv[1:])
+    if args.batch:
+        # In batch mode there is no Qt, what is left are the paths
+        options = [arg for arg in qt_args if arg.startswith('-')]
+        if options:
+            parser.error(f"unrecognized arguments: {' '.join(options)}")
+        if not qt_args:
+            parser.error("--batch needs files or directories")
+        args.paths, qt_args = qt_args, []
+    return args, qt_args
+
 # Main function
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args(sys.argv)
+    
+    if args.bench_highlighter:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        benchmark_highlighter(args.bench_highlighter)
+        return
+    
+    if args.bench_search:
+        benchmark_search(args.bench_search)
+        return
+    
+    if args.bench_scroll:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        benchmark_scroll(args.bench_scroll)
+        return
+    
+    if args.bench_completion:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        benchmark_completion(args.bench_completion)
+        return
+    
+    if args.bench_quick_open:
+        benchmark_quick_open(args.bench_quick_open)
+        return
+    
+    if args.bench_suite:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        sys.exit(benchmark_suite(args.bench_sizes, args.bench_suite, args.bench_baseline, args.bench_tolerance))
+    
+    if args.check_clients:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        sys.exit(check_clients())
+    
+    if args.stand_in_server is not None:
+        server = StandInServer(args.stand_in_server)
+        server.start()
+        print(f"Stand-in server on {server.url()}: set the API URL to {server.url()}/v1 "
+              f"and the Bot API URL to {server.url()}, Ctrl+C to stop")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+    
+    if args.batch:
+        format_name = next(name for name in EXPORT_FORMATS if name.lower() == args.format)
+        sys.exit(run_batch(args.batch, format_name, args.paths, args.output_dir, args.jobs))
+    
+    mark_startup("arguments")
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Set application style
     app.setStyle('Fusion')
+    mark_startup("QApplication")
     
     # Create and show the main window
     notepad = CodeNotepad()
+    if args.profile_startup:
+        StartupProfiler(notepad, args.profile_startup)
     notepad.show()
+    mark_startup("show")
     
     # Run the application
     sys.exit(app.exec_())